@@ -0,0 +1,440 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jeanalysis module provides methods to measure similarity between source
+# image and JPEG encoded image (PSNR, SSIM), and to analyse errors (statistics,
+# histograms, heatmap, per block error map)
+#
+# Calculation are vectorized with numpy; numpy is not always available with
+# Krita, in this case analysis functionalities are not available
+# (see JEAnalysis.available())
+#
+# Images are processed by horizontal strips to limit memory used for large
+# images
+#
+# Quality search is made with in memory (Qt) encoder, that doesn't apply
+# smoothing: when smoothing is used, exported file is blurred and metric for
+# exported file can be lower than searched threshold
+# -----------------------------------------------------------------------------
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from PyQt5.Qt import *
+from PyQt5.QtGui import QImage
+
+from .jeencoder import JEEncoder
+
+from ..pktk import *
+
+
+class JEAnalysis(object):
+    """Measure similarity between images"""
+
+    METRIC_PSNR = 'psnr'
+    METRIC_SSIM = 'ssim'
+
+    # height of strips processed at once
+    STRIP_HEIGHT = 512
+
+    # SSIM is calculated on overlapping windows: with a stride of half window size,
+    # windows straddle JPEG blocks boundaries and blocking artefacts are measured
+    SSIM_WINDOW_SIZE = 8
+    SSIM_STRIDE = 4
+    __SSIM_C1 = (0.01 * 255) ** 2
+    __SSIM_C2 = (0.03 * 255) ** 2
+
+    # heatmap: error value for which heatmap color is saturated
+    HEATMAP_SATURATION = 32
+    # heatmap: gradient colors (position, (r, g, b)), from no error to saturated error
+    HEATMAP_GRADIENT = [(0.00, (0, 0, 0)),
+                        (0.25, (0, 0, 255)),
+                        (0.50, (0, 255, 0)),
+                        (0.75, (255, 255, 0)),
+                        (1.00, (255, 0, 0))]
+    # block map: block RMS error value for which block map color is saturated
+    BLOCKMAP_SATURATION = 16
+    # block map: block RMS error value under which block is transparent (not rendered)
+    BLOCKMAP_THRESHOLD = 4
+    __heatmapLut = {}
+
+    @staticmethod
+    def available():
+        """Return True if analysis is available (numpy installed)"""
+        return np is not None
+
+    @staticmethod
+    def __checkAvailable():
+        if np is None:
+            raise EInvalidStatus("Analysis is not available: numpy module can't be loaded")
+
+    @staticmethod
+    def toArray(image):
+        """Return given `image` pixels as a numpy array (height, width, 4) of uint8, in BGRA order
+
+        Returned array is a view on image pixels: image must be kept in memory while array is used
+        Image must be in QImage.Format_RGB32 or QImage.Format_ARGB32
+        """
+        JEAnalysis.__checkAvailable()
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif image.format() not in (QImage.Format_RGB32, QImage.Format_ARGB32):
+            raise EInvalidValue("Given `image` must be a RGB32 or ARGB32 <QImage>")
+
+        ptr = image.constBits()
+        ptr.setsize(image.sizeInBytes())
+        return np.frombuffer(ptr, dtype=np.uint8).reshape(image.height(), image.bytesPerLine() // 4, 4)[:, :image.width(), :]
+
+    @staticmethod
+    def luma(pixels):
+        """Return luma (float32 array) for given BGRA `pixels` array"""
+        pixels = pixels.astype(np.float32)
+        return 0.114 * pixels[..., 0] + 0.587 * pixels[..., 1] + 0.299 * pixels[..., 2]
+
+    @staticmethod
+    def strips(image1, image2, stripHeight=None):
+        """Generator that return tuples (y, pixels1, pixels2) for each horizontal strip of
+        given images
+
+        Images must have the same size, and are returned as BGRA arrays
+        If `stripHeight` is None, use STRIP_HEIGHT
+        """
+        if image1.size() != image2.size():
+            raise EInvalidValue("Given images must have the same size")
+
+        if stripHeight is None:
+            stripHeight = JEAnalysis.STRIP_HEIGHT
+
+        pixels1 = JEAnalysis.toArray(image1)
+        pixels2 = JEAnalysis.toArray(image2)
+        for y in range(0, image1.height(), stripHeight):
+            yield (y, pixels1[y:y + stripHeight], pixels2[y:y + stripHeight])
+
+    @staticmethod
+    def psnr(image1, image2):
+        """Return PSNR (in dB) between given images, calculated on RGB channels
+
+        If images are identical, return math.inf
+        """
+        JEAnalysis.__checkAvailable()
+
+        sumSquaredErrors = 0.0
+        for y, pixels1, pixels2 in JEAnalysis.strips(image1, image2):
+            diff = pixels1[..., :3].astype(np.float32) - pixels2[..., :3].astype(np.float32)
+            sumSquaredErrors += float(np.sum(diff * diff, dtype=np.float64))
+
+        mse = sumSquaredErrors / (image1.width() * image1.height() * 3)
+        if mse == 0:
+            return math.inf
+        return 10 * math.log10(255 * 255 / mse)
+
+    @staticmethod
+    def ssim(image1, image2):
+        """Return mean SSIM between given images, calculated on luma
+
+        SSIM is calculated on SSIM_WINDOW_SIZE windows, moved by SSIM_STRIDE pixels
+        (pixels outside complete windows on right and bottom borders are ignored)
+
+        Windows statistics are calculated from sums over SSIM_STRIDE cells: a window
+        is made of 2x2 cells, and cells from last row of a strip are kept to build
+        windows that overlap next strip
+        """
+        JEAnalysis.__checkAvailable()
+
+        cellSize = JEAnalysis.SSIM_STRIDE
+        nbPixels = JEAnalysis.SSIM_WINDOW_SIZE * JEAnalysis.SSIM_WINDOW_SIZE
+        width = (image1.width() // cellSize) * cellSize
+        if image1.width() < JEAnalysis.SSIM_WINDOW_SIZE or image1.height() < JEAnalysis.SSIM_WINDOW_SIZE:
+            # image too small, no window
+            return 1.0 if image1 == image2 else 0.0
+
+        sumSsim = 0.0
+        nbWindows = 0
+        previousCells = None
+        # strip height must be a multiple of cell size
+        for y, pixels1, pixels2 in JEAnalysis.strips(image1, image2, (JEAnalysis.STRIP_HEIGHT // cellSize) * cellSize):
+            height = (pixels1.shape[0] // cellSize) * cellSize
+            if height == 0:
+                continue
+
+            luma1 = JEAnalysis.luma(pixels1[:height, :width]).astype(np.float64)
+            luma2 = JEAnalysis.luma(pixels2[:height, :width]).astype(np.float64)
+
+            # sums of x, y, x², y², xy for each cell
+            cells = np.stack((luma1, luma2, luma1 * luma1, luma2 * luma2, luma1 * luma2))
+            cells = cells.reshape(5, height // cellSize, cellSize, width // cellSize, cellSize).sum(axis=(2, 4))
+            if previousCells is not None:
+                cells = np.concatenate((previousCells, cells), axis=1)
+            previousCells = cells[:, -1:]
+
+            windows = (cells[:, :-1, :-1] + cells[:, 1:, :-1] + cells[:, :-1, 1:] + cells[:, 1:, 1:]) / nbPixels
+            mean1 = windows[0]
+            mean2 = windows[1]
+            var1 = windows[2] - mean1 * mean1
+            var2 = windows[3] - mean2 * mean2
+            covar = windows[4] - mean1 * mean2
+
+            ssim = ((2 * mean1 * mean2 + JEAnalysis.__SSIM_C1) * (2 * covar + JEAnalysis.__SSIM_C2) /
+                    ((mean1 * mean1 + mean2 * mean2 + JEAnalysis.__SSIM_C1) * (var1 + var2 + JEAnalysis.__SSIM_C2)))
+
+            sumSsim += float(np.sum(ssim, dtype=np.float64))
+            nbWindows += ssim.size
+
+        return sumSsim / nbWindows
+
+    @staticmethod
+    def heatmapLut(saturation=None):
+        """Return a numpy array (256, 4) of uint8 that provides, for an error value, the
+        heatmap BGRA color
+
+        If `saturation` is None, use HEATMAP_SATURATION
+        """
+        JEAnalysis.__checkAvailable()
+        if saturation is None:
+            saturation = JEAnalysis.HEATMAP_SATURATION
+
+        if saturation not in JEAnalysis.__heatmapLut:
+            positions = np.clip(np.arange(256, dtype=np.float32) / saturation, 0, 1)
+            gradientPositions = [position for position, color in JEAnalysis.HEATMAP_GRADIENT]
+
+            lut = np.full((256, 4), 255, dtype=np.uint8)
+            # r, g, b values are stored in b, g, r order
+            for channel, bgraIndex in ((0, 2), (1, 1), (2, 0)):
+                lut[:, bgraIndex] = np.round(np.interp(positions, gradientPositions, [color[channel] for position, color in JEAnalysis.HEATMAP_GRADIENT]))
+            JEAnalysis.__heatmapLut[saturation] = lut
+
+        return JEAnalysis.__heatmapLut[saturation]
+
+    @staticmethod
+    def errorAnalysis(source, image, heatmap=True, blockSize=8):
+        """Analyse error between given `source` and JPEG decoded `image`
+
+        Given `blockSize` define size of blocks used for block map; must be aligned on
+        JPEG MCU (8 for 4:4:4 chroma subsampling, 16 otherwise)
+
+        Return a dictionary:
+            'maxError':     maximum absolute error, all channels
+            'meanError':    mean absolute error, all channels
+            'psnr':         PSNR, in dB (math.inf if images are identical)
+            'histograms':   absolute error histograms, as a dictionary {'r': [], 'g': [], 'b': []}
+                            each list provides number of pixels for error values 0 to 255
+            'heatmap':      a QImage (ARGB32) for which pixels color represent maximum absolute
+                            error of pixels (see HEATMAP_GRADIENT); None if `heatmap` is False
+            'blockSize':    size of blocks, in pixels
+            'blockmap':     a QImage (ARGB32) for which each pixel color represent RMS error of
+                            a block (see BLOCKMAP_SATURATION); image size is source size divided
+                            by `blockSize`; blocks with an error lower than BLOCKMAP_THRESHOLD
+                            are transparent
+            'worstBlock':   a QRect that define position of block with highest RMS error
+        """
+        JEAnalysis.__checkAvailable()
+        if not isinstance(blockSize, int) or blockSize <= 0 or JEAnalysis.STRIP_HEIGHT % blockSize != 0:
+            raise EInvalidValue("Given `blockSize` must be a divisor of STRIP_HEIGHT")
+
+        nbPixels = source.width() * source.height()
+        histograms = np.zeros((3, 256), dtype=np.int64)
+        sumErrors = 0
+        sumSquaredErrors = 0.0
+
+        nbBlocksX = math.ceil(source.width() / blockSize)
+        nbBlocksY = math.ceil(source.height() / blockSize)
+        blockErrors = np.zeros((nbBlocksY, nbBlocksX), dtype=np.float32)
+        # number of values per block column (last column can be incomplete)
+        blockColumns = np.minimum(blockSize, source.width() - np.arange(nbBlocksX) * blockSize)
+
+        heatmapImage = None
+        if heatmap:
+            lut = JEAnalysis.heatmapLut()
+            heatmapImage = QImage(source.width(), source.height(), QImage.Format_ARGB32)
+            ptr = heatmapImage.bits()
+            ptr.setsize(heatmapImage.sizeInBytes())
+            heatmapPixels = np.frombuffer(ptr, dtype=np.uint8).reshape(heatmapImage.height(), heatmapImage.bytesPerLine() // 4, 4)
+
+        for y, pixels1, pixels2 in JEAnalysis.strips(source, image):
+            errors = np.abs(pixels1[..., :3].astype(np.int16) - pixels2[..., :3].astype(np.int16)).astype(np.uint8)
+
+            # channels are in b, g, r order
+            for channel, bgrIndex in ((0, 2), (1, 1), (2, 0)):
+                histograms[channel] += np.bincount(errors[..., bgrIndex].ravel(), minlength=256)
+
+            sumErrors += int(np.sum(errors, dtype=np.int64))
+            errors32 = errors.astype(np.float32)
+            sumSquaredErrors += float(np.sum(errors32 * errors32, dtype=np.float64))
+
+            if heatmap:
+                heatmapPixels[y:y + errors.shape[0], :source.width()] = lut[errors.max(axis=2)]
+
+            # sum of squared errors per block; strip is padded to be aligned on blocks
+            stripBlocksY = math.ceil(errors.shape[0] / blockSize)
+            padded = np.zeros((stripBlocksY * blockSize, nbBlocksX * blockSize), dtype=np.float32)
+            padded[:errors.shape[0], :source.width()] = np.sum(errors32 * errors32, axis=2)
+            blockSums = padded.reshape(stripBlocksY, blockSize, nbBlocksX, blockSize).sum(axis=(1, 3))
+
+            blockRows = np.minimum(blockSize, errors.shape[0] - np.arange(stripBlocksY) * blockSize)
+            blockErrors[y // blockSize:y // blockSize + stripBlocksY] = np.sqrt(blockSums / (3 * np.outer(blockRows, blockColumns)))
+
+        # maximum error is the highest error value for which there's a pixel in histograms
+        nonZero = np.nonzero(histograms.sum(axis=0))[0]
+        maxError = int(nonZero[-1]) if len(nonZero) else 0
+
+        mse = sumSquaredErrors / (nbPixels * 3)
+        if mse == 0:
+            psnr = math.inf
+        else:
+            psnr = 10 * math.log10(255 * 255 / mse)
+
+        blockmapImage = QImage(nbBlocksX, nbBlocksY, QImage.Format_ARGB32)
+        ptr = blockmapImage.bits()
+        ptr.setsize(blockmapImage.sizeInBytes())
+        blockmapPixels = np.frombuffer(ptr, dtype=np.uint8).reshape(nbBlocksY, blockmapImage.bytesPerLine() // 4, 4)
+        blockmapPixels[:, :nbBlocksX] = JEAnalysis.heatmapLut(JEAnalysis.BLOCKMAP_SATURATION)[np.clip(np.round(blockErrors), 0, 255).astype(np.uint8)]
+        blockmapPixels[:, :nbBlocksX, 3] = np.where(blockErrors < JEAnalysis.BLOCKMAP_THRESHOLD, 0, 255)
+
+        worstY, worstX = np.unravel_index(np.argmax(blockErrors), blockErrors.shape)
+        worstBlock = QRect(int(worstX) * blockSize, int(worstY) * blockSize, blockSize, blockSize).intersected(QRect(0, 0, source.width(), source.height()))
+
+        return {'maxError': maxError,
+                'meanError': sumErrors / (nbPixels * 3),
+                'psnr': psnr,
+                'histograms': {'r': histograms[0].tolist(),
+                               'g': histograms[1].tolist(),
+                               'b': histograms[2].tolist()
+                               },
+                'heatmap': heatmapImage,
+                'blockSize': blockSize,
+                'blockmap': blockmapImage,
+                'worstBlock': worstBlock
+                }
+
+    @staticmethod
+    def blockmapRows(blockmap, blockSize, width, height):
+        """Generator that return tuples (rect, image) to render given `blockmap` (as returned
+        by errorAnalysis()) at pixels resolution
+
+        Only rows of blocks with non transparent blocks are returned; for each row, `image`
+        (ARGB32) covers blocks from first to last non transparent block, and `rect` is the
+        position of image, clipped to given `width` and `height`
+        """
+        JEAnalysis.__checkAvailable()
+
+        pixels = JEAnalysis.toArray(blockmap)
+        bounds = QRect(0, 0, width, height)
+        for blockY in range(pixels.shape[0]):
+            visible = np.nonzero(pixels[blockY, :, 3])[0]
+            if len(visible) == 0:
+                continue
+
+            first = int(visible[0])
+            last = int(visible[-1])
+            rect = QRect(first * blockSize, blockY * blockSize, (last - first + 1) * blockSize, blockSize).intersected(bounds)
+            if rect.isEmpty():
+                continue
+
+            image = QImage(rect.width(), rect.height(), QImage.Format_ARGB32)
+            ptr = image.bits()
+            ptr.setsize(image.sizeInBytes())
+            imagePixels = np.frombuffer(ptr, dtype=np.uint8).reshape(rect.height(), image.bytesPerLine() // 4, 4)
+            imagePixels[:, :rect.width()] = np.repeat(pixels[blockY, first:last + 1], blockSize, axis=0)[:rect.width()]
+            yield (rect, image)
+
+    @staticmethod
+    def measure(metric, image1, image2):
+        """Return value for given `metric` between given images"""
+        if metric == JEAnalysis.METRIC_PSNR:
+            return JEAnalysis.psnr(image1, image2)
+        elif metric == JEAnalysis.METRIC_SSIM:
+            return JEAnalysis.ssim(image1, image2)
+        else:
+            raise EInvalidValue("Given `metric` is not valid")
+
+    @staticmethod
+    def measureQuality(metric, image, options):
+        """Encode given `image` with given JPEG `options` and return a tuple (metric value, encoded size)
+
+        Return None if image can't be encoded
+        """
+        source = JEEncoder.flatten(image, options.get('transparencyFillcolor', None)).convertToFormat(QImage.Format_RGB32)
+
+        data = JEEncoder.encode(source, options)
+        if data is None:
+            return None
+
+        decoded = JEEncoder.decode(data)
+        if decoded is None:
+            return None
+
+        return (JEAnalysis.measure(metric, source, decoded), data.size())
+
+    @staticmethod
+    def searchQuality(image, options, metric, threshold, minQuality=1, maxQuality=100):
+        """Search lowest JPEG quality for which `metric` between given `image` and encoded
+        image is greater or equal than given `threshold`
+
+        Binary search is made, expecting metric to increase with quality
+
+        Return a dictionary:
+            'quality':  found quality, or None if even `maxQuality` doesn't meet threshold
+            'value':    metric value for found quality (None if no quality found)
+            'size':     encoded size for found quality (None if no quality found)
+            'encodes':  number of encodes made
+        Return None if image can't be encoded
+        """
+        JEAnalysis.__checkAvailable()
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+
+        returned = {'quality': None,
+                    'value': None,
+                    'size': None,
+                    'encodes': 0
+                    }
+
+        # flatten once, not for each encode
+        source = JEEncoder.flatten(image, options.get('transparencyFillcolor', None)).convertToFormat(QImage.Format_RGB32)
+
+        low = minQuality
+        high = maxQuality
+        encodeOptions = dict(options)
+        while low <= high:
+            quality = (low + high) // 2
+            encodeOptions['quality'] = quality
+            result = JEAnalysis.measureQuality(metric, source, encodeOptions)
+            returned['encodes'] += 1
+            if result is None:
+                return None
+
+            value, size = result
+            if value >= threshold:
+                returned['quality'] = quality
+                returned['value'] = value
+                returned['size'] = size
+                high = quality - 1
+            else:
+                low = quality + 1
+
+        return returned
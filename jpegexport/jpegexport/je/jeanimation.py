@@ -0,0 +1,226 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jeanimation module provides classes used to export a frame range of an
+# animated document as a numbered JPEG sequence
+#
+# Main class from this module
+#
+# - JEAnimationExporter:
+#       Fetch frames one by one from document (GUI thread, Krita's API) and
+#       queue them to be resized/encoded in a thread pool: encoding of a frame
+#       is made while next frames are fetched
+#
+# - JEAnimationJob:
+#       A single frame resize/quality search/encode job, executed in a thread
+#       from pool
+#
+# Queue is bounded: when `maxWorkers` frames are waiting to be encoded, fetch
+# of next frame waits, then no more than `maxWorkers` frame images are in
+# memory at the same time
+#
+# Frames are written with JEEncoder.encodeFile(), see JEEncoder.encode() for
+# supported options
+# -----------------------------------------------------------------------------
+
+import os.path
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        pyqtSignal as Signal,
+        QRunnable,
+        QThreadPool
+    )
+
+from .jebatch import JEBatch
+from .jeexporter import JEExporter
+
+from jpegexport.pktk.modules.ekrita import EKritaDocument
+from jpegexport.pktk.modules.timeutils import Timer
+from ..pktk import *
+
+
+class JEAnimationJobSignals(QObject):
+    finished = Signal(int, object, int)         # frame, file size (None if not exported), quality
+
+
+class JEAnimationJob(QRunnable):
+    """Resize and encode a frame, in a thread from pool
+
+    Not aimed to be instancied directly, just use JEAnimationExporter
+    """
+
+    def __init__(self, frame, image, fileName, imageOptions):
+        super(JEAnimationJob, self).__init__()
+        self.__frame = frame
+        self.__image = image
+        self.__fileName = fileName
+        self.__imageOptions = imageOptions
+        self.signals = JEAnimationJobSignals()
+
+    @pyqtSlot()
+    def run(self):
+        """Export frame"""
+        image = self.__image
+        self.__image = None
+        size, quality = JEBatch.exportImage(image, self.__fileName, self.__imageOptions)
+        self.signals.finished.emit(self.__frame, size, quality)
+
+
+class JEAnimationExporter(object):
+    """Export a frame range of a Krita document as a numbered JPEG sequence"""
+
+    # minimum number of digits used to number files
+    FRAME_DIGITS = 4
+
+    @staticmethod
+    def isAnimated(document):
+        """Return True if given `document` has at least one animated layer"""
+        return any(layer.animated() for layer in EKritaDocument.getLayers(document, True))
+
+    @staticmethod
+    def frameRange(document):
+        """Return a tuple (first frame, last frame) of `document` animation clip range"""
+        return (document.fullClipRangeStartTime(), document.fullClipRangeEndTime())
+
+    @staticmethod
+    def fileName(fileName, frame, lastFrame):
+        """Return file name for given `frame`, built from exported `fileName` with frame
+        number as suffix
+
+        Frame number is padded with zeros, according to `lastFrame` number of digits
+        (at least FRAME_DIGITS)
+        """
+        baseName, ext = os.path.splitext(fileName)
+        digits = max(JEAnimationExporter.FRAME_DIGITS, len(str(lastFrame)))
+        return f'{baseName}_{frame:0{digits}d}{ext}'
+
+    @staticmethod
+    def export(document, setupData, firstFrame, lastFrame, maxWorkers=None, callback=None):
+        """Export frames from `firstFrame` to `lastFrame` (included) of given Krita
+        `document` as JPEG files, according to given `setupData`
+
+        Given `setupData` is a dictionary, as stored by setup manager (see JEExporter.setupsFromFile())
+        Crop, resize, JPEG options and target (file size, image quality) options are
+        applied to each frame; file names are built from path options of setup, with
+        frame number as suffix
+        Given `maxWorkers` is maximum number of frames waiting to be encoded; if None, all
+        available threads are used
+
+        If provided, `callback` is a callable callback(index, status, result) called when
+        status of frame `index` (from 0 for `firstFrame`) change (see JEBatch.STATUS_*
+        values); `result` is provided for JEBatch.STATUS_DONE
+        If callback return True, export is cancelled
+
+        Document current time is restored once export is finished
+
+        Return a list of results, one per frame (None for frames that can't be exported or
+        if export has been cancelled); a result is a dictionary:
+            'fileName':     exported file name
+            'frame':        frame number
+            'size':         exported file size, in bytes
+            'width':        exported image width
+            'height':       exported image height
+            'quality':      JPEG quality
+        """
+        def notify(index, status, result=None):
+            if callback is None:
+                return False
+            return callback(index, status, result) is True
+
+        def jobFinished(frame, size, quality):
+            index = frame - firstFrame
+            finished.add(index)
+            if size is None:
+                if notify(index, JEBatch.STATUS_ERROR):
+                    cancelled.append(True)
+                return
+
+            returned[index] = {'fileName': fileNames[index],
+                               'frame': frame,
+                               'size': size,
+                               'width': imageOptions['targetSize'].width(),
+                               'height': imageOptions['targetSize'].height(),
+                               'quality': quality
+                               }
+            if notify(index, JEBatch.STATUS_DONE, returned[index]):
+                cancelled.append(True)
+
+        if not isinstance(setupData, dict):
+            raise EInvalidType("Given `setupData` must be a <dict>")
+        elif not isinstance(firstFrame, int) or not isinstance(lastFrame, int) or firstFrame > lastFrame:
+            raise EInvalidValue("Given `firstFrame` and `lastFrame` must be <int>, with `firstFrame` <= `lastFrame`")
+
+        if maxWorkers is None:
+            maxWorkers = JEBatch.maxWorkers()
+        maxWorkers = max(1, min(maxWorkers, JEBatch.maxWorkers()))
+
+        bounds = JEExporter.bounds(document, setupData)
+        imageOptions = JEBatch.imageOptions(setupData, bounds)
+        fileName = JEExporter.targetFileName(document, setupData)
+        fileNames = [JEAnimationExporter.fileName(fileName, frame, lastFrame) for frame in range(firstFrame, lastFrame + 1)]
+
+        returned = [None] * len(fileNames)
+        finished = set()
+        cancelled = []
+        submitted = 0
+
+        threadpool = QThreadPool()
+        threadpool.setMaxThreadCount(maxWorkers)
+
+        currentTime = document.currentTime()
+
+        for index, frame in enumerate(range(firstFrame, lastFrame + 1)):
+            # bounded queue: wait until a frame has been encoded
+            # (results are received from signals, an event loop is needed)
+            while submitted - len(finished) >= maxWorkers and not cancelled:
+                Timer.sleep(1)
+
+            if cancelled or notify(index, JEBatch.STATUS_EXPORT):
+                cancelled.append(True)
+                break
+
+            document.setCurrentTime(frame)
+            document.refreshProjection()
+            document.waitForDone()
+
+            job = JEAnimationJob(frame,
+                                 document.projection(bounds.x(), bounds.y(), bounds.width(), bounds.height()),
+                                 fileNames[index],
+                                 imageOptions)
+            job.signals.finished.connect(jobFinished)
+            threadpool.start(job)
+            submitted += 1
+
+        if cancelled:
+            # drop frames not yet started
+            threadpool.clear()
+            threadpool.waitForDone()
+            QApplication.processEvents()
+        else:
+            while len(finished) < submitted:
+                Timer.sleep(1)
+
+        document.setCurrentTime(currentTime)
+        document.refreshProjection()
+
+        return returned
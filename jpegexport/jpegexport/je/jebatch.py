@@ -0,0 +1,293 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jebatch module provides class used to export a list of documents with the
+# same setup
+#
+# Krita's API can only be used from GUI thread: documents are read and exported
+# (by Krita's JPEG exporter) one after the other; what is made outside GUI
+# thread, in parallel for a bounded number of documents, is the in memory
+# search of JPEG quality (target file size, target image quality) that is the
+# longest step of export
+#
+# Documents are processed by groups of `maxWorkers` documents, then no more
+# than `maxWorkers` document images are in memory at the same time
+# -----------------------------------------------------------------------------
+
+import os.path
+
+from PyQt5.Qt import *
+
+from .jeencoder import JEEncoder
+from .jeanalysis import JEAnalysis
+from .jeresize import JEResize
+from .jeexporter import JEExporter
+from .jesettings import JESettingsKey
+
+from jpegexport.pktk.modules.workers import WorkerPool
+from ..pktk import *
+
+
+class JEBatch(object):
+    """Export a list of Krita documents as JPEG, with the same setup"""
+
+    STATUS_SEARCH = 'search'    # in memory search of quality is started for document
+    STATUS_EXPORT = 'export'    # export of document is started
+    STATUS_DONE = 'done'        # document has been exported
+    STATUS_ERROR = 'error'      # document can't be exported
+
+    @staticmethod
+    def maxWorkers():
+        """Return maximum number of documents for which quality can be searched in parallel"""
+        return max(1, QThread.idealThreadCount())
+
+    @staticmethod
+    def searchTargetSize(image, options, targetSize):
+        """Return highest JPEG quality for which given `image` encoded with `options` has
+        a size less or equal than `targetSize` (in bytes)
+
+        Unlike JEEncoder.searchQuality(), search is a simple binary search made in
+        current thread (documents are already processed in parallel)
+
+        Return None if even lowest quality doesn't fit
+        """
+        image = JEEncoder.flatten(image, options.get('transparencyFillcolor', None))
+        encodeOptions = dict(options)
+
+        returned = None
+        low = 1
+        high = 100
+        while low <= high:
+            quality = (low + high) // 2
+            encodeOptions['quality'] = quality
+            data = JEEncoder.encode(image, encodeOptions)
+            if data is None:
+                return None
+
+            if data.size() <= targetSize:
+                returned = quality
+                low = quality + 1
+            else:
+                high = quality - 1
+
+        return returned
+
+    @staticmethod
+    def imageOptions(setupData, bounds):
+        """Return options used by exportImage(), from given `setupData`, for an image
+        read from given `bounds` (QRect) of document
+
+        Return a dictionary:
+            'targetSize':       exported size (QSize)
+            'filterName':       Krita filter used to resize image
+            'options':          JPEG options (see JEExporter.jpegOptions())
+            'targetFileSize':   target file size, in bytes (None if not active)
+            'metric':           tuple (metric name, value) for target image quality (None if not active)
+        """
+        returned = {'targetSize': JEExporter.targetSize(bounds.size(), setupData),
+                    'filterName': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_FILTER),
+                    'options': JEExporter.jpegOptions(setupData),
+                    'targetFileSize': None,
+                    'metric': None
+                    }
+
+        if JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE):
+            returned['targetFileSize'] = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_SIZE_VALUE) * 1024
+        elif JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE) and JEAnalysis.available():
+            returned['metric'] = (JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_NAME),
+                                  JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_VALUE))
+
+        return returned
+
+    @staticmethod
+    def exportImage(image, fileName, imageOptions):
+        """Resize given `image`, search quality and encode it to JPEG `fileName`, according
+        to given `imageOptions` (see imageOptions())
+
+        Image is encoded by Qt JPEG writer; can be used outside GUI thread
+
+        Return a tuple (file size, quality); file size is None if file can't be exported
+        """
+        options = dict(imageOptions['options'])
+
+        # when executed in a worker, an exception would stop it without notifying pool
+        try:
+            if image.size() != imageOptions['targetSize']:
+                image = JEResize.resizeImage(image, imageOptions['targetSize'], imageOptions['filterName'])
+
+            if imageOptions['targetFileSize'] is not None:
+                quality = JEBatch.searchTargetSize(image, options, imageOptions['targetFileSize'])
+                if quality is not None:
+                    options['quality'] = quality
+            elif imageOptions['metric'] is not None:
+                search = JEAnalysis.searchQuality(image, options, *imageOptions['metric'])
+                if search is not None and search['quality'] is not None:
+                    options['quality'] = search['quality']
+
+            return (JEEncoder.encodeFile(image, options, fileName), options['quality'])
+        except Exception as e:
+            print(f"Unable to export file to {fileName}", e)
+            return (None, options['quality'])
+
+    @staticmethod
+    def searchNeeded(setupData):
+        """Return True if, for given `setupData`, a quality search is made before export"""
+        return (JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE) or
+                (JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE) and JEAnalysis.available()))
+
+    @staticmethod
+    def __searchItem(document, setupData):
+        """Return item processed by __searchQuality() for given `document`
+
+        Document content is read here, from GUI thread
+        """
+        bounds = JEExporter.bounds(document, setupData)
+        returned = JEBatch.imageOptions(setupData, bounds)
+        returned['image'] = document.projection(bounds.x(), bounds.y(), bounds.width(), bounds.height())
+        return returned
+
+    @staticmethod
+    def __searchQuality(index, item):
+        """Search quality for given `item`; executed outside GUI thread
+
+        Return found quality, or None (quality is then searched again during export)
+        """
+        image = item['image']
+        item['image'] = None
+        if image is None or image.isNull():
+            return None
+
+        # an exception raised in a worker would stop it without notifying pool
+        try:
+            if image.size() != item['targetSize']:
+                image = JEResize.resizeImage(image, item['targetSize'], item['filterName'])
+
+            if item['targetFileSize'] is not None:
+                return JEBatch.searchTargetSize(image, item['options'], item['targetFileSize'])
+
+            search = JEAnalysis.searchQuality(image, item['options'], *item['metric'])
+        except Exception as e:
+            print("Unable to search quality", e)
+            return None
+
+        if search is None:
+            return None
+        return search['quality']
+
+    @staticmethod
+    def __uniqueFileName(fileName, usedFileNames):
+        """Return given `fileName`, with a number suffix if already in `usedFileNames`"""
+        returned = fileName
+        baseName, ext = os.path.splitext(fileName)
+        number = 1
+        while returned in usedFileNames:
+            number += 1
+            returned = f'{baseName}-{number}{ext}'
+
+        usedFileNames.add(returned)
+        return returned
+
+    @staticmethod
+    def exportDocuments(documents, setupData, maxWorkers=None, callback=None):
+        """Export given Krita `documents` (list) as JPEG files, according to given `setupData`
+
+        Given `setupData` is a dictionary, as stored by setup manager (see JEExporter.setupsFromFile())
+        Given `maxWorkers` is maximum number of documents for which quality is searched in
+        parallel; if None, maxWorkers() is used
+
+        If provided, `callback` is a callable callback(index, status, result) called when
+        status of document `index` change (see STATUS_* values); `result` is provided for
+        STATUS_DONE, as returned by JEExporter.exportDocument()
+        If callback return True, batch is cancelled
+
+        Exported file names are built from path options of setup; if two documents have
+        the same exported file name, a number is added to file name
+
+        Return a list of results, one per document, as returned by JEExporter.exportDocument()
+        (None for documents that can't be exported or if batch has been cancelled)
+        """
+        def notify(index, status, result=None):
+            if callback is None:
+                return False
+            return callback(index, status, result) is True
+
+        if not isinstance(documents, (list, tuple)):
+            raise EInvalidType("Given `documents` must be a <list>")
+        elif not isinstance(setupData, dict):
+            raise EInvalidType("Given `setupData` must be a <dict>")
+
+        if maxWorkers is None:
+            maxWorkers = JEBatch.maxWorkers()
+        maxWorkers = max(1, min(maxWorkers, JEBatch.maxWorkers()))
+
+        searchNeeded = JEBatch.searchNeeded(setupData)
+        pool = WorkerPool(maxWorkers)
+        usedFileNames = set()
+        returned = [None] * len(documents)
+
+        for first in range(0, len(documents), maxWorkers):
+            indexes = range(first, min(len(documents), first + maxWorkers))
+            fileNames = {index: JEBatch.__uniqueFileName(JEExporter.targetFileName(documents[index], setupData), usedFileNames) for index in indexes}
+            qualities = {}
+
+            # documents unchanged since last export (see JEManifest) don't need quality search neither export
+            # (for other documents, manifest check is kept for export: source pixels are read once)
+            exportIndexes = []
+            manifestChecks = {}
+            for index in indexes:
+                returned[index], manifestChecks[index] = JEExporter.exportFromManifest(documents[index], setupData, fileNames[index])
+                if returned[index] is None:
+                    exportIndexes.append(index)
+                elif notify(index, JEBatch.STATUS_DONE, returned[index]):
+                    return returned
+
+            if searchNeeded and len(exportIndexes) > 0:
+                items = []
+                for index in exportIndexes:
+                    if notify(index, JEBatch.STATUS_SEARCH):
+                        return returned
+                    items.append(JEBatch.__searchItem(documents[index], setupData))
+
+                qualities = dict(zip(exportIndexes, pool.map(items, JEBatch.__searchQuality)))
+                items = None
+
+            for index in exportIndexes:
+                if notify(index, JEBatch.STATUS_EXPORT):
+                    return returned
+
+                try:
+                    returned[index] = JEExporter.exportDocument(documents[index],
+                                                                setupData,
+                                                                fileNames[index],
+                                                                quality=qualities.get(index),
+                                                                manifestCheck=manifestChecks[index])
+                except Exception as e:
+                    print(f"Unable to export document {documents[index].fileName()}", e)
+                    returned[index] = None
+
+                if returned[index] is None:
+                    if notify(index, JEBatch.STATUS_ERROR):
+                        return returned
+                elif notify(index, JEBatch.STATUS_DONE, returned[index]):
+                    return returned
+
+        return returned
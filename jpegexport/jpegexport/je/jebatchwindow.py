@@ -0,0 +1,260 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jebatchwindow module provides the batch export window, used to export
+# with the same setup:
+# - all (or a selection of) opened documents
+# - all (or a selection of) layers of active document
+# - a range of frames of active document, if animated
+# -----------------------------------------------------------------------------
+
+import os
+import os.path
+from krita import Krita
+
+from PyQt5.Qt import *
+
+from .jebatch import JEBatch
+from .jeanimation import JEAnimationExporter
+from .jelayerexport import JELayerExporter
+from .jeexporter import JEExporter
+from .jesettings import (
+        JESettings,
+        JESettingsKey
+    )
+
+from jpegexport.pktk.modules.strutils import bytesSizeToStr
+from jpegexport.pktk.widgets.wiodialog import (
+        WDialogMessage,
+        WDialogProgress
+    )
+from jpegexport.pktk.widgets.wedialog import WEDialog
+
+from jpegexport.pktk import *
+
+
+# -----------------------------------------------------------------------------
+class JEBatchWindow(WEDialog):
+    """Batch export window"""
+
+    MODE_DOCUMENTS = 'documents'
+    MODE_LAYERS = 'layers'
+    MODE_ANIMATION = 'animation'
+
+    def __init__(self, jeName="JPEG Export", jeVersion="testing", parent=None):
+        super(JEBatchWindow, self).__init__(os.path.join(os.path.dirname(__file__), 'resources', 'jebatchwindow.ui'), parent)
+
+        self.__jeName = jeName
+        self.__documents = Krita.instance().documents()
+        self.__activeDocument = Krita.instance().activeDocument()
+        self.__layers = []
+
+        if len(self.__documents) == 0:
+            # no document opened: cancel plugin
+            QMessageBox.warning(QWidget(),
+                                f"{jeName}",
+                                i18n("There's no opened document: <i>JPEG Export</i> plugin only works with opened documents")
+                                )
+            self.close()
+            return
+
+        JESettings.load()
+
+        self.__setups = JEExporter.setupsFromFile(JESettings.get(JESettingsKey.CONFIG_SETUPMANAGER_LASTFILE)) or {}
+
+        self.setWindowTitle(i18n(f'{jeName} v{jeVersion} - Batch'))
+
+        self.__initialiseUi()
+
+        self.exec()
+
+    def __initialiseUi(self):
+        """Initialise window interface"""
+        self.cbxMode.addItem(i18n('Opened documents'), JEBatchWindow.MODE_DOCUMENTS)
+        if self.__activeDocument is not None:
+            self.cbxMode.addItem(i18n('Layers of active document'), JEBatchWindow.MODE_LAYERS)
+            if JEAnimationExporter.isAnimated(self.__activeDocument):
+                self.cbxMode.addItem(i18n('Animation frames of active document'), JEBatchWindow.MODE_ANIMATION)
+
+                firstFrame, lastFrame = JEAnimationExporter.frameRange(self.__activeDocument)
+                for spinBox in (self.sbFrameStart, self.sbFrameEnd):
+                    spinBox.setRange(0, max(lastFrame, self.__activeDocument.animationLength() - 1))
+                self.sbFrameStart.setValue(firstFrame)
+                self.sbFrameEnd.setValue(lastFrame)
+
+        for name in self.__setups:
+            self.cbSetup.addItem(name)
+
+        self.sbWorkers.setMaximum(JEBatch.maxWorkers())
+        self.sbWorkers.setValue(max(1, JEBatch.maxWorkers() // 2))
+
+        self.cbxMode.currentIndexChanged.connect(self.__updateList)
+        self.lwDocuments.itemChanged.connect(self.__updateUi)
+        self.sbFrameStart.valueChanged.connect(self.__updateUi)
+        self.sbFrameEnd.valueChanged.connect(self.__updateUi)
+        self.pbSelectAll.clicked.connect(lambda: self.__setCheckState(Qt.Checked))
+        self.pbSelectNone.clicked.connect(lambda: self.__setCheckState(Qt.Unchecked))
+        self.pbOk.clicked.connect(self.__export)
+        self.pbCancel.clicked.connect(self.close)
+
+        self.__updateList()
+
+    @staticmethod
+    def documentName(document):
+        """Return name displayed for given `document`"""
+        if document.fileName() == '':
+            return i18n('(not saved)')
+        return os.path.basename(document.fileName())
+
+    def __updateList(self):
+        """Update list content according to current mode"""
+        self.lwDocuments.blockSignals(True)
+        self.lwDocuments.clear()
+
+        isAnimation = (self.cbxMode.currentData() == JEBatchWindow.MODE_ANIMATION)
+        self.lblFrames.setVisible(isAnimation)
+        self.wFrames.setVisible(isAnimation)
+        for widget in (self.lblDocuments, self.lwDocuments, self.pbSelectAll, self.pbSelectNone):
+            widget.setVisible(not isAnimation)
+
+        if self.cbxMode.currentData() == JEBatchWindow.MODE_LAYERS:
+            self.lblDocuments.setText(i18n('Layers to export'))
+            if len(self.__layers) == 0:
+                self.__layers = JELayerExporter.layers(self.__activeDocument)
+
+            for index, (layer, level) in enumerate(self.__layers):
+                item = QListWidgetItem(f"{'    ' * level}{layer.name()}")
+                if layer.type() == 'grouplayer':
+                    font = item.font()
+                    font.setBold(True)
+                    item.setFont(font)
+                item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
+                # by default, only top level layers are exported
+                item.setCheckState(Qt.Checked if level == 0 else Qt.Unchecked)
+                item.setData(Qt.UserRole, index)
+                self.lwDocuments.addItem(item)
+        elif self.cbxMode.currentData() == JEBatchWindow.MODE_DOCUMENTS:
+            self.lblDocuments.setText(i18n('Documents to export'))
+            for index, document in enumerate(self.__documents):
+                item = QListWidgetItem(f"{JEBatchWindow.documentName(document)} [{document.width()}x{document.height()}]")
+                item.setToolTip(document.fileName())
+                item.setFlags(Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked)
+                item.setData(Qt.UserRole, index)
+                if document == self.__activeDocument:
+                    font = item.font()
+                    font.setBold(True)
+                    item.setFont(font)
+                self.lwDocuments.addItem(item)
+
+        self.lwDocuments.blockSignals(False)
+        self.__updateUi()
+
+    def __setCheckState(self, checkState):
+        """Check/Uncheck all items"""
+        for row in range(self.lwDocuments.count()):
+            self.lwDocuments.item(row).setCheckState(checkState)
+
+    def __selectedIndexes(self):
+        """Return list of checked items indexes"""
+        return [self.lwDocuments.item(row).data(Qt.UserRole)
+                for row in range(self.lwDocuments.count())
+                if self.lwDocuments.item(row).checkState() == Qt.Checked]
+
+    def __updateUi(self, item=None):
+        """Update buttons according to current selection"""
+        if self.cbxMode.currentData() == JEBatchWindow.MODE_ANIMATION:
+            self.pbOk.setEnabled(self.cbSetup.count() > 0 and self.sbFrameStart.value() <= self.sbFrameEnd.value())
+        else:
+            self.pbOk.setEnabled(self.cbSetup.count() > 0 and len(self.__selectedIndexes()) > 0)
+
+    def __export(self):
+        """Export checked documents or layers, or frames range, with selected setup"""
+        def batchCallback(index, status, result):
+            if status == JEBatch.STATUS_SEARCH:
+                statuses[index] = i18n('Searching quality...')
+            elif status == JEBatch.STATUS_EXPORT:
+                statuses[index] = i18n('Exporting...')
+            elif status == JEBatch.STATUS_DONE:
+                if result.get('cached', False):
+                    statuses[index] = f"{i18n('Unchanged')} - {bytesSizeToStr(result['size'])}, {i18n('quality')} {result['quality']}"
+                else:
+                    statuses[index] = f"{i18n('Exported')} - {bytesSizeToStr(result['size'])}, {i18n('quality')} {result['quality']}"
+                processed.add(index)
+            else:
+                statuses[index] = f"<span style='color: #ff0000'>{i18n('Unable to export')}</span>"
+                processed.add(index)
+                errors.add(index)
+
+            dlgProgress.updateMessage(message())
+            return dlgProgress.setProgress(len(processed))
+
+        def message():
+            if isAnimation:
+                # a sequence can have a lot of frames: only frames in progress and errors are listed
+                displayed = [index for index in range(len(names))
+                             if index in errors or (index not in processed and statuses[index] != waiting)]
+            else:
+                displayed = range(len(names))
+            return '<br>'.join([f"<b>{names[index]}</b>: <i>{statuses[index]}</i>" for index in displayed])
+
+        setupData = self.__setups[self.cbSetup.currentText()]
+        selectedIndexes = self.__selectedIndexes()
+        isAnimation = (self.cbxMode.currentData() == JEBatchWindow.MODE_ANIMATION)
+
+        if isAnimation:
+            items = list(range(self.sbFrameStart.value(), self.sbFrameEnd.value() + 1))
+            names = [f"{i18n('Frame')} {frame}" for frame in items]
+            textFormat = i18n("Frame %v of %m (%p%)")
+        elif self.cbxMode.currentData() == JEBatchWindow.MODE_LAYERS:
+            items = [self.__layers[index][0] for index in selectedIndexes]
+            names = [layer.name() for layer in items]
+            textFormat = i18n("Layer %v of %m (%p%)")
+        else:
+            items = [self.__documents[index] for index in selectedIndexes]
+            names = [JEBatchWindow.documentName(document) for document in items]
+            textFormat = i18n("Document %v of %m (%p%)")
+
+        waiting = i18n('Waiting')
+        statuses = [waiting for name in names]
+        processed = set()
+        errors = set()
+
+        self.hide()
+
+        dlgProgress = WDialogProgress.display(f"{self.__jeName} - {i18n('Batch')}", message(), True, None, 0, len(items))
+        dlgProgress.setTextFormat(textFormat)
+
+        if isAnimation:
+            results = JEAnimationExporter.export(self.__activeDocument, setupData, items[0], items[-1], self.sbWorkers.value(), batchCallback)
+        elif self.cbxMode.currentData() == JEBatchWindow.MODE_LAYERS:
+            results = JELayerExporter.export(self.__activeDocument, items, setupData, self.sbWorkers.value(), batchCallback)
+        else:
+            results = JEBatch.exportDocuments(items, setupData, self.sbWorkers.value(), batchCallback)
+
+        dlgProgress.close()
+
+        nbExported = len([result for result in results if result is not None])
+        WDialogMessage.display(f"{self.__jeName} - {i18n('Batch')}",
+                               f"<p>{i18n('Exported files')}: <b>{nbExported}</b> / {len(items)}</p><p>{message()}</p>")
+
+        self.close()
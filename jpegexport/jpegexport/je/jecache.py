@@ -0,0 +1,147 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jecache module provides a basic LRU cache, with a limit defined as a size
+# in bytes, and an helper to calculate digests used as cache keys
+# -----------------------------------------------------------------------------
+
+import hashlib
+import json
+
+from collections import OrderedDict
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import QByteArray
+from PyQt5.QtGui import (
+        QColor,
+        QImage
+    )
+
+from ..pktk import *
+
+
+class JECache(object):
+    """A LRU cache
+
+    Each item is stored with its size (in bytes); when total size of items exceed
+    cache maximum size, least recently used items are removed
+    """
+
+    def __init__(self, maxBytes=0):
+        """Initialise cache
+
+        If `maxBytes` is 0, there's no limit
+        """
+        if not isinstance(maxBytes, int) or maxBytes < 0:
+            raise EInvalidValue("Given `maxBytes` must be a positive <int>")
+
+        self.__items = OrderedDict()
+        self.__maxBytes = maxBytes
+        self.__bytes = 0
+
+    def __contains__(self, key):
+        return key in self.__items
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __evict(self):
+        """Remove least recently used items until cache size is less than maximum size"""
+        if self.__maxBytes == 0:
+            return
+
+        while self.__bytes > self.__maxBytes and len(self.__items) > 0:
+            key, (value, size) = self.__items.popitem(last=False)
+            self.__bytes -= size
+
+    def get(self, key, default=None):
+        """Return value for given `key`, or `default` if key is not in cache"""
+        if key in self.__items:
+            self.__items.move_to_end(key)
+            return self.__items[key][0]
+        return default
+
+    def set(self, key, value, size=0):
+        """Set `value` for given `key`
+
+        Given `size` is value size, in bytes
+        """
+        self.remove(key)
+        self.__items[key] = (value, size)
+        self.__bytes += size
+        self.__evict()
+
+    def remove(self, key):
+        """Remove given `key` from cache"""
+        if key in self.__items:
+            value, size = self.__items.pop(key)
+            self.__bytes -= size
+
+    def clear(self):
+        """Remove all items from cache"""
+        self.__items.clear()
+        self.__bytes = 0
+
+    def bytes(self):
+        """Return size of items in cache, in bytes"""
+        return self.__bytes
+
+    def maxBytes(self):
+        """Return cache maximum size, in bytes"""
+        return self.__maxBytes
+
+    def setMaxBytes(self, maxBytes):
+        """Set cache maximum size, in bytes
+
+        If `maxBytes` is 0, there's no limit
+        """
+        if not isinstance(maxBytes, int) or maxBytes < 0:
+            raise EInvalidValue("Given `maxBytes` must be a positive <int>")
+
+        self.__maxBytes = maxBytes
+        self.__evict()
+
+    @staticmethod
+    def digest(*values):
+        """Return a digest (as hexadecimal string) for given values
+
+        Values can be QImage (pixels are taken in account), QByteArray, bytes, QColor,
+        or any value that can be serialized to JSON
+        """
+        returned = hashlib.blake2b(digest_size=16)
+        for value in values:
+            if isinstance(value, QImage):
+                returned.update(f'QImage:{value.width()}x{value.height()}:{value.format()}'.encode())
+                ptr = value.constBits()
+                if ptr is not None:
+                    ptr.setsize(value.sizeInBytes())
+                    returned.update(ptr)
+            elif isinstance(value, QByteArray):
+                returned.update(value.data())
+            elif isinstance(value, (bytes, bytearray)):
+                returned.update(value)
+            elif isinstance(value, QColor):
+                returned.update(value.name(QColor.HexArgb).encode())
+            else:
+                returned.update(json.dumps(value, sort_keys=True, default=str).encode())
+
+        return returned.hexdigest()
@@ -0,0 +1,358 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jeencoder module provides methods to encode/decode JPEG content in
+# memory, without any file written on disk
+#
+# Encoding is made with Qt JPEG writer (libjpeg), that can be used outside GUI
+# thread; Krita's JPEG exporter is still used for final exported file as it
+# provides options (chroma subsampling, smoothing, ICC profile) not available
+# from Qt
+#
+# It also provides a file size estimator, that encodes only a sample of tiles
+# from image and extrapolates the total size, and a quality search for a given
+# target file size
+#
+# Files exported without Krita (responsive set, layers) are encoded in memory
+# and then written with encodeFile()
+# -----------------------------------------------------------------------------
+
+import math
+import os
+import os.path
+import random
+import time
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        QBuffer,
+        QByteArray,
+        QIODevice,
+        QRect,
+        QThread
+    )
+from PyQt5.QtGui import (
+        QColor,
+        QImage,
+        QImageWriter,
+        QPainter
+    )
+
+from jpegexport.pktk.modules.workers import WorkerPool
+
+from ..pktk import *
+
+
+class JEEncoder(object):
+    """Encode/Decode JPEG in memory"""
+
+    # size of a MCU (16x16 for 4:2:0 chroma subsampling used by Qt)
+    MCU_SIZE = 16
+
+    # estimator: size of sampled tiles (must be a multiple of MCU_SIZE)
+    ESTIMATE_TILE_SIZE = 64
+    # estimator: default time budget (in seconds)
+    ESTIMATE_TIME_BUDGET = 0.05
+    # estimator: minimum number of sampled tiles
+    ESTIMATE_MIN_TILES = 8
+
+    @staticmethod
+    def flatten(image, fillColor=None):
+        """Return given `image` without alpha channel
+
+        Transparent pixels are composed over given `fillColor` (white if None)
+        """
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+
+        if not image.hasAlphaChannel():
+            return image
+
+        if fillColor is None:
+            fillColor = QColor(Qt.white)
+
+        returned = QImage(image.size(), QImage.Format_RGB32)
+        returned.fill(QColor(fillColor))
+
+        painter = QPainter(returned)
+        painter.drawImage(0, 0, image)
+        painter.end()
+
+        return returned
+
+    @staticmethod
+    def encode(image, options):
+        """Encode given `image` as JPEG and return content as a QByteArray
+
+        Given `options` is a dictionary, as returned by WExportOptionsJpeg.options()
+        Only 'quality', 'progressive', 'optimize' and 'transparencyFillcolor'
+        are taken in account: options only provided by Krita's JPEG exporter are not
+        available from Qt JPEG writer (chroma subsampling is always 4:2:0, smoothing is
+        not applied and ICC profile is not written)
+
+        If image can't be encoded, return None
+        """
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+
+        returned = QByteArray()
+        buffer = QBuffer(returned)
+        buffer.open(QIODevice.WriteOnly)
+
+        writer = QImageWriter(buffer, b'jpeg')
+        writer.setQuality(options.get('quality', 85))
+        writer.setOptimizedWrite(options.get('optimize', True))
+        writer.setProgressiveScanWrite(options.get('progressive', True))
+
+        isEncoded = writer.write(JEEncoder.flatten(image, options.get('transparencyFillcolor', None)))
+        buffer.close()
+
+        if isEncoded:
+            return returned
+        return None
+
+    @staticmethod
+    def estimateSize(image, options, timeBudget=None):
+        """Estimate size of given `image` encoded as JPEG with given `options`, without
+        encoding the whole image
+
+        Image is split in strata (a grid of MCU-aligned tiles); tiles are randomly
+        picked from each stratum, encoded, and the mean encoded size per pixel is
+        extrapolated to the whole image
+
+        Sampling continue until all tiles have been encoded, or until given `timeBudget`
+        (in seconds, ESTIMATE_TIME_BUDGET if None) is exhausted
+
+        Return a tuple (size, margin) where:
+        - `size` is estimated size, in bytes
+        - `margin` is the error margin (95% confidence interval), in bytes; 0 if size is exact
+        Return None if image can't be encoded
+        """
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+
+        return JEEncoder.estimateSizeFromTiles(image.width(), image.height(), image.copy, options, timeBudget)
+
+    @staticmethod
+    def estimateSizeFromTiles(width, height, tileImage, options, timeBudget=None):
+        """Estimate size of an image of given `width` and `height` encoded as JPEG with
+        given `options`, reading only sampled tiles
+
+        Given `tileImage` is a callable that return a QImage for a given QRect; it allows to
+        estimate size of an image that is not available in memory (see estimateSize())
+
+        Return a tuple (size, margin), or None if image can't be encoded
+        """
+        if not callable(tileImage):
+            raise EInvalidType("Given `tileImage` must be callable")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+
+        if timeBudget is None:
+            timeBudget = JEEncoder.ESTIMATE_TIME_BUDGET
+
+        tileSize = JEEncoder.ESTIMATE_TILE_SIZE
+        nbTilesX = width // tileSize
+        nbTilesY = height // tileSize
+        nbTiles = nbTilesX * nbTilesY
+
+        if nbTiles <= JEEncoder.ESTIMATE_MIN_TILES:
+            # small image, encode it
+            data = JEEncoder.encode(tileImage(QRect(0, 0, width, height)), options)
+            if data is None:
+                return None
+            return (data.size(), 0)
+
+        startTime = time.time()
+
+        # headers (markers, quantization & huffman tables) are written once per file:
+        # get their size from a flat MCU for which entropy coded data is almost nothing
+        flatImage = QImage(JEEncoder.MCU_SIZE, JEEncoder.MCU_SIZE, QImage.Format_RGB32)
+        flatImage.fill(Qt.gray)
+        data = JEEncoder.encode(flatImage, options)
+        if data is None:
+            return None
+        headerSize = data.size()
+
+        # list tiles by stratum; a stratum is a square of tiles, and there's at most
+        # ESTIMATE_MIN_TILES x ESTIMATE_MIN_TILES strata
+        # a fixed seed is used to ensure that, for same image, the same tiles are sampled
+        # (estimate is stable when only options are modified)
+        rng = random.Random(0)
+        strataSize = max(1, math.ceil(max(nbTilesX, nbTilesY) / JEEncoder.ESTIMATE_MIN_TILES))
+        strata = {}
+        for tileY in range(nbTilesY):
+            for tileX in range(nbTilesX):
+                strata.setdefault((tileX // strataSize, tileY // strataSize), []).append((tileX, tileY))
+
+        for tiles in strata.values():
+            rng.shuffle(tiles)
+        strata = list(strata.values())
+        rng.shuffle(strata)
+
+        # sample tiles: one tile per stratum, then restart with next tile of each stratum
+        # until time budget is exhausted
+        samples = []
+        index = 0
+        while len(samples) < nbTiles:
+            for tiles in strata:
+                if index < len(tiles):
+                    tileX, tileY = tiles[index]
+                    data = JEEncoder.encode(tileImage(QRect(tileX * tileSize, tileY * tileSize, tileSize, tileSize)), options)
+                    if data is None:
+                        return None
+                    samples.append(max(0, data.size() - headerSize))
+
+            index += 1
+            if len(samples) >= JEEncoder.ESTIMATE_MIN_TILES and (time.time() - startTime) > timeBudget:
+                break
+
+        nbSamples = len(samples)
+        mean = sum(samples) / nbSamples
+        # extrapolate to whole image, including pixels outside full tiles (right & bottom borders)
+        tileRatio = (width * height) / (tileSize * tileSize)
+        size = round(headerSize + mean * tileRatio)
+
+        if nbSamples >= nbTiles:
+            # all tiles encoded; there's no sampling error
+            # (but tiles are encoded independently, so result is still an estimate)
+            margin = 0
+        else:
+            variance = sum((sample - mean) ** 2 for sample in samples) / (nbSamples - 1)
+            # standard error with finite population correction
+            stdError = math.sqrt(variance / nbSamples * (1 - nbSamples / nbTiles))
+            margin = round(1.96 * stdError * tileRatio)
+
+        return (size, margin)
+
+    @staticmethod
+    def searchQuality(image, options, targetSize, minQuality=1, maxQuality=100):
+        """Search highest JPEG quality for which given `image` encoded with given `options`
+        has a size less or equal than `targetSize` (in bytes)
+
+        Search is made in rounds; on each round, candidates qualities evenly distributed
+        over current search interval are encoded in parallel (one per available thread)
+        and interval is reduced to [highest quality that fits, lowest quality that doesn't fit]
+
+        Return a dictionary:
+            'quality':  found quality, or None if even `minQuality` doesn't fit
+            'size':     size for found quality (None if no quality found)
+            'encodes':  number of encodes made
+            'sizes':    a dictionary {quality: size} of all encoded qualities
+        Return None if image can't be encoded
+        """
+        def encodeQuality(index, quality):
+            data = JEEncoder.encode(image, encodeOptions[quality])
+            if data is None:
+                return None
+            return data.size()
+
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+        elif not isinstance(targetSize, int):
+            raise EInvalidType("Given `targetSize` must be an <int>")
+
+        nbCandidates = max(2, QThread.idealThreadCount())
+        pool = WorkerPool(nbCandidates)
+
+        encodeOptions = {}
+        sizes = {}
+        best = None
+        low = minQuality
+        high = maxQuality
+
+        while low <= high:
+            if low == high:
+                candidates = [low]
+            else:
+                candidates = sorted({low + round((high - low) * index / (nbCandidates - 1)) for index in range(nbCandidates)})
+            candidates = [quality for quality in candidates if quality not in sizes]
+            if len(candidates) == 0:
+                break
+
+            for quality in candidates:
+                encodeOptions[quality] = dict(options)
+                encodeOptions[quality]['quality'] = quality
+
+            for quality, size in zip(candidates, pool.map(candidates, encodeQuality)):
+                if size is None:
+                    return None
+                sizes[quality] = size
+
+            tested = [quality for quality in sizes if low <= quality <= high]
+            fitting = [quality for quality in tested if sizes[quality] <= targetSize]
+            notFitting = [quality for quality in tested if sizes[quality] > targetSize]
+
+            if fitting:
+                best = max(fitting)
+                low = best + 1
+            if notFitting:
+                high = min(notFitting) - 1
+
+        return {'quality': best,
+                'size': sizes.get(best),
+                'encodes': len(sizes),
+                'sizes': sizes
+                }
+
+    @staticmethod
+    def encodeFile(image, options, fileName):
+        """Encode given `image` as JPEG with given `options` and write it to `fileName`
+
+        Image is encoded with encode(), then the same `options` limitations apply
+        File is written in target directory with a temporary name, and then renamed:
+        a partially written target file is never left behind
+        Can be used outside GUI thread
+
+        Return size of file, or None if file can't be written
+        """
+        data = JEEncoder.encode(image, options)
+        if data is None:
+            return None
+
+        tmpFileName = os.path.join(os.path.dirname(fileName), f'.{os.path.basename(fileName)}-{QUuid.createUuid().toString(QUuid.Id128)}')
+        try:
+            with open(tmpFileName, 'wb') as fHandle:
+                fHandle.write(data.data())
+            os.replace(tmpFileName, fileName)
+        except Exception as e:
+            print(f"Unable to export file to {fileName}", e)
+            if os.path.isfile(tmpFileName):
+                os.remove(tmpFileName)
+            return None
+
+        return data.size()
+
+    @staticmethod
+    def decode(data):
+        """Decode given JPEG `data` (QByteArray or bytes) and return a QImage (as ARGB32)
+
+        If data can't be decoded, return None
+        """
+        returned = QImage()
+        if returned.loadFromData(data, 'JPEG'):
+            return returned.convertToFormat(QImage.Format_ARGB32)
+        return None
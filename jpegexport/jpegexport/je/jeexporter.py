@@ -0,0 +1,539 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jeexporter module provides a headless export, usable from scripts
+# (Scripter, krita --script, ...) without export dialog
+#
+# Export is made from setup data, as stored by setup manager (in .jesetups
+# files), with the same crop/resize/encode pipeline than export dialog, but
+# without any preview document or view
+#
+# Exports are recorded in manifests (see jemanifest module): exporting again
+# unchanged content with the same setup doesn't encode anything
+#
+# Example:
+#   from jpegexport.je.jeexporter import JEExporter
+#
+#   setups = JEExporter.setupsFromFile('/path/to/file.jesetups')
+#   result = JEExporter.exportDocument(Krita.instance().activeDocument(), setups['Web'], '/path/to/file.jpeg')
+#   print(result['size'], result['timings'])
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import os.path
+
+from krita import (
+        Krita,
+        InfoObject
+    )
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        QRect,
+        QSize
+    )
+from PyQt5.QtGui import QColor
+
+from .jeencoder import JEEncoder
+from .jeanalysis import JEAnalysis
+from .jestripexport import JEStripExporter
+from .jeresponsive import JEResponsive
+from .jemanifest import JEManifest
+from .wjepathoptions import WJEPathOptions
+from .jesettings import (
+        JESettings,
+        JESettingsKey,
+        JESettingsValues
+    )
+
+from jpegexport.pktk.modules.imgutils import imgBoxSize
+from jpegexport.pktk.modules.timeutils import Stopwatch
+from jpegexport.pktk.modules.ekrita import EKritaNode
+from ..pktk import *
+
+
+class JEExporter(object):
+    """Export Krita documents as JPEG, without export dialog"""
+
+    # maximum width/height, when only one dimension is provided for resize
+    MAX_WIDTH_AND_HEIGHT = 32000
+
+    # setups file format (see WSetupManager)
+    __FILE_KEY_PKTKSM = 'pktk-sm'
+    __FILE_KEY_PKTKSM_DATA = 'data'
+    __FILE_KEY_SETUPS = 'setups'
+    __FILE_KEY_SETUP_NAME = 'name'
+    __FILE_KEY_SETUP_DATA = 'data'
+
+    @staticmethod
+    def setupsFromFile(fileName):
+        """Return setups from given .jesetups `fileName`, as a dictionary {setup name: setup data}
+
+        Return None if file can't be read
+        """
+        try:
+            with open(fileName, 'r') as fHandle:
+                data = json.loads(fHandle.read())
+            setups = data[JEExporter.__FILE_KEY_PKTKSM][JEExporter.__FILE_KEY_PKTKSM_DATA][JEExporter.__FILE_KEY_SETUPS]
+        except Exception as e:
+            print(f"Unable to read setups file: {fileName}", e)
+            return None
+
+        return {setup[JEExporter.__FILE_KEY_SETUP_NAME]: setup[JEExporter.__FILE_KEY_SETUP_DATA] for setup in setups}
+
+    @staticmethod
+    def setupValue(setupData, key):
+        """Return value for given JESettingsKey `key` from `setupData`
+
+        If key is not defined in setup data (setups saved with older versions), value
+        from settings is returned
+        """
+        return setupData.get(key.id(), JESettings.get(key))
+
+    @staticmethod
+    def jpegOptions(setupData):
+        """Return JPEG options from `setupData`, as a dictionary (same format than WExportOptionsJpeg.options())"""
+        fillColor = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_TRANSPFILLCOLOR)
+        if isinstance(fillColor, dict):
+            # color as stored in setups file
+            fillColor = fillColor.get('color', '#ffffff')
+
+        return {'quality': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_QUALITY),
+                'smoothing': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_SMOOTHING),
+                'subsampling': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_SUBSAMPLING),
+                'progressive': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_PROGRESSIVE),
+                'optimize': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_OPTIMIZE),
+                'saveProfile': JEExporter.setupValue(setupData, JESettingsKey.CONFIG_JPEG_SAVEPROFILE),
+                'transparencyFillcolor': QColor(fillColor)
+                }
+
+    @staticmethod
+    def infoObject(options):
+        """Return given JPEG `options` dictionary as an InfoObject, usable for Krita's export"""
+        returned = InfoObject()
+        for key, value in options.items():
+            returned.setProperty(key, value)
+        return returned
+
+    @staticmethod
+    def bounds(document, setupData):
+        """Return exported bounds (QRect) of `document`, according to crop option from `setupData`"""
+        selection = document.selection()
+        if JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_CROP_ACTIVE) and selection:
+            returned = QRect(selection.x(), selection.y(), selection.width(), selection.height()).intersected(QRect(0, 0, document.width(), document.height()))
+            if returned.width() > 0 and returned.height() > 0:
+                return returned
+
+        return QRect(0, 0, document.width(), document.height())
+
+    @staticmethod
+    def targetSize(size, setupData):
+        """Return exported size (QSize) for given source `size`, according to resize options from `setupData`"""
+        if not JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_ACTIVE):
+            return QSize(size)
+
+        unit = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_UNIT)
+        width = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH)
+        height = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT)
+
+        if unit == JESettingsValues.UNIT_PCT:
+            pctValue = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE) / 100
+            return QSize(round(size.width() * pctValue), round(size.height() * pctValue))
+        elif unit == JESettingsValues.UNIT_PX_WIDTH:
+            return imgBoxSize(size, QSize(width, JEExporter.MAX_WIDTH_AND_HEIGHT))
+        elif unit == JESettingsValues.UNIT_PX_HEIGHT:
+            return imgBoxSize(size, QSize(JEExporter.MAX_WIDTH_AND_HEIGHT, height))
+        return imgBoxSize(size, QSize(width, height))
+
+    @staticmethod
+    def targetFileName(document, setupData):
+        """Return exported file name for `document`, according to path options from `setupData`"""
+        pathName = os.path.dirname(document.fileName())
+        baseName, ext = os.path.splitext(os.path.basename(document.fileName()))
+
+        pathMode = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_PATH_TGTMODE)
+
+        if pathMode == WJEPathOptions.MODE_SRC and pathName == '':
+            # if source file is not saved (no file name) then use last path
+            pathMode = WJEPathOptions.MODE_LST
+
+        if pathMode == WJEPathOptions.MODE_LST:
+            pathName = JESettings.get(JESettingsKey.CONFIG_FILE_LASTPATH)
+            if pathName == '' or pathName is None:
+                # if last path name is not defined, then use 'user path'
+                pathMode = WJEPathOptions.MODE_USR
+
+        if pathMode == WJEPathOptions.MODE_USR:
+            pathName = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_PATH_USRPATH)
+            if pathName == '' or pathName is None:
+                # if user path is not defined, then use 'user home'
+                pathName = os.path.expanduser('~')
+
+        if baseName == '':
+            baseName = 'newDocument'
+
+        return os.path.join(pathName, f'{baseName}.jpeg')
+
+    @staticmethod
+    def tmpFileName(fileName):
+        """Return a temporary file name used to export given target `fileName`
+
+        Temporary file is a hidden file in target directory, so it can be renamed to
+        target file name without any copy
+
+        Return None if target directory is not writable
+        """
+        directory = os.path.dirname(fileName)
+        if directory == '' or not os.access(directory, os.W_OK):
+            return None
+
+        basename, ext = os.path.splitext(os.path.basename(fileName))
+        # Krita's exporter is selected from file extension
+        return os.path.join(directory, f'.{basename}-{QUuid.createUuid().toString(QUuid.Id128)}.jpeg')
+
+    @staticmethod
+    def searchQualityExport(document, infoObject, quality, targetSize, fileName):
+        """Search, from files exported by Krita, highest JPEG quality for which file size
+        of given `document` exported with `infoObject` options is less or equal than `targetSize`
+
+        Search start from given `quality` (found from in memory search, so expected to be close
+        to final value) and gallop up or down to find an interval, then made a binary search
+        in interval; files are exported to `fileName`
+
+        Return a tuple (quality, size, number of exports); quality and size are None if
+        even lowest quality doesn't fit
+        """
+        sizes = {}
+
+        def fits(quality):
+            if quality not in sizes:
+                infoObject.setProperty('quality', quality)
+                document.exportImage(fileName, infoObject)
+                try:
+                    sizes[quality] = os.path.getsize(fileName)
+                except Exception:
+                    sizes[quality] = targetSize + 1
+            return sizes[quality] <= targetSize
+
+        lowFit = None
+        highNotFit = None
+        step = 1
+        if fits(quality):
+            lowFit = quality
+            while lowFit < 100:
+                quality = min(100, lowFit + step)
+                if not fits(quality):
+                    highNotFit = quality
+                    break
+                lowFit = quality
+                step *= 2
+            if highNotFit is None:
+                # even highest quality fits
+                return (lowFit, sizes[lowFit], len(sizes))
+        else:
+            highNotFit = quality
+            while highNotFit > 1:
+                quality = max(1, highNotFit - step)
+                if fits(quality):
+                    lowFit = quality
+                    break
+                highNotFit = quality
+                step *= 2
+            if lowFit is None:
+                # even lowest quality doesn't fit
+                return (None, None, len(sizes))
+
+        while highNotFit - lowFit > 1:
+            quality = (lowFit + highNotFit) // 2
+            if fits(quality):
+                lowFit = quality
+            else:
+                highNotFit = quality
+
+        return (lowFit, sizes[lowFit], len(sizes))
+
+    @staticmethod
+    def exportDocument(document, setupData, targetPath=None, byStrips=False, quality=None, useManifest=True, manifestCheck=None):
+        """Export given Krita `document` as JPEG file, according to given `setupData`
+
+        Given `setupData` is a dictionary, as stored by setup manager (see setupsFromFile())
+        Given `targetPath` is exported file name; if None, file name is built from path
+        options of setup
+        If `byStrips` is True, export is made by strips with a low memory usage (see
+        JEStripExporter); target size, target image quality and responsive set options
+        are then ignored
+        If `quality` is given (already searched from an in memory image, see JEBatch), in
+        memory search is skipped: for a target file size, quality is used as start value
+        of search from exported files; for a target image quality, it's used as is
+        If `useManifest` is True, export is recorded in a manifest (see JEManifest); when
+        source pixels and options are unchanged since last export, export is skipped if
+        target file is unchanged, or exported file is copied from cache
+        If `manifestCheck` is given (tuple (source digest, manifest setup), as returned by
+        exportFromManifest() for a document that has to be exported), manifest is not checked
+        again and source digest is not calculated again
+
+        Return a dictionary, or None if file can't be exported:
+            'fileName':     exported file name
+            'size':         exported file size, in bytes
+            'width':        exported image width
+            'height':       exported image height
+            'quality':      JPEG quality (can differ from setup, if a target size or target
+                            image quality is defined)
+            'subsampling':  JPEG subsampling (can differ from setup, if a target size is defined)
+            'responsive':   a list of exported responsive set files, as returned by
+                            JEResponsive.export() (empty list if responsive set is not active)
+            'cached':       True if export has been skipped (target file up to date, or
+                            copied from cache)
+            'timings':      a dictionary {step: duration in seconds}, with steps 'manifest',
+                            'read', 'resize', 'search', 'export', 'responsive' and 'total'
+        """
+        if not isinstance(setupData, dict):
+            raise EInvalidType("Given `setupData` must be a <dict>")
+
+        Stopwatch.start('jeExporter.total')
+        timings = {'manifest': 0.0, 'read': 0.0, 'resize': 0.0, 'search': 0.0, 'export': 0.0, 'responsive': 0.0}
+        responsiveImage = None
+
+        if targetPath is None:
+            targetPath = JEExporter.targetFileName(document, setupData)
+
+        options = JEExporter.jpegOptions(setupData)
+        bounds = JEExporter.bounds(document, setupData)
+        targetSize = JEExporter.targetSize(bounds.size(), setupData)
+        filterName = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_FILTER)
+        byStrips = byStrips and JEStripExporter.available(bounds, targetSize, filterName)
+
+        if useManifest and manifestCheck is not None:
+            # already checked
+            sourceDigest, manifestSetup = manifestCheck
+        elif useManifest:
+            Stopwatch.start('jeExporter.manifest')
+            returned, sourceDigest, manifestSetup = JEExporter.__fromManifest(document, setupData, targetPath, byStrips)
+            Stopwatch.stop('jeExporter.manifest')
+            if returned is not None:
+                return returned
+            timings['manifest'] = Stopwatch.duration('jeExporter.manifest')
+
+        # file is written in target directory with a temporary name, and then renamed
+        exportFile = JEExporter.tmpFileName(targetPath)
+        if exportFile is None:
+            return None
+
+        if byStrips:
+            Stopwatch.start('jeExporter.export')
+            size = JEStripExporter.export(document, bounds, targetSize, filterName, options, exportFile)
+            Stopwatch.stop('jeExporter.export')
+            timings['export'] = Stopwatch.duration('jeExporter.export')
+        else:
+            # same process than export dialog: content is copied to a temporary document
+            Stopwatch.start('jeExporter.read')
+            tmpDoc = Krita.instance().createDocument(bounds.width(),
+                                                     bounds.height(),
+                                                     "Jpeg Export - Temporary export",
+                                                     document.colorModel(),
+                                                     document.colorDepth(),
+                                                     document.colorProfile(),
+                                                     document.resolution())
+            tmpDoc.setBatchmode(True)
+            tmpNode = tmpDoc.createNode("Export", "paintlayer")
+            tmpDoc.rootNode().addChildNode(tmpNode, None)
+            tmpNode.setPixelData(document.pixelData(bounds.x(), bounds.y(), bounds.width(), bounds.height()), 0, 0, bounds.width(), bounds.height())
+            Stopwatch.stop('jeExporter.read')
+            timings['read'] = Stopwatch.duration('jeExporter.read')
+
+            if targetSize != bounds.size():
+                Stopwatch.start('jeExporter.resize')
+                resolution = round(tmpDoc.xRes())
+                tmpDoc.scaleImage(targetSize.width(), targetSize.height(), resolution, resolution, filterName)
+                tmpDoc.waitForDone()
+                Stopwatch.stop('jeExporter.resize')
+                timings['resize'] = Stopwatch.duration('jeExporter.resize')
+
+            tmpDoc.refreshProjection()
+
+            Stopwatch.start('jeExporter.search')
+            if JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE):
+                JEExporter.__searchTargetSize(tmpDoc, setupData, options, exportFile, quality)
+            elif JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE) and quality is not None:
+                options['quality'] = quality
+            elif JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE) and JEAnalysis.available():
+                search = JEAnalysis.searchQuality(EKritaNode.toQImage(tmpDoc.rootNode(), tmpDoc),
+                                                  options,
+                                                  JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_NAME),
+                                                  JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_METRIC_VALUE))
+                if search is not None and search['quality'] is not None:
+                    options['quality'] = search['quality']
+            Stopwatch.stop('jeExporter.search')
+            timings['search'] = Stopwatch.duration('jeExporter.search')
+
+            Stopwatch.start('jeExporter.export')
+            tmpDoc.exportImage(exportFile, JEExporter.infoObject(options))
+            Stopwatch.stop('jeExporter.export')
+            timings['export'] = Stopwatch.duration('jeExporter.export')
+
+            if JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE):
+                responsiveImage = EKritaNode.toQImage(tmpDoc.rootNode(), tmpDoc)
+
+            tmpDoc.close()
+            tmpDoc.waitForDone()
+
+            if os.path.isfile(exportFile):
+                size = os.path.getsize(exportFile)
+            else:
+                size = None
+
+        if size is None:
+            if os.path.isfile(exportFile):
+                os.remove(exportFile)
+            return None
+
+        try:
+            os.replace(exportFile, targetPath)
+        except Exception as e:
+            print(f"Unable to export file to {targetPath}", e)
+            os.remove(exportFile)
+            return None
+
+        responsive = []
+        if responsiveImage is not None:
+            Stopwatch.start('jeExporter.responsive')
+            responsive = JEResponsive.export(responsiveImage,
+                                             JEResponsive.parseWidths(JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)),
+                                             filterName,
+                                             options,
+                                             targetPath)
+            Stopwatch.stop('jeExporter.responsive')
+            timings['responsive'] = Stopwatch.duration('jeExporter.responsive')
+
+        returned = {'fileName': targetPath,
+                    'size': size,
+                    'width': targetSize.width(),
+                    'height': targetSize.height(),
+                    'quality': options['quality'],
+                    'subsampling': options['subsampling'],
+                    'responsive': responsive,
+                    'cached': False,
+                    'timings': timings
+                    }
+
+        if useManifest:
+            Stopwatch.start('jeExporter.manifest')
+            JEManifest.record(targetPath, sourceDigest, manifestSetup, returned)
+            Stopwatch.stop('jeExporter.manifest')
+            timings['manifest'] += Stopwatch.duration('jeExporter.manifest')
+
+        Stopwatch.stop('jeExporter.total')
+        timings['total'] = Stopwatch.duration('jeExporter.total')
+
+        return returned
+
+    @staticmethod
+    def __fromManifest(document, setupData, targetPath, byStrips):
+        """Check manifest of `targetPath` for given `document` and `setupData`
+
+        Return a tuple (result, source digest, manifest setup); result is None if document
+        has to be exported, otherwise it's a dictionary as returned by exportDocument()
+        """
+        Stopwatch.start('jeExporter.fromManifest')
+        options = JEExporter.jpegOptions(setupData)
+        bounds = JEExporter.bounds(document, setupData)
+        targetSize = JEExporter.targetSize(bounds.size(), setupData)
+        filterName = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_MISC_RESIZE_FILTER)
+        byStrips = byStrips and JEStripExporter.available(bounds, targetSize, filterName)
+
+        sourceDigest = JEManifest.sourceDigest(document, bounds)
+        manifestSetup = JEManifest.setup(setupData, options, targetSize, filterName, byStrips)
+        manifest = (JEManifest.upToDate(targetPath, sourceDigest, manifestSetup) or
+                    JEManifest.fromCache(targetPath, sourceDigest, manifestSetup))
+        Stopwatch.stop('jeExporter.fromManifest')
+
+        if manifest is None:
+            return (None, sourceDigest, manifestSetup)
+
+        duration = Stopwatch.duration('jeExporter.fromManifest')
+        pathName = os.path.dirname(targetPath)
+        return ({'fileName': targetPath,
+                 'size': manifest['size'],
+                 'width': targetSize.width(),
+                 'height': targetSize.height(),
+                 'quality': manifest['quality'],
+                 'subsampling': manifest['subsampling'],
+                 'responsive': [dict(item, fileName=os.path.join(pathName, item['fileName'])) for item in manifest['responsive']],
+                 'cached': True,
+                 'timings': {'manifest': duration, 'read': 0.0, 'resize': 0.0, 'search': 0.0, 'export': 0.0, 'responsive': 0.0, 'total': duration}
+                 },
+                sourceDigest,
+                manifestSetup)
+
+    @staticmethod
+    def exportFromManifest(document, setupData, targetPath=None, byStrips=False):
+        """Check if given Krita `document` needs to be exported with given `setupData`
+
+        Return a tuple (result, manifest check)
+        If source pixels and options are unchanged since last export (see JEManifest), target
+        file is kept as is or copied from cache, and result is a dictionary (as returned by
+        exportDocument()); otherwise result is None and manifest check (tuple (source digest,
+        manifest setup)) can be given to exportDocument(), to avoid a second check
+        """
+        if not isinstance(setupData, dict):
+            raise EInvalidType("Given `setupData` must be a <dict>")
+
+        if targetPath is None:
+            targetPath = JEExporter.targetFileName(document, setupData)
+
+        returned, sourceDigest, manifestSetup = JEExporter.__fromManifest(document, setupData, targetPath, byStrips)
+        return (returned, (sourceDigest, manifestSetup))
+
+    @staticmethod
+    def __searchTargetSize(document, setupData, options, fileName, quality=None):
+        """Search highest JPEG quality for which exported file fits in target file size
+        defined in `setupData`, and apply it to `options`
+
+        Search is made in two steps, as in export dialog:
+        - a fast search from encodes made in memory (skipped if `quality` is provided)
+        - found quality is then verified and refined from files exported by Krita
+        """
+        targetSize = JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_SIZE_VALUE) * 1024
+
+        subsamplings = [options['subsampling']]
+        if JEExporter.setupValue(setupData, JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING):
+            subsamplings += [subsampling for subsampling in (JESettingsValues.JPEG_SUBSAMPLING_422, JESettingsValues.JPEG_SUBSAMPLING_420)
+                             if subsampling < options['subsampling']]
+
+        if quality is None:
+            search = JEEncoder.searchQuality(EKritaNode.toQImage(document.rootNode(), document), options, targetSize)
+            if search is None:
+                return
+            quality = search['quality']
+
+        found = None
+        infoObject = JEExporter.infoObject(options)
+        for subsampling in subsamplings:
+            infoObject.setProperty('subsampling', subsampling)
+            quality, size, exports = JEExporter.searchQualityExport(document, infoObject, quality or 1, targetSize, fileName)
+            # keep highest quality; for same quality, keep highest subsampling (first tested)
+            if quality is not None and (found is None or quality > found[0]):
+                found = (quality, subsampling)
+
+        if found is not None:
+            options['quality'], options['subsampling'] = found
@@ -0,0 +1,230 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jelayerexport module provides class used to export layers and groups of
+# a document, one JPEG file per layer
+#
+# Each layer is rendered from its projection (for a group: visible child
+# layers, composed), without modifying document: layers don't need to be
+# hidden/shown
+#
+# Layers that are not RGBA/U8 are converted through a temporary document with
+# the same color space as layer (Krita's API doesn't provide any other way to
+# convert pixels to a QImage)
+#
+# Layers are read from GUI thread (Krita's API); resize, quality search and
+# encoding are made in parallel on a worker pool, by groups of `maxWorkers`
+# layers (then no more than `maxWorkers` layer images are in memory at the same
+# time)
+#
+# Layer files are written with JEEncoder.encodeFile() (supported options are
+# listed by JEEncoder.encode())
+# -----------------------------------------------------------------------------
+
+import os.path
+import re
+
+from krita import Krita
+
+from PyQt5.Qt import *
+
+from .jebatch import JEBatch
+from .jeexporter import JEExporter
+
+from jpegexport.pktk.modules.ekrita import (
+        EKritaDocument,
+        EKritaNode
+    )
+from jpegexport.pktk.modules.workers import WorkerPool
+from ..pktk import *
+
+
+class JELayerExporter(object):
+    """Export layers of a Krita document as JPEG files, one file per layer"""
+
+    # layers types that can't be exported
+    IGNORED_TYPES = ('transparencymask', 'filtermask', 'transformmask', 'selectionmask', 'colorizemask')
+
+    @staticmethod
+    def layers(document, recursiveSubLayers=True):
+        """Return list of exportable layers (and groups) from given `document`, as a
+        list of tuple (layer, level) in layer stack order (top to bottom)
+
+        Masks are ignored
+        """
+        def level(layer):
+            returned = 0
+            parent = layer.parentNode()
+            while parent is not None and parent.parentNode() is not None:
+                returned += 1
+                parent = parent.parentNode()
+            return returned
+
+        return [(layer, level(layer)) for layer in EKritaDocument.getLayers(document, recursiveSubLayers)
+                if layer.type() not in JELayerExporter.IGNORED_TYPES]
+
+    @staticmethod
+    def fileName(fileName, layer, usedFileNames):
+        """Return file name for given `layer`, built from document exported `fileName` with
+        layer name as suffix
+
+        If built file name is already in `usedFileNames` (layers with the same name), a
+        number is added to file name
+        """
+        baseName, ext = os.path.splitext(fileName)
+        layerName = re.sub(r'[\\/:*?"<>|]', '_', layer.name()).strip() or 'layer'
+
+        returned = f'{baseName}-{layerName}{ext}'
+        number = 1
+        while returned in usedFileNames:
+            number += 1
+            returned = f'{baseName}-{layerName}-{number}{ext}'
+
+        usedFileNames.add(returned)
+        return returned
+
+    @staticmethod
+    def __layerImage(document, layer, bounds, tmpDocs):
+        """Return projection of given `layer` for given `bounds`, as a QImage (ARGB32)
+
+        Given `tmpDocs` is a dictionary in which temporary documents used to convert
+        layers that are not RGBA/U8 are kept, to be reused for layers with the same color
+        space; documents must be closed by caller
+        """
+        if layer.colorModel() == 'RGBA' and layer.colorDepth() == 'U8':
+            return EKritaNode.toQImage(layer, bounds, EKritaNode.ProjectionMode.TRUE)
+
+        colorSpace = (layer.colorModel(), layer.colorDepth(), layer.colorProfile())
+        if colorSpace not in tmpDocs:
+            tmpDoc = Krita.instance().createDocument(bounds.width(),
+                                                     bounds.height(),
+                                                     "Jpeg Export - Temporary layer export",
+                                                     *colorSpace,
+                                                     document.resolution())
+            tmpDoc.setBatchmode(True)
+            tmpNode = tmpDoc.createNode("Layer", "paintlayer")
+            tmpDoc.rootNode().addChildNode(tmpNode, None)
+            tmpDocs[colorSpace] = (tmpDoc, tmpNode)
+
+        tmpDoc, tmpNode = tmpDocs[colorSpace]
+        tmpNode.setPixelData(layer.projectionPixelData(bounds.x(), bounds.y(), bounds.width(), bounds.height()), 0, 0, bounds.width(), bounds.height())
+        tmpDoc.refreshProjection()
+        tmpDoc.waitForDone()
+        return tmpDoc.projection(0, 0, bounds.width(), bounds.height())
+
+    @staticmethod
+    def __exportItem(index, item):
+        """Resize, search quality and encode given `item` (image, fileName, imageOptions);
+        executed outside GUI thread
+
+        Return a tuple (file size, quality); file size is None if file can't be exported
+        """
+        image = item['image']
+        item['image'] = None
+        return JEBatch.exportImage(image, item['fileName'], item['imageOptions'])
+
+    @staticmethod
+    def export(document, layers, setupData, maxWorkers=None, callback=None):
+        """Export given `layers` (list of Krita nodes) of `document` as JPEG files,
+        according to given `setupData`
+
+        Given `setupData` is a dictionary, as stored by setup manager (see JEExporter.setupsFromFile())
+        Crop, resize, JPEG options and target (file size, image quality) options are
+        applied to each layer; file names are built from path options of setup, with
+        layer name as suffix
+        Given `maxWorkers` is maximum number of layers processed in parallel; if None,
+        all available threads are used
+
+        If provided, `callback` is a callable callback(index, status, result) called when
+        status of layer `index` change (see JEBatch.STATUS_* values); `result` is provided
+        for JEBatch.STATUS_DONE
+        If callback return True, export is cancelled
+
+        Return a list of results, one per layer (None for layers that can't be exported or
+        if export has been cancelled); a result is a dictionary:
+            'fileName':     exported file name
+            'layer':        layer name
+            'size':         exported file size, in bytes
+            'width':        exported image width
+            'height':       exported image height
+            'quality':      JPEG quality
+        """
+        def notify(index, status, result=None):
+            if callback is None:
+                return False
+            return callback(index, status, result) is True
+
+        if not isinstance(layers, (list, tuple)):
+            raise EInvalidType("Given `layers` must be a <list>")
+        elif not isinstance(setupData, dict):
+            raise EInvalidType("Given `setupData` must be a <dict>")
+
+        if maxWorkers is None:
+            maxWorkers = JEBatch.maxWorkers()
+        maxWorkers = max(1, min(maxWorkers, JEBatch.maxWorkers()))
+
+        bounds = JEExporter.bounds(document, setupData)
+        fileName = JEExporter.targetFileName(document, setupData)
+        imageOptions = JEBatch.imageOptions(setupData, bounds)
+        targetSize = imageOptions['targetSize']
+
+        pool = WorkerPool(maxWorkers)
+        usedFileNames = set()
+        returned = [None] * len(layers)
+
+        # temporary documents used to convert layers color space
+        tmpDocs = {}
+        try:
+            for first in range(0, len(layers), maxWorkers):
+                indexes = range(first, min(len(layers), first + maxWorkers))
+
+                items = []
+                for index in indexes:
+                    if notify(index, JEBatch.STATUS_EXPORT):
+                        return returned
+
+                    items.append({'image': JELayerExporter.__layerImage(document, layers[index], bounds, tmpDocs),
+                                  'fileName': JELayerExporter.fileName(fileName, layers[index], usedFileNames),
+                                  'imageOptions': imageOptions
+                                  })
+
+                for index, layerItem, result in zip(indexes, items, pool.map(items, JELayerExporter.__exportItem)):
+                    size, quality = result
+                    if size is None:
+                        if notify(index, JEBatch.STATUS_ERROR):
+                            return returned
+                        continue
+
+                    returned[index] = {'fileName': layerItem['fileName'],
+                                       'layer': layers[index].name(),
+                                       'size': size,
+                                       'width': targetSize.width(),
+                                       'height': targetSize.height(),
+                                       'quality': quality
+                                       }
+                    if notify(index, JEBatch.STATUS_DONE, returned[index]):
+                        return returned
+        finally:
+            for tmpDoc, tmpNode in tmpDocs.values():
+                tmpDoc.close()
+
+        return returned
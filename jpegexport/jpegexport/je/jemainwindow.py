@@ -20,6 +20,8 @@
 # -----------------------------------------------------------------------------
 
 
+import hashlib
+import math
 import os
 import os.path
 import re
@@ -33,6 +35,20 @@ from PyQt5.QtWidgets import (
     )
 
 from .wjepathoptions import WJEPathOptions
+from .wjetargetoptions import WJETargetOptions
+from .jeencoder import JEEncoder
+from .jepreview import JEPreviewScheduler
+from .jesource import JESource
+from .jeresize import JEResize
+from .jestripexport import JEStripExporter
+from .jememory import JEMemory
+from .jeexporter import JEExporter
+from .jeresponsive import JEResponsive
+from .jequeue import JEExportQueue
+from .jewatch import JEWatch
+from .jemanifest import JEManifest
+from .jesizecurve import JESizeCurve
+from .jeanalysis import JEAnalysis
 from .jesettings import (
         JESettings,
         JESettingsKey,
@@ -44,7 +60,9 @@ from jpegexport.pktk.modules.strutils import bytesSizeToStr
 from jpegexport.pktk.modules.imgutils import (imgBoxSize,
                                               buildIcon
                                               )
-from jpegexport.pktk.modules.timeutils import Timer
+from jpegexport.pktk.modules.timeutils import (Timer,
+                                               Stopwatch
+                                               )
 from jpegexport.pktk.widgets.wiodialog import WDialogFile
 from jpegexport.pktk.widgets.wabout import WAboutWindow
 from jpegexport.pktk.widgets.wedialog import WEDialog
@@ -97,6 +115,11 @@ class WJEViewer(QWidget):
                 JESettingsKey.CONFIG_MISC_RESIZE_UNIT: data[JESettingsKey.CONFIG_MISC_RESIZE_UNIT.id()]
                 })
 
+        # setups saved with older versions don't have responsive set options
+        self.wContentOptions.setProperties({key: data[key.id()] for key in (JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE,
+                                                                            JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)
+                                            if key.id() in data})
+
         self.wPathOptions.setProperties({
                 JESettingsKey.CONFIG_PATH_TGTMODE: data[JESettingsKey.CONFIG_PATH_TGTMODE.id()],
                 JESettingsKey.CONFIG_PATH_USRPATH: data[JESettingsKey.CONFIG_PATH_USRPATH.id()]
@@ -116,9 +139,32 @@ class JEMainWindow(WEDialog):
     # delay between modified properties and preview update
     __UPDATE_DELAY = 375
     __RESIZE_DELAY = 625
+    # in memory preview is encoded outside GUI thread, delay can be shorter
+    __UPDATE_DELAY_MEMORY = 50
+    # visible area only preview: margin (in pixels) added around visible area
+    __VIEWPORT_MARGIN = 64
+    # reduced resolution preview: document is reduced to screen resolution, with a minimum
+    # width and height
+    __PREVIEW_PROXY_SIZE = 2048
+
+    # file layer reload: delay between two checks, number of consecutive checks
+    # without modification for which reload is considered finished, and maximum
+    # delay to wait
+    __PREVIEW_READY_POLL = 10
+    __PREVIEW_READY_STABLE = 3
+    __PREVIEW_READY_TIMEOUT = 750
+    # file layer reload: number of sampled blocks per row/column, and block size
+    __PREVIEW_READY_SAMPLES = 16
+    __PREVIEW_READY_SAMPLE_SIZE = 8
 
     __MAX_WIDTH_AND_HEIGHT = 32000
 
+    # chroma subsampling labels, used for target file size search results
+    __SUBSAMPLING_LABELS = {JESettingsValues.JPEG_SUBSAMPLING_420: '4:2:0',
+                            JESettingsValues.JPEG_SUBSAMPLING_422: '4:2:2',
+                            JESettingsValues.JPEG_SUBSAMPLING_440: '4:4:0',
+                            JESettingsValues.JPEG_SUBSAMPLING_444: '4:4:4'}
+
     __UPDATE_MODE_CROP =   0b00000001
     __UPDATE_MODE_RESIZE = 0b00000010
 
@@ -126,6 +172,7 @@ class JEMainWindow(WEDialog):
         super(JEMainWindow, self).__init__(os.path.join(os.path.dirname(__file__), 'resources', 'jemainwindow.ui'), parent)
 
         self.__notifier = None
+        self.__docSource = None
 
         # another instance already exist, exit
         if JEMainWindow.__IS_OPENED:
@@ -140,8 +187,39 @@ class JEMainWindow(WEDialog):
         self.__tmpDoc = None                      # internal document used for export (not added to view)
         self.__tmpDocTgtNode = None
         self.__tmpDocPreview = None               # document used for preview (added to view)
-        self.__tmpDocPreviewFileNode = None
+        self.__tmpDocPreviewView = None           # view in which preview document is displayed
+        self.__tmpDocPreviewFileNode = None       # file layer used for preview (preview mode 'file')
+        self.__tmpDocPreviewMemNode = None        # paint layer used for preview (preview mode 'memory')
         self.__tmpDocPreviewSrcNode = None
+        self.__tmpDocPreviewSrcPixels = None      # pixels shared with __tmpDoc, to set in source layer (None: read from __tmpDoc)
+        self.__tmpDocSourceRevision = None        # revision token of source from which __tmpDoc content has been built
+        self.__tmpDocPreviewSrcDirty = True       # True if source layer need to be updated
+        self.__tmpDocPreviewAnalysisNode = None   # paint layer used to render error analysis (render mode 'error-map')
+        self.__tmpDocImage = None                 # __tmpDoc content as QImage, used for in memory encoding
+        self.__tmpDocProxyImage = None            # __tmpDoc content as reduced resolution QImage, used for reduced resolution preview
+
+        self.__previewMode = JESettingsValues.PREVIEW_MODE_FILE
+        self.__previewViewport = False            # in memory preview mode, encode visible area only
+        self.__previewRegion = None               # tuple (generation, QRect) of last visible area encoding request
+        self.__previewFileDigest = None           # digest of JPEG file currently loaded in preview file layer
+        self.__previewFileOptions = None          # JPEG options used to export preview file (None: file content is outdated)
+        self.__previewRefreshDuration = None      # duration (in ms) of last preview refresh
+        self.__previewProxy = False               # preview is rendered from a reduced resolution image (huge document or memory budget exceeded)
+        self.__previewProxyBudget = False         # reduced resolution preview because memory budget is exceeded: full resolution image is not used
+        self.__previewProxyFileMode = False       # preview mode was 'file' before reduced resolution preview has been activated
+        self.__previewScheduler = JEPreviewScheduler(self)  # in memory preview encoding, outside GUI thread
+        self.__previewScheduler.encoded.connect(self.__previewEncoded)
+        self.__sizeCurve = JESizeCurve(parent=self)  # quality→size curve, calculated in background
+        self.__sizeCurve.updated.connect(self.__sizeCurveUpdated)
+        self.__targetMetricSearchResult = ''      # last target image quality search result
+        self.__targetMetricSearchNeeded = False   # content or target have been modified since last target image quality search
+        self.__targetSizeSearchNeeded = False     # content, target or options have been modified since last target file size search
+        self.__targetSizeSearchOptions = None     # JPEG options (quality excluded) applied by last target file size search
+        self.__targetSizeQtQuality = None         # quality found by last target file size search for in memory encoder (None: not found)
+        self.__errorAnalysis = None               # last error analysis (see JEAnalysis.errorAnalysis())
+        self.__errorAnalysisRect = None           # area of preview document covered by last error analysis
+        self.__errorAnalysisRendered = None       # render mode for which last error analysis is rendered in analysis layer
+        self.__errorAnalysisPainted = []          # areas of analysis layer on which pixels have been rendered
 
         self.__jeName = jeName
         self.__jeVersion = jeVersion
@@ -152,6 +230,13 @@ class JEMainWindow(WEDialog):
         self.__positionCrop = None
 
         self.__doc = Krita.instance().activeDocument()
+        self.__docSource = JESource(self.__doc) if self.__doc else None  # source document pixels, with cache
+        self.__resize = JEResize(parent=self)     # resize with selected filter, calculated in background
+        self.__resize.resized.connect(self.__resized)
+        self.__resizeKey = None                   # key of resize in progress, None if no resize in progress
+        self.__memory = JEMemory(parent=self)     # memory used by dialog, with budget
+        self.__memory.updated.connect(self.__memoryUpdated)
+        self.__memory.budgetExceeded.connect(self.__memoryBudgetExceeded)
         self.__boundsSource = None
         self.__sizeTarget = None
 
@@ -173,9 +258,12 @@ class JEMainWindow(WEDialog):
 
         JEMainWindow.__IS_OPENED = True
 
+        self.__initialiseMemory()
+
         basename, ext = os.path.splitext(os.path.basename(self.__doc.fileName()))
         self.__tmpExportPreviewFile = os.path.join(QDir.tempPath(), f'{basename} (JPEG Export Preview).jpeg')
         self.__tmpExportFile = os.path.join(QDir.tempPath(), f'jpegexport-{QUuid.createUuid().toString(QUuid.Id128)}.jpeg')
+        self.__tmpSearchFile = os.path.join(QDir.tempPath(), f'jpegexport-{QUuid.createUuid().toString(QUuid.Id128)}-search.jpeg')
         self.__docFileName = self.__doc.fileName()
 
         self.__notifier = Krita.instance().notifier()
@@ -190,6 +278,20 @@ class JEMainWindow(WEDialog):
 
         self.show()
 
+    def __initialiseMemory(self):
+        """Register memory consumers
+
+        Caches are evicted first when memory budget is exceeded: source pixels can be
+        read again from document, while resized pixels need to be calculated again
+        """
+        self.__memory.register('tmpDoc', lambda: JEMemory.documentBytes(self.__tmpDoc))
+        self.__memory.register('tmpDocPreview', lambda: JEMemory.documentBytes(self.__tmpDocPreview))
+        self.__memory.register('tmpDocImage', lambda: sum(image.sizeInBytes() for image in (self.__tmpDocImage, self.__tmpDocProxyImage) if image is not None))
+        self.__memory.register('errorAnalysis', self.__errorAnalysisBytes)
+        self.__memory.register('previewEncoding', self.__previewScheduler.bytes)
+        self.__memory.register('sourceCache', self.__docSource.cache().bytes, self.__docSource.clear, 0)
+        self.__memory.register('resizeCache', self.__resize.bytes, self.__resize.clear, 1)
+
     def __initialiseDoc(self):
         """Initialise temporary document"""
         self.__calculateBounds()
@@ -205,12 +307,14 @@ class JEMainWindow(WEDialog):
         self.__tmpDocTgtNode = self.__tmpDoc.createNode("Preview", "paintlayer")
         self.__tmpDoc.rootNode().addChildNode(self.__tmpDocTgtNode, None)
         self.__tmpDoc.setBatchmode(True)
-        # force jpeg export
-        self.timerEvent(None)
+
+        # for huge documents, preview document is created with reduced resolution
+        self.__updatePreviewProxy()
+        previewSize = self.__tmpDocPreviewSize()
 
         # The __tmpDocPreview contain the Jpeg file for preview
-        self.__tmpDocPreview = Krita.instance().createDocument(self.__boundsSource.width(),
-                                                               self.__boundsSource.height(),
+        self.__tmpDocPreview = Krita.instance().createDocument(previewSize.width(),
+                                                               previewSize.height(),
                                                                "Jpeg Export - Temporary preview",
                                                                self.__doc.colorModel(),
                                                                self.__doc.colorDepth(),
@@ -219,13 +323,12 @@ class JEMainWindow(WEDialog):
         # add original document content, as reference for diff
         self.__tmpDocPreviewSrcNode = self.__tmpDocPreview.createNode("Source", "paintlayer")
         self.__tmpDocPreview.rootNode().addChildNode(self.__tmpDocPreviewSrcNode, None)
-        # add file layer linked to exported jpeg document, to see preview
-        self.__tmpDocPreviewFileNode = self.__tmpDocPreview.createFileLayer("Preview", self.__tmpExportFile, "None")
-        self.__tmpDocPreview.rootNode().addChildNode(self.__tmpDocPreviewFileNode, None)
+        # add layer to see preview
+        self.__initialisePreviewNode()
         self.__tmpDocPreview.setBatchmode(True)
         self.__tmpDocPreview.setFileName(self.__tmpExportPreviewFile)
 
-        Krita.instance().activeWindow().addView(self.__tmpDocPreview)  # shows it in the application
+        self.__tmpDocPreviewView = Krita.instance().activeWindow().addView(self.__tmpDocPreview)  # shows it in the application
 
         # self.lblDocDimension.setText(i18n(f"Dimensions: {self.__tmpDoc.width()}x{self.__tmpDoc.height()}"))
 
@@ -234,11 +337,112 @@ class JEMainWindow(WEDialog):
             self.__viewScrollbarH, self.__viewScrollbarV = scrollbars
             self.__viewScrollbarH.sliderMoved.connect(self.__updatePosition)
             self.__viewScrollbarV.sliderMoved.connect(self.__updatePosition)
+            for scrollbar in scrollbars:
+                # scrolled or zoomed
+                scrollbar.valueChanged.connect(self.__viewportChanged)
+                scrollbar.rangeChanged.connect(self.__viewportChanged)
             self.__updatePosition()
 
         self.__updateDoc()
         self.__renderModeChanged()
 
+    def __initialisePreviewNode(self):
+        """Initialise layer used to render JPEG preview, according to current preview mode
+
+        - PREVIEW_MODE_FILE: a file layer linked to exported JPEG file
+        - PREVIEW_MODE_MEMORY: a paint layer for which pixels are directly updated from JPEG decoded in memory
+        """
+        for node in (self.__tmpDocPreviewFileNode, self.__tmpDocPreviewMemNode):
+            if node:
+                node.remove()
+        self.__tmpDocPreviewFileNode = None
+        self.__tmpDocPreviewMemNode = None
+        self.__previewFileDigest = None
+
+        if self.__previewMode == JESettingsValues.PREVIEW_MODE_FILE:
+            if not os.path.isfile(self.__tmpExportFile):
+                # file layer need an existing file
+                self.__exportPreviewFile()
+
+            self.__tmpDocPreviewFileNode = self.__tmpDocPreview.createFileLayer("Preview", self.__tmpExportFile, "None")
+            self.__tmpDocPreview.rootNode().addChildNode(self.__tmpDocPreviewFileNode, self.__tmpDocPreviewSrcNode)
+        else:
+            self.__tmpDocPreviewMemNode = self.__tmpDocPreview.createNode("Preview", "paintlayer")
+            self.__tmpDocPreview.rootNode().addChildNode(self.__tmpDocPreviewMemNode, self.__tmpDocPreviewSrcNode)
+
+            # decoded JPEG are RGBA/U8 images; use the same color space for layer to avoid
+            # any conversion when pixels are updated
+            if self.__doc.colorModel() == 'RGBA' and self.__doc.colorDepth() == 'U8':
+                self.__tmpDocPreviewMemNode.setColorSpace('RGBA', 'U8', self.__doc.colorProfile())
+            else:
+                self.__tmpDocPreviewMemNode.setColorSpace('RGBA', 'U8', 'sRGB-elle-V2-srgbtrc.icc')
+
+    def __initialiseAnalysisNode(self):
+        """Initialise layer used to render error analysis heatmap, if not already done
+
+        Layer is created on top of preview document, only when needed
+        """
+        if self.__tmpDocPreviewAnalysisNode is None:
+            self.__tmpDocPreviewAnalysisNode = self.__tmpDocPreview.createNode("Error analysis", "paintlayer")
+            self.__tmpDocPreview.rootNode().addChildNode(self.__tmpDocPreviewAnalysisNode, None)
+            self.__tmpDocPreviewAnalysisNode.setColorSpace('RGBA', 'U8', 'sRGB-elle-V2-srgbtrc.icc')
+            self.__errorAnalysisRendered = None
+            self.__errorAnalysisPainted = []
+        return self.__tmpDocPreviewAnalysisNode
+
+    def __tmpDocPreviewJpegNode(self):
+        """Return layer used to render JPEG preview, according to current preview mode"""
+        if self.__previewMode == JESettingsValues.PREVIEW_MODE_FILE:
+            return self.__tmpDocPreviewFileNode
+        return self.__tmpDocPreviewMemNode
+
+    def __tmpDocQImage(self):
+        """Return __tmpDoc content as a QImage
+
+        Image is kept in memory until __tmpDoc content is updated
+        """
+        if self.__tmpDocImage is None:
+            self.__tmpDocImage = EKritaNode.toQImage(self.__tmpDoc.rootNode(), self.__tmpDoc)
+        return self.__tmpDocImage
+
+    def __tmpDocProxyQImage(self):
+        """Return __tmpDoc content as a reduced resolution QImage
+
+        Image is kept in memory until __tmpDoc content is updated
+        """
+        if self.__tmpDocProxyImage is None:
+            size = self.__previewProxySize()
+            # thumbnail is rendered by Krita from document projection, without a full resolution copy
+            image = self.__tmpDoc.thumbnail(size.width(), size.height()).convertToFormat(QImage.Format_ARGB32)
+            if image.size() != size:
+                image = image.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            self.__tmpDocProxyImage = image
+        return self.__tmpDocProxyImage
+
+    def __tmpDocPreviewQImage(self):
+        """Return image encoded for in memory preview: __tmpDoc content, or reduced resolution content"""
+        if self.__previewProxy:
+            return self.__tmpDocProxyQImage()
+        return self.__tmpDocQImage()
+
+    def __previewProxySize(self):
+        """Return size of reduced resolution preview: document size reduced to screen resolution"""
+        maxSize = JEMainWindow.__PREVIEW_PROXY_SIZE
+        screen = QGuiApplication.primaryScreen()
+        if screen:
+            maxSize = max(maxSize, round(max(screen.size().width(), screen.size().height()) * screen.devicePixelRatio()))
+
+        size = QSize(self.__tmpDoc.width(), self.__tmpDoc.height())
+        if size.width() > maxSize or size.height() > maxSize:
+            size = imgBoxSize(size, QSize(maxSize, maxSize))
+        return size
+
+    def __tmpDocPreviewSize(self):
+        """Return size of preview document"""
+        if self.__previewProxy:
+            return self.__previewProxySize()
+        return QSize(self.__tmpDoc.width(), self.__tmpDoc.height())
+
     def __initialiseUi(self):
         """Initialise window interface"""
         JESettings.load()
@@ -262,7 +466,9 @@ class JEMainWindow(WEDialog):
                 JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE: JESettings.get(JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE),
                 JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH: JESettings.get(JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH),
                 JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT: JESettings.get(JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT),
-                JESettingsKey.CONFIG_MISC_RESIZE_UNIT: JESettings.get(JESettingsKey.CONFIG_MISC_RESIZE_UNIT)
+                JESettingsKey.CONFIG_MISC_RESIZE_UNIT: JESettings.get(JESettingsKey.CONFIG_MISC_RESIZE_UNIT),
+                JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE: JESettings.get(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE),
+                JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS: JESettings.get(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)
                 })
 
         self.wPathOptions.setProperties({
@@ -270,6 +476,15 @@ class JEMainWindow(WEDialog):
                 JESettingsKey.CONFIG_PATH_USRPATH: JESettings.get(JESettingsKey.CONFIG_PATH_USRPATH)
                 })
 
+        self.wTargetOptions.setProperties({
+                JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE: JESettings.get(JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE),
+                JESettingsKey.CONFIG_TARGET_SIZE_VALUE: JESettings.get(JESettingsKey.CONFIG_TARGET_SIZE_VALUE),
+                JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING: JESettings.get(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING),
+                JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE: JESettings.get(JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE),
+                JESettingsKey.CONFIG_TARGET_METRIC_NAME: JESettings.get(JESettingsKey.CONFIG_TARGET_METRIC_NAME),
+                JESettingsKey.CONFIG_TARGET_METRIC_VALUE: JESettings.get(JESettingsKey.CONFIG_TARGET_METRIC_VALUE)
+                })
+
         renderMode = JESettings.get(JESettingsKey.CONFIG_RENDER_MODE)
         if renderMode == JESettingsValues.RENDER_MODE_FINAL:
             self.rbRenderNormal.setChecked(True)
@@ -279,6 +494,40 @@ class JEMainWindow(WEDialog):
             self.rbRenderXOR.setChecked(True)
         elif renderMode == JESettingsValues.RENDER_MODE_SOURCE:
             self.rbRenderSrc.setChecked(True)
+        elif renderMode == JESettingsValues.RENDER_MODE_ERRORMAP and JEAnalysis.available():
+            self.rbRenderErrorMap.setChecked(True)
+        elif renderMode == JESettingsValues.RENDER_MODE_BLOCKMAP and JEAnalysis.available():
+            self.rbRenderBlockMap.setChecked(True)
+        else:
+            self.rbRenderNormal.setChecked(True)
+
+        if not JEAnalysis.available():
+            self.rbRenderErrorMap.setEnabled(False)
+            self.rbRenderErrorMap.setToolTip(i18n('Python <i>numpy</i> module is required to analyse errors'))
+            self.rbRenderBlockMap.setEnabled(False)
+            self.rbRenderBlockMap.setToolTip(i18n('Python <i>numpy</i> module is required to analyse errors'))
+            self.cbErrorStats.setVisible(False)
+            self.lblErrorStats.setVisible(False)
+            self.wErrorHistogram.setVisible(False)
+        else:
+            self.cbErrorStats.setChecked(JESettings.get(JESettingsKey.CONFIG_PREVIEW_ERRORSTATS))
+            self.lblErrorStats.setVisible(self.cbErrorStats.isChecked())
+            self.wErrorHistogram.setVisible(self.cbErrorStats.isChecked())
+
+        self.__previewMode = JESettings.get(JESettingsKey.CONFIG_PREVIEW_MODE)
+        self.cbPreviewInMemory.setChecked(self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY)
+        self.__previewViewport = JESettings.get(JESettingsKey.CONFIG_PREVIEW_VIEWPORT)
+        self.cbPreviewViewport.setChecked(self.__previewViewport)
+        self.cbPreviewViewport.setEnabled(self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY)
+        self.cbExportByStrips.setChecked(JESettings.get(JESettingsKey.CONFIG_EXPORT_STRIPS))
+        self.cbExportInBackground.setChecked(JESettings.get(JESettingsKey.CONFIG_EXPORT_QUEUE))
+        self.__updateExportWarning()
+        # a document can only be watched if saved
+        self.cbWatch.setEnabled(self.__doc.fileName() != '')
+        self.cbWatch.setChecked(JEWatch.instance().isWatched(self.__doc))
+        self.sbMemoryBudget.setValue(JESettings.get(JESettingsKey.CONFIG_MEMORY_BUDGET))
+        self.__memory.setBudget(self.sbMemoryBudget.value() * 1048576)
+        self.sbPreviewProxyThreshold.setValue(JESettings.get(JESettingsKey.CONFIG_PREVIEW_PROXY_THRESHOLD))
 
         # window geometry
         sizeW = JESettings.get(JESettingsKey.CONFIG_WINDOW_GEOMETRY_SIZE_WIDTH)
@@ -319,6 +568,12 @@ class JEMainWindow(WEDialog):
         self.wContentOptions.docUpdate.connect(lambda: self.__updateDoc(JEMainWindow.__UPDATE_MODE_CROP))
         self.wContentOptions.sizeUpdate.connect(lambda immediate: self.__updateNewSize(immediate))
         self.wJpegOptions.optionUpdated.connect(self.__updatePreview)
+        self.wJpegOptions.optionUpdated.connect(self.__jpegOptionsUpdated)
+        self.wTargetOptions.targetUpdated.connect(self.__targetOptionsUpdated)
+        self.wSizeCurve.qualityClicked.connect(self.__sizeCurveQualityClicked)
+        self.__targetOptionsUpdated()
+        self.wTargetOptions.searchRequested.connect(self.__searchTargetQuality)
+        self.wTargetOptions.searchMetricRequested.connect(self.__searchTargetMetric)
 
         self.pbOk.clicked.connect(self.__acceptChange)
         self.pbCancel.clicked.connect(self.__rejectChange)
@@ -328,6 +583,17 @@ class JEMainWindow(WEDialog):
         self.rbRenderDifference.toggled.connect(self.__renderModeChanged)
         self.rbRenderXOR.toggled.connect(self.__renderModeChanged)
         self.rbRenderSrc.toggled.connect(self.__renderModeChanged)
+        self.rbRenderErrorMap.toggled.connect(self.__renderModeChanged)
+        self.rbRenderBlockMap.toggled.connect(self.__renderModeChanged)
+        self.cbPreviewInMemory.toggled.connect(self.__previewModeChanged)
+        self.cbPreviewViewport.toggled.connect(self.__previewViewportChanged)
+        self.cbErrorStats.toggled.connect(self.__errorStatsChanged)
+        self.cbExportByStrips.toggled.connect(self.__updateExportWarning)
+        self.cbExportInBackground.toggled.connect(self.__updateExportWarning)
+        self.wJpegOptions.optionUpdated.connect(self.__updateExportWarning)
+        self.wTargetOptions.targetUpdated.connect(self.__updateExportWarning)
+        self.sbMemoryBudget.valueChanged.connect(self.__memoryBudgetChanged)
+        self.sbPreviewProxyThreshold.valueChanged.connect(self.__previewProxyThresholdChanged)
 
         self.lvPages.itemSelectionChanged.connect(self.__pageChanged)
 
@@ -373,11 +639,25 @@ class JEMainWindow(WEDialog):
                 JESettingsKey.CONFIG_MISC_RESIZE_UNIT: data[JESettingsKey.CONFIG_MISC_RESIZE_UNIT.id()]
                 })
 
+        # setups saved with older versions don't have responsive set options
+        self.wContentOptions.setProperties({key: data[key.id()] for key in (JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE,
+                                                                            JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)
+                                            if key.id() in data})
+
         self.wPathOptions.setProperties({
                 JESettingsKey.CONFIG_PATH_TGTMODE: data[JESettingsKey.CONFIG_PATH_TGTMODE.id()],
                 JESettingsKey.CONFIG_PATH_USRPATH: data[JESettingsKey.CONFIG_PATH_USRPATH.id()]
                 })
 
+        # setups saved with older versions don't have target size options
+        self.wTargetOptions.setProperties({key: data[key.id()] for key in (JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE,
+                                                                           JESettingsKey.CONFIG_TARGET_SIZE_VALUE,
+                                                                           JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING,
+                                                                           JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE,
+                                                                           JESettingsKey.CONFIG_TARGET_METRIC_NAME,
+                                                                           JESettingsKey.CONFIG_TARGET_METRIC_VALUE)
+                                           if key.id() in data})
+
     def __setupData(self):
         """Return a dict with current setup data"""
         jpegOptions = self.wJpegOptions.options()
@@ -397,8 +677,16 @@ class JEMainWindow(WEDialog):
                     JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE.id(): self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE),
                     JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH.id(): self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH),
                     JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT.id(): self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT),
+                    JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE.id(): self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE),
+                    JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS.id(): self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS),
                     JESettingsKey.CONFIG_PATH_TGTMODE.id(): self.wPathOptions.property(JESettingsKey.CONFIG_PATH_TGTMODE),
-                    JESettingsKey.CONFIG_PATH_USRPATH.id(): self.wPathOptions.property(JESettingsKey.CONFIG_PATH_USRPATH)
+                    JESettingsKey.CONFIG_PATH_USRPATH.id(): self.wPathOptions.property(JESettingsKey.CONFIG_PATH_USRPATH),
+                    JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE.id(): self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE),
+                    JESettingsKey.CONFIG_TARGET_SIZE_VALUE.id(): self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_VALUE),
+                    JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING.id(): self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING),
+                    JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE.id(): self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE),
+                    JESettingsKey.CONFIG_TARGET_METRIC_NAME.id(): self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_METRIC_NAME),
+                    JESettingsKey.CONFIG_TARGET_METRIC_VALUE.id(): self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_METRIC_VALUE)
                     }
 
         if self.rbRenderNormal.isChecked():
@@ -409,6 +697,10 @@ class JEMainWindow(WEDialog):
             returned[JESettingsKey.CONFIG_RENDER_MODE.id()] = JESettingsValues.RENDER_MODE_DIFFBITS
         elif self.rbRenderSrc.isChecked():
             returned[JESettingsKey.CONFIG_RENDER_MODE.id()] = JESettingsValues.RENDER_MODE_SOURCE
+        elif self.rbRenderErrorMap.isChecked():
+            returned[JESettingsKey.CONFIG_RENDER_MODE.id()] = JESettingsValues.RENDER_MODE_ERRORMAP
+        elif self.rbRenderBlockMap.isChecked():
+            returned[JESettingsKey.CONFIG_RENDER_MODE.id()] = JESettingsValues.RENDER_MODE_BLOCKMAP
 
         return returned
 
@@ -553,23 +845,50 @@ class JEMainWindow(WEDialog):
             return
 
         # update internal document
-        self.__tmpDoc.crop(0, 0, self.__boundsSource.width(), self.__boundsSource.height())
-        self.__tmpDocTgtNode.setPixelData(self.__doc.pixelData(self.__boundsSource.x(),
-                                                               self.__boundsSource.y(),
-                                                               self.__boundsSource.width(),
-                                                               self.__boundsSource.height()),
-                                          0, 0, self.__boundsSource.width(), self.__boundsSource.height())
+        # when crop is toggled or size is modified, source pixels are read from cache
+        revision = self.__docSource.revision()
+        pixels = self.__docSource.pixelData(self.__boundsSource, revision)
+        # manifest of exported file can be recorded only if source is still the same on export
+        self.__tmpDocSourceRevision = revision
+        self.__resizeKey = None
+
         if applyResize:
-            resolution = round(self.__tmpDoc.xRes())
-            self.__tmpDoc.scaleImage(self.__sizeTarget.width(), self.__sizeTarget.height(), resolution, resolution, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_FILTER))
-        self.__tmpDoc.refreshProjection()
+            filterName = self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_FILTER)
+            key = JEResize.key(revision, self.__boundsSource, self.__sizeTarget, filterName)
+
+            resized = self.__resize.get(key)
+            if resized is None:
+                self.__tmpDoc.crop(0, 0, self.__boundsSource.width(), self.__boundsSource.height())
+                self.__tmpDocTgtNode.setPixelData(pixels, 0, 0, self.__boundsSource.width(), self.__boundsSource.height())
+
+                resolution = round(self.__tmpDoc.xRes())
+                if JEResize.available() and filterName not in (JESettingsValues.FILTER_NEAREST_NEIGHBOUR, JESettingsValues.FILTER_BILINEAR):
+                    # fast bilinear resize for preview; selected filter is applied in background
+                    # and result replace bilinear resize once available
+                    self.__tmpDoc.scaleImage(self.__sizeTarget.width(), self.__sizeTarget.height(), resolution, resolution, JESettingsValues.FILTER_BILINEAR)
+                    self.__resizeKey = key
+                    self.__resize.request(key, pixels, self.__boundsSource.size(), self.__tmpDoc.colorDepth(), self.__sizeTarget, filterName)
+                    self.__tmpDocPreviewSrcPixels = None
+                else:
+                    self.__tmpDoc.scaleImage(self.__sizeTarget.width(), self.__sizeTarget.height(), resolution, resolution, filterName)
+                    resized = self.__tmpDocTgtNode.pixelData(0, 0, self.__sizeTarget.width(), self.__sizeTarget.height())
+                    self.__resize.set(key, resized)
+                    self.__tmpDocPreviewSrcPixels = resized
+            else:
+                # already resized
+                self.__tmpDoc.crop(0, 0, self.__sizeTarget.width(), self.__sizeTarget.height())
+                self.__tmpDocTgtNode.setPixelData(resized, 0, 0, self.__sizeTarget.width(), self.__sizeTarget.height())
+                self.__tmpDocPreviewSrcPixels = resized
+        else:
+            self.__tmpDoc.crop(0, 0, self.__boundsSource.width(), self.__boundsSource.height())
+            self.__tmpDocTgtNode.setPixelData(pixels, 0, 0, self.__boundsSource.width(), self.__boundsSource.height())
+            # no resize: source layer use the same pixels than __tmpDoc
+            self.__tmpDocPreviewSrcPixels = pixels
 
-        # force jpeg export from tmpDoc => update preview
-        self.timerEvent(None)
+        if self.__resizeKey is None:
+            self.__resize.cancel()
 
-        self.__tmpDocPreview.crop(0, 0, self.__tmpDoc.width(), self.__tmpDoc.height())
-        self.__tmpDocPreviewSrcNode.setPixelData(self.__tmpDoc.pixelData(0, 0, self.__tmpDoc.width(), self.__tmpDoc.height()), 0, 0, self.__tmpDoc.width(), self.__tmpDoc.height())
-        self.__tmpDocPreview.refreshProjection()
+        self.__tmpDocContentUpdated()
 
         if self.wContentOptions.hasDocSelection() and self.wContentOptions.property(JESettingsKey.CONFIG_MISC_CROP_ACTIVE):
             # crop mode
@@ -587,7 +906,81 @@ class JEMainWindow(WEDialog):
             self.__viewScrollbarH.setSliderPosition(self.__positionFull.x())
             self.__viewScrollbarV.setSliderPosition(self.__positionFull.y())
 
-        self.lblDocDimension.setText(i18n(f"Dimensions: {self.__tmpDoc.width()}x{self.__tmpDoc.height()}"))
+        self.__updateDocDimension()
+
+    def __updateDocDimension(self):
+        """Update document dimensions label"""
+        text = i18n(f"Dimensions: {self.__tmpDoc.width()}x{self.__tmpDoc.height()}")
+        if self.__resizeKey is not None:
+            text += i18n(" (resize in progress)")
+        if self.__previewProxy:
+            size = self.__previewProxySize()
+            text += i18n(f" (preview: {size.width()}x{size.height()})")
+        self.lblDocDimension.setText(text)
+
+    def __tmpDocContentUpdated(self):
+        """Pixels of temporary document have been updated, update preview document and preview"""
+        self.__tmpDocImage = None
+        self.__tmpDocProxyImage = None
+        self.__previewFileOptions = None
+        self.__tmpDoc.refreshProjection()
+
+        self.__updatePreviewProxy()
+        self.__updatePreviewDoc()
+        self.__memory.update()
+
+        if self.wTargetOptions.isActive():
+            # content has been modified, quality for target size need to be searched again
+            # search export files with Krita, that can take a while: it's not made on each
+            # content modification but when user ask for it, or when export is accepted
+            self.__targetSizeSearchNeeded = True
+            self.wTargetOptions.setResult(i18n('Content has been modified, quality will be searched again on export'))
+        elif self.wTargetOptions.isMetricActive():
+            # content has been modified, quality for target image quality need to be searched again
+            # search needs several full image encodes and measures: as for target size, it's made when
+            # user ask for it, or when export is accepted
+            self.__targetMetricSearchNeeded = True
+            self.__targetMetricSearchResult = i18n('Content has been modified, quality will be searched again on export')
+            self.wTargetOptions.setMetricResult(self.__targetMetricSearchResult)
+
+        # force jpeg export from tmpDoc => update preview
+        # (made once preview document has been resized, as in memory mode pixels are directly set to preview layer)
+        self.timerEvent(None)
+
+    def __updatePreviewDoc(self):
+        """Resize preview document according to __tmpDoc (or reduced resolution preview) size,
+        and update its source layer"""
+        size = self.__tmpDocPreviewSize()
+        self.__tmpDocPreview.crop(0, 0, size.width(), size.height())
+        self.__tmpDocPreviewSrcDirty = True
+        self.__updatePreviewSrcNode()
+        self.__tmpDocPreview.refreshProjection()
+
+    def __applyResized(self):
+        """Apply pixels resized in background to temporary document
+
+        Return True if pixels have been applied, otherwise False
+        """
+        if self.__resizeKey is None or self.__tmpDoc is None:
+            return False
+
+        pixels = self.__resize.get(self.__resizeKey)
+        if pixels is None:
+            return False
+
+        self.__resizeKey = None
+        self.__tmpDocTgtNode.setPixelData(pixels, 0, 0, self.__tmpDoc.width(), self.__tmpDoc.height())
+        self.__tmpDocPreviewSrcPixels = pixels
+        return True
+
+    def __resized(self, key):
+        """Resize with selected filter is available, replace fast resize"""
+        if key != self.__resizeKey:
+            return
+
+        if self.__applyResized():
+            self.__tmpDocContentUpdated()
+            self.__updateDocDimension()
 
     def __saveFileName(self):
         """Set exported file name"""
@@ -609,20 +1002,316 @@ class JEMainWindow(WEDialog):
                 self.leFileName.setText(returned['directory'])
                 self.pbOk.setEnabled(True)
 
+    def __updatePreviewSrcNode(self):
+        """Update source layer of preview document, if needed
+
+        Source layer is only visible with difference and source render modes (with
+        other render modes, it's fully covered by opaque JPEG preview); its update is
+        made only when one of these render modes is active
+        """
+        if not self.__tmpDocPreviewSrcDirty or not (self.rbRenderDifference.isChecked() or
+                                                    self.rbRenderXOR.isChecked() or
+                                                    self.rbRenderSrc.isChecked()):
+            return False
+
+        if self.__previewProxy:
+            EKritaNode.fromQImage(self.__tmpDocPreviewSrcNode, self.__tmpDocProxyQImage())
+        else:
+            pixels = self.__tmpDocPreviewSrcPixels
+            if pixels is None:
+                pixels = self.__tmpDoc.pixelData(0, 0, self.__tmpDoc.width(), self.__tmpDoc.height())
+            self.__tmpDocPreviewSrcNode.setPixelData(pixels, 0, 0, self.__tmpDoc.width(), self.__tmpDoc.height())
+        self.__tmpDocPreviewSrcPixels = None
+        self.__tmpDocPreviewSrcDirty = False
+        return True
+
     def __renderModeChanged(self):
         """Render mode has been changed, update blending mode"""
+        previewNode = self.__tmpDocPreviewJpegNode()
+        if previewNode is None:
+            return
+
+        if self.__updatePreviewSrcNode():
+            self.__tmpDocPreview.refreshProjection()
+
+        if self.rbRenderErrorMap.isChecked() or self.rbRenderBlockMap.isChecked():
+            # maps are rendered from last analysis, no need to encode again
+            previewNode.setBlendingMode('normal')
+            previewNode.setVisible(True)
+            self.__initialiseAnalysisNode().setVisible(True)
+            if self.__errorAnalysis is None or (self.rbRenderErrorMap.isChecked() and self.__errorAnalysis['heatmap'] is None):
+                # last preview has been refreshed without needed analysis
+                self.__updatePreview()
+            else:
+                self.__renderErrorAnalysis()
+            return
+        elif self.__tmpDocPreviewAnalysisNode:
+            self.__tmpDocPreviewAnalysisNode.setVisible(False)
+
         if self.rbRenderNormal.isChecked():
-            self.__tmpDocPreviewFileNode.setBlendingMode('normal')
-            self.__tmpDocPreviewFileNode.setVisible(True)
+            previewNode.setBlendingMode('normal')
+            previewNode.setVisible(True)
         elif self.rbRenderDifference.isChecked():
-            self.__tmpDocPreviewFileNode.setBlendingMode('divisive_modulo_continuous')
-            self.__tmpDocPreviewFileNode.setVisible(True)
+            previewNode.setBlendingMode('divisive_modulo_continuous')
+            previewNode.setVisible(True)
         elif self.rbRenderXOR.isChecked():
-            self.__tmpDocPreviewFileNode.setBlendingMode('xor')
-            self.__tmpDocPreviewFileNode.setVisible(True)
+            previewNode.setBlendingMode('xor')
+            previewNode.setVisible(True)
         elif self.rbRenderSrc.isChecked():
-            self.__tmpDocPreviewFileNode.setBlendingMode('normal')
-            self.__tmpDocPreviewFileNode.setVisible(False)
+            previewNode.setBlendingMode('normal')
+            previewNode.setVisible(False)
+
+    def __updateExportWarning(self, value=None):
+        """Display which options are ignored by export mode
+
+        Export by strips and background export are made with in memory encoder, that
+        always use 4:2:0 chroma subsampling and doesn't apply smoothing, ICC profile and
+        metadata
+        """
+        if self.cbExportByStrips.isChecked():
+            mode = i18n('Low memory export')
+        elif self.cbExportInBackground.isChecked():
+            mode = i18n('Background export')
+        else:
+            self.lblExportWarning.setVisible(False)
+            return
+
+        options = self.wJpegOptions.options()
+        ignored = []
+        if options['subsampling'] != JESettingsValues.JPEG_SUBSAMPLING_420:
+            ignored.append(i18n('chroma subsampling (4:2:0 is used)'))
+        if options['smoothing'] > 0:
+            ignored.append(i18n('smoothing'))
+        if options['saveProfile']:
+            ignored.append(i18n('ICC profile'))
+        ignored.append(i18n('metadata'))
+
+        self.lblExportWarning.setText(i18n(f"{mode} uses in memory encoder, ignored options: {', '.join(ignored)}"))
+        self.lblExportWarning.setVisible(True)
+
+    def __errorStatsChanged(self, visible):
+        """Error statistics display has been changed"""
+        self.lblErrorStats.setVisible(visible)
+        self.wErrorHistogram.setVisible(visible)
+        if visible and self.__errorAnalysis is None:
+            # last preview has been refreshed without analysis
+            self.__updatePreview()
+
+    def __errorAnalysisNeeded(self):
+        """Return a tuple (analyse, heatmap)
+
+        Errors are analysed only if error statistics are displayed or if error map or block
+        map render mode is active; heatmap is only needed for error map render mode
+        """
+        if not JEAnalysis.available():
+            return (False, False)
+
+        heatmap = self.rbRenderErrorMap.isChecked()
+        return (heatmap or self.rbRenderBlockMap.isChecked() or self.cbErrorStats.isChecked(), heatmap)
+
+    def __previewModeChanged(self, inMemory):
+        """Preview mode has been changed, rebuild preview layer"""
+        if inMemory:
+            self.__previewMode = JESettingsValues.PREVIEW_MODE_MEMORY
+        else:
+            self.__previewMode = JESettingsValues.PREVIEW_MODE_FILE
+        self.cbPreviewViewport.setEnabled(inMemory)
+
+        if self.__tmpDocPreview is None:
+            # can occurs during initialisation phase
+            return
+
+        self.__initialisePreviewNode()
+        self.__renderModeChanged()
+        self.timerEvent(None)
+
+    def __setPreviewProxy(self, active, budgetExceeded=False):
+        """Activate or deactivate reduced resolution preview
+
+        Reduced resolution preview is only available with in memory preview mode; if
+        preview mode was 'file', it's restored once reduced resolution preview is
+        deactivated
+
+        If `budgetExceeded` is True, reduced resolution preview is activated because
+        memory budget is exceeded: full resolution image of __tmpDoc content is then
+        not used at all (no quality→size curve, no size prediction)
+
+        Preview document is not updated (see __updatePreviewDoc())
+        """
+        budgetExceeded = active and budgetExceeded
+        if budgetExceeded and not self.__previewProxyBudget:
+            self.__tmpDocImage = None
+            self.__previewProxyBudget = budgetExceeded
+
+        if active == self.__previewProxy:
+            return
+
+        self.__previewProxy = active
+        self.__tmpDocImage = None
+        self.__tmpDocProxyImage = None
+        self.__tmpDocPreviewSrcPixels = None
+        self.__errorAnalysis = None
+
+        if active:
+            self.__previewProxyFileMode = (self.__previewMode == JESettingsValues.PREVIEW_MODE_FILE)
+            previewMode = JESettingsValues.PREVIEW_MODE_MEMORY
+        elif self.__previewProxyFileMode:
+            self.__previewProxyFileMode = False
+            previewMode = JESettingsValues.PREVIEW_MODE_FILE
+        else:
+            previewMode = self.__previewMode
+
+        self.cbPreviewInMemory.setEnabled(not active)
+        if previewMode != self.__previewMode:
+            self.__previewMode = previewMode
+            self.cbPreviewInMemory.blockSignals(True)
+            self.cbPreviewInMemory.setChecked(previewMode == JESettingsValues.PREVIEW_MODE_MEMORY)
+            self.cbPreviewInMemory.blockSignals(False)
+            self.cbPreviewViewport.setEnabled(previewMode == JESettingsValues.PREVIEW_MODE_MEMORY)
+            if self.__tmpDocPreview is not None:
+                self.__initialisePreviewNode()
+                self.__renderModeChanged()
+
+        self.__updateDocDimension()
+
+    def __updatePreviewProxy(self):
+        """Activate reduced resolution preview if document size is above threshold, or if
+        full resolution preview doesn't fit in memory budget, otherwise deactivate it
+
+        Must be called once images from __tmpDoc content have been freed
+        """
+        nbPixels = self.__tmpDoc.width() * self.__tmpDoc.height()
+        if self.__previewProxySize() == QSize(self.__tmpDoc.width(), self.__tmpDoc.height()):
+            # document is already small, nothing to reduce
+            self.__setPreviewProxy(False)
+            return
+
+        threshold = self.sbPreviewProxyThreshold.value()
+        thresholdExceeded = threshold > 0 and nbPixels > threshold * 1000000
+
+        # full resolution preview: __tmpDoc content as QImage, plus flattened and decoded images while encoding
+        # reduced resolution preview: __tmpDoc content as QImage only, for quality→size curve and size prediction
+        if thresholdExceeded:
+            required = 4 * nbPixels
+        else:
+            required = 3 * 4 * nbPixels
+        budgetExceeded = not self.__memory.fits(required)
+
+        self.__setPreviewProxy(thresholdExceeded or budgetExceeded, budgetExceeded)
+
+    def __errorAnalysisBytes(self):
+        """Return memory used by last error analysis images, in bytes"""
+        if self.__errorAnalysis is None:
+            return 0
+        return sum(image.sizeInBytes() for image in (self.__errorAnalysis['heatmap'], self.__errorAnalysis['blockmap']) if image is not None)
+
+    def __memoryUpdated(self, current, peak):
+        """Used memory has been calculated, update label"""
+        text = i18n(f"Memory: {bytesSizeToStr(current)} (peak: {bytesSizeToStr(peak)})")
+        if self.__memory.budget() > 0:
+            text += i18n(f", budget: {bytesSizeToStr(self.__memory.budget())}")
+        if self.__previewProxy:
+            text += i18n(" - reduced resolution preview")
+        self.lblMemory.setText(text)
+        self.lblMemory.setToolTip('\n'.join([f"{name}: {bytesSizeToStr(size)}" for name, size in self.__memory.usage().items()]))
+
+    def __memoryBudgetExceeded(self, current):
+        """Memory budget is exceeded even once caches have been evicted, switch to reduced resolution preview
+        without full resolution image"""
+        if self.__previewProxyBudget or self.__tmpDoc is None or self.__tmpDocPreview is None:
+            return
+
+        if self.__previewProxySize() == QSize(self.__tmpDoc.width(), self.__tmpDoc.height()):
+            # document is already small, nothing to reduce
+            return
+
+        self.__sizeCurve.cancel()
+        previewProxy = self.__previewProxy
+        self.__setPreviewProxy(True, True)
+        if not previewProxy:
+            self.__updatePreviewDoc()
+        self.__updatePreview()
+
+    def __memoryBudgetChanged(self, value):
+        """Memory budget has been modified (in MiB, 0 for no limit)"""
+        self.__memory.setBudget(value * 1048576)
+        self.__previewProxyOptionsChanged()
+
+    def __previewProxyThresholdChanged(self, value):
+        """Reduced resolution preview threshold has been modified (in megapixels, 0 for never)"""
+        self.__previewProxyOptionsChanged()
+
+    def __previewProxyOptionsChanged(self):
+        """Memory budget or reduced resolution preview threshold has been modified, update preview if needed"""
+        if self.__tmpDoc is None or self.__tmpDocPreview is None:
+            # can occurs during initialisation phase
+            return
+
+        previewProxy = self.__previewProxy
+        self.__tmpDocImage = None
+        self.__tmpDocProxyImage = None
+        self.__updatePreviewProxy()
+        if previewProxy != self.__previewProxy:
+            self.__updatePreviewDoc()
+        self.__updatePreview()
+        self.__memory.update()
+
+    def __previewViewportChanged(self, viewportOnly):
+        """Visible area only option has been changed, update preview"""
+        self.__previewViewport = viewportOnly
+
+        if self.__tmpDocPreview is None:
+            # can occurs during initialisation phase
+            return
+
+        self.timerEvent(None)
+
+    def __viewportChanged(self, value=None):
+        """Preview view has been scrolled or zoomed
+
+        In visible area only mode, newly visible area need to be encoded
+        """
+        if not self.__previewViewport or self.__previewMode != JESettingsValues.PREVIEW_MODE_MEMORY or self.__tmpDoc is None:
+            return
+
+        if self.__timerPreview != 0:
+            self.killTimer(self.__timerPreview)
+        self.__timerPreview = self.startTimer(JEMainWindow.__UPDATE_DELAY_MEMORY)
+
+    def __viewportRect(self):
+        """Return visible area of preview document, as a QRect (in pixels)
+
+        Area is extended with a margin, aligned on JPEG MCU and limited to document bounds
+        Return None if visible area can't be determined
+        """
+        if (self.__tmpDocPreviewView is None or self.__viewScrollbarH is None or
+           not hasattr(self.__tmpDocPreviewView, 'flakeToImageTransform')):
+            # flakeToImageTransform() is available from Krita 5.0
+            return None
+
+        scrollArea = self.__viewScrollbarH.parentWidget()
+        while scrollArea is not None and not isinstance(scrollArea, QAbstractScrollArea):
+            scrollArea = scrollArea.parentWidget()
+        if scrollArea is None:
+            return None
+
+        canvasToFlake, invertible = self.__tmpDocPreviewView.flakeToCanvasTransform().inverted()
+        if not invertible:
+            return None
+
+        rect = (canvasToFlake * self.__tmpDocPreviewView.flakeToImageTransform()).mapRect(QRectF(scrollArea.viewport().rect())).toAlignedRect()
+
+        # align on MCU: encoded blocks are then the same than the ones from full image
+        mcuSize = JEEncoder.MCU_SIZE
+        margin = JEMainWindow.__VIEWPORT_MARGIN
+        left = max(0, (rect.left() - margin) // mcuSize * mcuSize)
+        top = max(0, (rect.top() - margin) // mcuSize * mcuSize)
+        right = min(self.__tmpDocPreview.width(), math.ceil((rect.right() + 1 + margin) / mcuSize) * mcuSize)
+        bottom = min(self.__tmpDocPreview.height(), math.ceil((rect.bottom() + 1 + margin) / mcuSize) * mcuSize)
+
+        if right <= left or bottom <= top:
+            return None
+        return QRect(left, top, right - left, bottom - top)
 
     def __updatePreview(self, src=None):
         """Update preview, according to current jpeg export settings"""
@@ -631,9 +1320,20 @@ class JEMainWindow(WEDialog):
             self.killTimer(self.__timerPreview)
         # create a new timer, waiting a little bit before rendering preview
         # (avoid to render preview each time a property is modified)
-        self.__timerPreview = self.startTimer(JEMainWindow.__UPDATE_DELAY)
+        if self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY:
+            self.__timerPreview = self.startTimer(JEMainWindow.__UPDATE_DELAY_MEMORY)
+        else:
+            self.__timerPreview = self.startTimer(JEMainWindow.__UPDATE_DELAY)
         self.wsmSetups.setCurrentSetupData(self.__setupData())
 
+        if self.__tmpDoc is not None:
+            self.__updateSizeCurve()
+            if self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY:
+                # size is known from curve, no need to wait for encoding
+                size, exact = self.__sizeCurve.size(self.wJpegOptions.options()['quality'])
+                if exact:
+                    self.lblEstSize.setText(self.__estimatedSizeText(size, True))
+
     def timerEvent(self, event):
         """Update preview when timer is triggered"""
         if event is None or event.timerId() == self.__timerPreview:
@@ -641,28 +1341,47 @@ class JEMainWindow(WEDialog):
             self.killTimer(self.__timerPreview)
             self.__timerPreview = 0
 
-            self.lblEstSize.setText(i18n('Estimated file size: (calculating)'))
-            QApplication.setOverrideCursor(Qt.WaitCursor)
-            QApplication.processEvents()
-            self.__tmpDoc.exportImage(self.__tmpExportFile, self.wJpegOptions.options(True))
+            self.__updateSizeCurve()
 
-            if self.__tmpDocPreviewFileNode:
-                # force file to be reloaded, but it's made asynchronously
-                self.__tmpDocPreviewFileNode.resetCache()
+            analyse, heatmap = self.__errorAnalysisNeeded()
+            if not analyse:
+                # analysis from previous preview is not valid anymore
+                self.__errorAnalysis = None
 
-                # the waitForDone() does nothing in this case, reset is still made asynchronously....
-                self.__tmpDocPreview.waitForDone()
-                # ...so the dirty solution: put a one second sleep :-/
-                # it doesn't fix the problem (1250ms could be too long or too short, according to computer and image size)
-                # but that's better than nothing
-                Timer.sleep(1250)
+            size, exact = self.__sizeCurve.size(self.wJpegOptions.options()['quality'])
+            if not (exact and self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY):
+                # size is not known from curve, estimate it
+                self.__updateEstimatedSizePrediction()
 
-            try:
-                size = os.path.getsize(self.__tmpExportFile)
-                self.lblEstSize.setText(i18n(f'Estimated file size: {bytesSizeToStr(size)}'))
-            except Exception as e:
-                self.lblEstSize.setText(i18n('Estimated file size: unable to calculate'))
+            if self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY:
+                # asynchronous: result is returned to __previewEncoded()
+                Stopwatch.start('jeMainWindow.previewRefresh')
+                self.__refreshPreviewMemory()
+                return
 
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            QApplication.processEvents()
+
+            # file preview mode use Krita's API, that can't be used outside GUI thread
+            self.__previewScheduler.cancel()
+            Stopwatch.start('jeMainWindow.previewRefresh')
+            size = self.__refreshPreviewFile()
+            Stopwatch.stop('jeMainWindow.previewRefresh')
+            self.__updateEstimatedSize(size)
+
+            if size is not None and analyse:
+                # no thread here: analyse from exported file
+                image = QImage(self.__tmpExportFile).convertToFormat(QImage.Format_ARGB32)
+                source = JEEncoder.flatten(self.__tmpDocQImage(), self.wJpegOptions.options()['transparencyFillcolor']).convertToFormat(QImage.Format_RGB32)
+                if not image.isNull() and image.size() == source.size():
+                    # blocks are aligned on MCU, that depends of chroma subsampling
+                    if self.wJpegOptions.options()['subsampling'] == JESettingsValues.JPEG_SUBSAMPLING_444:
+                        blockSize = 8
+                    else:
+                        blockSize = 16
+                    self.__updateErrorAnalysis(JEAnalysis.errorAnalysis(source, image, heatmap=heatmap, blockSize=blockSize))
+
+            self.__memory.update()
             QApplication.restoreOverrideCursor()
         elif event.timerId() == self.__timerResize:
             # it's a timer resize; update resize
@@ -670,6 +1389,479 @@ class JEMainWindow(WEDialog):
             self.__timerResize = 0
             self.__updateDoc(JEMainWindow.__UPDATE_MODE_RESIZE)
 
+    def __updateSizeCurve(self):
+        """Start calculation of quality→size curve for current content and options, if not already done"""
+        options = self.wJpegOptions.options()
+        if self.__previewProxyBudget:
+            # curve need full resolution image: not available when memory budget is exceeded
+            self.__sizeCurve.cancel()
+            self.wSizeCurve.setSizes({})
+            self.wSizeCurve.setQuality(options['quality'])
+            return
+
+        # image digest is calculated by curve, in background
+        self.__sizeCurve.compute(self.__tmpDocQImage(), options)
+        self.wSizeCurve.setApproximate(not self.__qtEncoderMatchesOptions())
+        self.wSizeCurve.setQuality(options['quality'])
+
+    def __sizeCurveQualityClicked(self, quality):
+        """A quality has been clicked on quality→size curve, apply it to JPEG options"""
+        options = self.wJpegOptions.options()
+        options['quality'] = quality
+        self.wJpegOptions.setOptions(options)
+
+    def __sizeCurveUpdated(self, key):
+        """A size has been calculated for quality→size curve"""
+        if key != self.__sizeCurve.currentKey():
+            return
+        self.wSizeCurve.setSizes(self.__sizeCurve.sizes())
+
+        if self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY and (self.__previewRegion is not None or self.__previewProxy):
+            # visible area only or reduced resolution: encoded size can't be used, exact size is provided by curve
+            size, exact = self.__sizeCurve.size(self.wJpegOptions.options()['quality'])
+            if exact:
+                self.lblEstSize.setText(self.__estimatedSizeText(size, True))
+
+    def __targetOptionsUpdated(self):
+        """Target size options have been modified"""
+        if self.wTargetOptions.isActive():
+            self.wSizeCurve.setTargetSize(self.wTargetOptions.targetSize())
+        else:
+            self.wSizeCurve.setTargetSize(None)
+        self.wsmSetups.setCurrentSetupData(self.__setupData())
+
+        if self.wTargetOptions.isActive():
+            # target size or subsampling rule may have been modified (or target size has been activated)
+            self.__targetSizeSearchNeeded = True
+            self.wTargetOptions.setResult(i18n('Quality for target size will be searched on export'))
+        elif self.wTargetOptions.isMetricActive():
+            # metric or threshold may have been modified (or target image quality has been activated)
+            self.__targetMetricSearchNeeded = True
+            self.__targetMetricSearchResult = i18n('Quality for target image quality will be searched on export')
+            self.wTargetOptions.setMetricResult(self.__targetMetricSearchResult)
+
+    def __targetSizeOptions(self):
+        """Return current JPEG options that affect file size for a given quality (quality excluded)"""
+        return {key: value for key, value in self.wJpegOptions.options().items() if key != 'quality'}
+
+    def __jpegOptionsUpdated(self):
+        """JPEG options have been modified from user interface"""
+        if self.wTargetOptions.isActive() and self.__targetSizeOptions() != self.__targetSizeSearchOptions:
+            # progressive, optimize, subsampling... modify file size: quality for target size need
+            # to be searched again
+            # (quality modification doesn't invalidate search, user can choose a lower quality)
+            self.__targetSizeSearchNeeded = True
+            self.wTargetOptions.setResult(i18n('Options have been modified, quality will be searched again on export'))
+
+    def __updateEstimatedSizePrediction(self):
+        """Update estimated size label with a fast prediction, while exact size is calculated"""
+        if self.__previewProxyBudget:
+            # full resolution image is not available when memory budget is exceeded: sampled tiles
+            # are read from temporary document, and as there's no full resolution encode, estimated
+            # size is final
+            estimate = JEEncoder.estimateSizeFromTiles(self.__tmpDoc.width(),
+                                                       self.__tmpDoc.height(),
+                                                       lambda rect: self.__tmpDoc.projection(rect.x(), rect.y(), rect.width(), rect.height()),
+                                                       self.wJpegOptions.options())
+            if estimate is None:
+                self.lblEstSize.setText(i18n('Estimated file size: unknown'))
+            else:
+                size, margin = estimate
+                self.lblEstSize.setText(i18n(f'Estimated file size: ~{bytesSizeToStr(size)} (±{bytesSizeToStr(margin)}, from sampled tiles)'))
+            return
+
+        estimate = JEEncoder.estimateSize(self.__tmpDocQImage(), self.wJpegOptions.options())
+        if estimate is None:
+            self.lblEstSize.setText(i18n('Estimated file size: (calculating)'))
+        else:
+            size, margin = estimate
+            self.lblEstSize.setText(i18n(f'Estimated file size: ~{bytesSizeToStr(size)} (±{bytesSizeToStr(margin)}, calculating)'))
+        QApplication.processEvents()
+
+    def __qtEncoderMatchesOptions(self):
+        """Return True if sizes calculated with in memory (Qt) encoder can be used as final file size
+        for current options
+
+        Qt encoder always use 4:2:0 chroma subsampling, and ignore smoothing and ICC profile
+        options, that are only applied by Krita's exporter
+        """
+        options = self.wJpegOptions.options()
+        return (options['subsampling'] == JESettingsValues.JPEG_SUBSAMPLING_420 and
+                options['smoothing'] == 0 and
+                not options['saveProfile'])
+
+    def __estimatedSizeText(self, size, qtEncoded=False):
+        """Return estimated size label text for given `size` (in bytes)
+
+        If `qtEncoded` is True (size calculated with in memory encoder) and current options are
+        not supported by in memory encoder, size is displayed as approximate
+        """
+        if qtEncoded and not self.__qtEncoderMatchesOptions():
+            return i18n(f'Estimated file size: ~{bytesSizeToStr(size)} (approximate, fast preview encoder)')
+        return i18n(f'Estimated file size: {bytesSizeToStr(size)}')
+
+    def __updateEstimatedSize(self, size, qtEncoded=False):
+        """Update estimated size label with given `size` (in bytes, None if unknown)
+
+        Given `qtEncoded` is True if size has been calculated with in memory encoder
+        """
+        self.__previewRefreshDuration = round(1000 * Stopwatch.duration('jeMainWindow.previewRefresh'))
+
+        if size is None:
+            self.lblEstSize.setText(i18n('Estimated file size: unable to calculate'))
+        else:
+            self.lblEstSize.setText(self.__estimatedSizeText(size, qtEncoded))
+        self.lblEstSize.setToolTip(i18n(f'Preview refreshed in {self.__previewRefreshDuration}ms'))
+
+    def __refreshPreviewFile(self):
+        """Export __tmpDoc as JPEG file and reload preview file layer
+
+        Return size of exported file, or None if file can't be exported
+        """
+        self.__exportPreviewFile()
+
+        try:
+            with open(self.__tmpExportFile, 'rb') as fHandle:
+                data = fHandle.read()
+        except Exception:
+            return None
+
+        # if exported file is strictly the same than the one already loaded in
+        # file layer, there's nothing to reload
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if self.__tmpDocPreviewFileNode and digest != self.__previewFileDigest:
+            self.__reloadPreviewFileNode()
+        self.__previewFileDigest = digest
+
+        return len(data)
+
+    def __exportPreviewFile(self):
+        """Export __tmpDoc as JPEG file used for preview, with current options"""
+        options = self.wJpegOptions.options()
+        self.__tmpDoc.exportImage(self.__tmpExportFile, self.wJpegOptions.options(True))
+        self.__previewFileOptions = options
+
+    def __previewFileNodeSamples(self):
+        """Return a list of pixels blocks sampled from preview file layer
+
+        Blocks are regularly distributed over preview document
+        """
+        sampleSize = JEMainWindow.__PREVIEW_READY_SAMPLE_SIZE
+        width = self.__tmpDocPreview.width()
+        height = self.__tmpDocPreview.height()
+        stepX = max(sampleSize, width // JEMainWindow.__PREVIEW_READY_SAMPLES)
+        stepY = max(sampleSize, height // JEMainWindow.__PREVIEW_READY_SAMPLES)
+
+        return [bytes(self.__tmpDocPreviewFileNode.pixelData(x, y, sampleSize, sampleSize))
+                for y in range(stepY // 2, height, stepY)
+                for x in range(stepX // 2, width, stepX)]
+
+    def __reloadPreviewFileNode(self):
+        """Reload preview file layer and wait until reload is finished
+
+        File layer reload is made asynchronously by Krita, and document waitForDone()
+        doesn't wait for it; as there's no signal to know when reload is done, some
+        pixels blocks are sampled before reload and file layer is considered reloaded
+        once sampled pixels have been modified and are not modified anymore during
+        __PREVIEW_READY_STABLE consecutive checks (reload can be made progressively,
+        first modification doesn't mean reload is finished)
+
+        If sampled pixels are not modified (changes in JPEG are outside sampled blocks)
+        stop waiting after a maximum delay
+        """
+        samples = self.__previewFileNodeSamples()
+
+        # force file to be reloaded, but it's made asynchronously
+        self.__tmpDocPreviewFileNode.resetCache()
+
+        timeout = JEMainWindow.__PREVIEW_READY_TIMEOUT / 1000
+        modified = False
+        stable = 0
+
+        Stopwatch.start('jeMainWindow.previewFileReload')
+        while Stopwatch.duration('jeMainWindow.previewFileReload') < timeout:
+            # let Krita process file layer reload
+            Timer.sleep(JEMainWindow.__PREVIEW_READY_POLL)
+            currentSamples = self.__previewFileNodeSamples()
+            if currentSamples != samples:
+                modified = True
+                stable = 0
+                samples = currentSamples
+            elif modified:
+                stable += 1
+                if stable >= JEMainWindow.__PREVIEW_READY_STABLE:
+                    break
+        Stopwatch.stop('jeMainWindow.previewFileReload')
+
+        # file layer is reloaded, now wait for preview projection update
+        self.__tmpDocPreview.waitForDone()
+
+    def __refreshPreviewMemory(self):
+        """Request encoding of __tmpDoc as JPEG in memory
+
+        Nothing is written on disk, and there's no file layer to reload; encoding
+        and decoding are made outside GUI thread, and preview layer pixels are
+        updated from __previewEncoded() once done
+
+        If a previous request is still in progress, its result will be ignored
+
+        In visible area only mode, only visible area is encoded
+        """
+        image = self.__tmpDocPreviewQImage()
+        analyse, heatmap = self.__errorAnalysisNeeded()
+
+        region = None
+        if self.__previewViewport:
+            region = self.__viewportRect()
+            if region == image.rect():
+                # everything is visible
+                region = None
+
+        if region is None:
+            self.__previewRegion = None
+            metric = None
+            if self.wTargetOptions.isMetricActive() and not self.__previewProxy:
+                # similarity with current quality is measured with encode, outside GUI thread
+                metric = self.wTargetOptions.metric()
+            self.__previewScheduler.request(image, self.wJpegOptions.options(), analyse, heatmap, metric)
+        else:
+            self.__previewRegion = (self.__previewScheduler.request(image.copy(region), self.wJpegOptions.options(), analyse, heatmap), region)
+        self.__memory.update()
+
+    def __previewEncoded(self, generation, size, image, analysis, metricValue):
+        """Latest requested in memory encoding is available, update preview layer pixels and error analysis"""
+        if self.__tmpDocPreview is None or self.__previewMode != JESettingsValues.PREVIEW_MODE_MEMORY:
+            # document closed or preview mode changed while encoding
+            return
+
+        if size < 0:
+            self.__updateEstimatedSize(None)
+            return
+
+        region = None
+        if self.__previewRegion is not None and self.__previewRegion[0] == generation:
+            region = self.__previewRegion[1]
+
+        if self.__tmpDocPreviewMemNode and not image.isNull():
+            if region is None:
+                EKritaNode.fromQImage(self.__tmpDocPreviewMemNode, image)
+            else:
+                EKritaNode.fromQImage(self.__tmpDocPreviewMemNode, image, region.topLeft())
+            self.__tmpDocPreview.refreshProjection()
+
+        if metricValue is not None and self.wTargetOptions.isMetricActive() and region is None and not self.__previewProxy:
+            self.__updateTargetMetricCurrent(metricValue)
+
+        if analysis is not None:
+            self.__updateErrorAnalysis(analysis, region)
+
+        Stopwatch.stop('jeMainWindow.previewRefresh')
+        if region is None and not self.__previewProxy:
+            self.__updateEstimatedSize(size, True)
+        elif region is None and self.__previewProxyBudget:
+            # encoded size is the reduced resolution size and curve is not available: file size
+            # estimated from sampled tiles is kept (see __updateEstimatedSizePrediction())
+            self.__previewRefreshDuration = round(1000 * Stopwatch.duration('jeMainWindow.previewRefresh'))
+            self.lblEstSize.setToolTip(i18n(f'Preview (reduced resolution) refreshed in {self.__previewRefreshDuration}ms'))
+        else:
+            # encoded size is the visible area or reduced resolution size: file size is provided by
+            # quality→size curve (calculated in background from full resolution image)
+            size, exact = self.__sizeCurve.size(self.wJpegOptions.options()['quality'])
+            if exact:
+                self.__updateEstimatedSize(size, True)
+            else:
+                self.__previewRefreshDuration = round(1000 * Stopwatch.duration('jeMainWindow.previewRefresh'))
+                if region is None:
+                    self.lblEstSize.setToolTip(i18n(f'Preview (reduced resolution) refreshed in {self.__previewRefreshDuration}ms'))
+                else:
+                    self.lblEstSize.setToolTip(i18n(f'Preview (visible area) refreshed in {self.__previewRefreshDuration}ms'))
+
+        self.__memory.update()
+
+    def __updateErrorAnalysis(self, analysis, rect=None):
+        """Update error statistics and histograms from given error `analysis`
+
+        Given `rect` define analysed area of preview document; if None, full document
+        has been analysed
+
+        Heatmap and block map are rendered only if their render mode is active
+        """
+        if rect is None:
+            rect = QRect(0, 0, self.__tmpDocPreview.width(), self.__tmpDocPreview.height())
+        self.__errorAnalysis = analysis
+        self.__errorAnalysisRect = rect
+        self.__errorAnalysisRendered = None
+
+        if analysis['psnr'] == math.inf:
+            psnr = i18n('∞')
+        else:
+            psnr = f"{analysis['psnr']:.2f}dB"
+        worstBlock = analysis['worstBlock'].translated(rect.topLeft())
+        self.lblErrorStats.setText(i18n(f"Error: max {analysis['maxError']}, mean {analysis['meanError']:.3f}, PSNR {psnr}\n"
+                                        f"Worst {analysis['blockSize']}x{analysis['blockSize']} block at ({worstBlock.x()}, {worstBlock.y()})"))
+        self.wErrorHistogram.setHistograms(analysis['histograms'], analysis['maxError'])
+
+        if self.rbRenderErrorMap.isChecked() or self.rbRenderBlockMap.isChecked():
+            self.__renderErrorAnalysis()
+
+    def __renderErrorAnalysis(self):
+        """Render last error analysis heatmap or block map (according to render mode) in
+        analysis layer, if not already done
+        """
+        if self.rbRenderBlockMap.isChecked():
+            renderMode = JESettingsValues.RENDER_MODE_BLOCKMAP
+        else:
+            renderMode = JESettingsValues.RENDER_MODE_ERRORMAP
+
+        if self.__errorAnalysis is None or self.__tmpDocPreview is None or self.__errorAnalysisRendered == renderMode:
+            return
+
+        node = self.__initialiseAnalysisNode()
+        if renderMode == JESettingsValues.RENDER_MODE_BLOCKMAP:
+            # block map is not scaled to full resolution: only rows of blocks with an error
+            # greater than threshold are rendered, other blocks are transparent
+            self.__clearAnalysisNode()
+            for rect, image in JEAnalysis.blockmapRows(self.__errorAnalysis['blockmap'],
+                                                       self.__errorAnalysis['blockSize'],
+                                                       self.__errorAnalysisRect.width(),
+                                                       self.__errorAnalysisRect.height()):
+                rect.translate(self.__errorAnalysisRect.topLeft())
+                EKritaNode.fromQImage(node, image, rect.topLeft())
+                self.__errorAnalysisPainted.append(rect)
+        elif self.__errorAnalysis['heatmap'] is not None:
+            # heatmap replace all pixels of analysed area
+            self.__clearAnalysisNode(self.__errorAnalysisRect)
+            EKritaNode.fromQImage(node, self.__errorAnalysis['heatmap'], self.__errorAnalysisRect.topLeft())
+            self.__errorAnalysisPainted.append(QRect(self.__errorAnalysisRect))
+        else:
+            return
+
+        self.__tmpDocPreview.refreshProjection()
+        self.__errorAnalysisRendered = renderMode
+
+    def __clearAnalysisNode(self, keptRect=None):
+        """Clear pixels rendered in analysis layer
+
+        Areas included in given `keptRect` are not cleared (they'll be replaced)
+        """
+        for rect in self.__errorAnalysisPainted:
+            if keptRect is None or not keptRect.contains(rect):
+                self.__tmpDocPreviewAnalysisNode.setPixelData(QByteArray(rect.width() * rect.height() * 4, b'\0'), rect.x(), rect.y(), rect.width(), rect.height())
+        self.__errorAnalysisPainted = []
+
+    def __searchTargetQuality(self):
+        """Search highest JPEG quality for which exported file fits in target file size,
+        and apply it to JPEG options
+
+        Search is made in two steps:
+        - a fast search from encodes made in memory, in parallel
+        - as in memory encoder doesn't support all options (subsampling, smoothing, ICC profile),
+          found quality is then verified and refined from files exported by Krita
+        """
+        if self.__tmpDoc is None:
+            return
+
+        targetSize = self.wTargetOptions.targetSize()
+        options = self.wJpegOptions.options()
+
+        subsamplings = [options['subsampling']]
+        if self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING):
+            subsamplings += [subsampling for subsampling in (JESettingsValues.JPEG_SUBSAMPLING_422, JESettingsValues.JPEG_SUBSAMPLING_420)
+                             if subsampling < options['subsampling']]
+
+        self.wTargetOptions.setResult(i18n('Searching quality...'))
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        QApplication.processEvents()
+
+        nbEncodes = 0
+        nbExports = 0
+        found = None
+        self.__targetSizeQtQuality = None
+        search = JEEncoder.searchQuality(self.__tmpDocQImage(), options, targetSize)
+        if search is not None:
+            nbEncodes = search['encodes']
+            # exact for in memory encoder, used by export by strips and background export
+            self.__targetSizeQtQuality = search['quality'] or 1
+            for subsampling in subsamplings:
+                quality, size, exports = self.__searchTargetQualityExport(subsampling, search['quality'] or 1, targetSize)
+                nbExports += exports
+                # keep highest quality; for same quality, keep highest subsampling (first tested)
+                if quality is not None and (found is None or quality > found[0]):
+                    found = (quality, subsampling, size)
+
+        if os.path.isfile(self.__tmpSearchFile):
+            os.remove(self.__tmpSearchFile)
+
+        if found is None:
+            self.wTargetOptions.setResult(i18n(f'Unable to fit in {bytesSizeToStr(targetSize)}, even with lowest quality '
+                                               f'({nbEncodes} encodes in memory, {nbExports} exports)'))
+        else:
+            options['quality'], options['subsampling'], size = found
+            self.wJpegOptions.setOptions(options)
+            self.wTargetOptions.setResult(i18n(f'Quality {options["quality"]}, subsampling {JEMainWindow.__SUBSAMPLING_LABELS[options["subsampling"]]}: '
+                                               f'{bytesSizeToStr(size)} ({nbEncodes} encodes in memory, {nbExports} exports)'))
+
+        # applied options are the reference for next modifications
+        # (made after options have been applied, as applying them emit update signals)
+        self.__targetSizeSearchNeeded = False
+        self.__targetSizeSearchOptions = self.__targetSizeOptions()
+
+        QApplication.restoreOverrideCursor()
+
+    def __searchTargetMetric(self):
+        """Search lowest JPEG quality for which similarity between source and JPEG image
+        is greater or equal than target image quality, and apply it to JPEG options
+
+        Similarity is measured from in memory encoder
+        """
+        if self.__tmpDoc is None or not JEAnalysis.available():
+            return
+
+        metric = self.wTargetOptions.metric()
+        threshold = self.wTargetOptions.metricThreshold()
+        label = WJETargetOptions.METRICS[metric][0]
+        options = self.wJpegOptions.options()
+
+        self.wTargetOptions.setMetricResult(i18n('Searching quality...'))
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        QApplication.processEvents()
+
+        search = JEAnalysis.searchQuality(self.__tmpDocQImage(), options, metric, threshold)
+
+        if search is None:
+            self.__targetMetricSearchResult = i18n('Unable to encode image')
+        elif search['quality'] is None:
+            self.__targetMetricSearchResult = i18n(f"Unable to reach {label} {threshold}, even with highest quality ({search['encodes']} encodes)")
+        else:
+            options['quality'] = search['quality']
+            self.wJpegOptions.setOptions(options)
+            self.__targetMetricSearchResult = i18n(f"Quality {search['quality']}: {label} {search['value']:.4f} ({search['encodes']} encodes)")
+            if options['smoothing'] > 0:
+                # in memory encoder doesn't apply smoothing: exported file is more blurred than measured one
+                self.__targetMetricSearchResult += '\n' + i18n('Smoothing is not applied while measuring: exported file quality will be lower')
+        self.wTargetOptions.setMetricResult(self.__targetMetricSearchResult)
+        self.__targetMetricSearchNeeded = False
+
+        QApplication.restoreOverrideCursor()
+
+    def __updateTargetMetricCurrent(self, value):
+        """Display given similarity `value` between source and JPEG encoded image, measured with current quality"""
+        metric = self.wTargetOptions.metric()
+        text = i18n(f"Current quality: {WJETargetOptions.METRICS[metric][0]} {value:.4f}")
+        if self.__targetMetricSearchResult != '':
+            text = f'{self.__targetMetricSearchResult}\n{text}'
+        self.wTargetOptions.setMetricResult(text)
+
+    def __searchTargetQualityExport(self, subsampling, quality, targetSize):
+        """Search, from files exported by Krita, highest JPEG quality for given `subsampling`
+        for which file size is less or equal than `targetSize`
+
+        See JEExporter.searchQualityExport()
+        """
+        infoObject = self.wJpegOptions.options(True)
+        infoObject.setProperty('subsampling', subsampling)
+        return JEExporter.searchQualityExport(self.__tmpDoc, infoObject, quality, targetSize, self.__tmpSearchFile)
+
     def __imageClosed(self, docName):
         """A view has been closed; check if it's one of view used for documents"""
         if docName == self.__tmpExportPreviewFile:
@@ -678,6 +1870,8 @@ class JEMainWindow(WEDialog):
             # valid anymore, must define pointer to None
             self.__tmpDocPreview = None
             self.__tmpDocPreviewFileNode = None
+            self.__tmpDocPreviewMemNode = None
+            self.__tmpDocPreviewAnalysisNode = None
             self.__closeDocPreview(True)
             self.__rejectChange()
         elif docName == self.__docFileName:
@@ -699,6 +1893,13 @@ class JEMainWindow(WEDialog):
         # do export
         self.__accepted = True
 
+        if self.wTargetOptions.isActive() and self.__targetSizeSearchNeeded:
+            # content has been modified since last search
+            self.__searchTargetQuality()
+        elif self.wTargetOptions.isMetricActive() and self.__targetMetricSearchNeeded:
+            # content or target image quality has been modified since last search
+            self.__searchTargetMetric()
+
         # save export preferences
         options = self.wJpegOptions.options()
 
@@ -727,6 +1928,22 @@ class JEMainWindow(WEDialog):
             JESettings.set(JESettingsKey.CONFIG_RENDER_MODE, JESettingsValues.RENDER_MODE_DIFFBITS)
         elif self.rbRenderSrc.isChecked():
             JESettings.set(JESettingsKey.CONFIG_RENDER_MODE, JESettingsValues.RENDER_MODE_SOURCE)
+        elif self.rbRenderErrorMap.isChecked():
+            JESettings.set(JESettingsKey.CONFIG_RENDER_MODE, JESettingsValues.RENDER_MODE_ERRORMAP)
+        elif self.rbRenderBlockMap.isChecked():
+            JESettings.set(JESettingsKey.CONFIG_RENDER_MODE, JESettingsValues.RENDER_MODE_BLOCKMAP)
+
+        if self.__previewProxyFileMode:
+            # in memory preview mode has been forced by reduced resolution preview
+            JESettings.set(JESettingsKey.CONFIG_PREVIEW_MODE, JESettingsValues.PREVIEW_MODE_FILE)
+        else:
+            JESettings.set(JESettingsKey.CONFIG_PREVIEW_MODE, self.__previewMode)
+        JESettings.set(JESettingsKey.CONFIG_PREVIEW_VIEWPORT, self.__previewViewport)
+        JESettings.set(JESettingsKey.CONFIG_PREVIEW_ERRORSTATS, self.cbErrorStats.isChecked())
+        JESettings.set(JESettingsKey.CONFIG_EXPORT_STRIPS, self.cbExportByStrips.isChecked())
+        JESettings.set(JESettingsKey.CONFIG_EXPORT_QUEUE, self.cbExportInBackground.isChecked())
+        JESettings.set(JESettingsKey.CONFIG_MEMORY_BUDGET, self.sbMemoryBudget.value())
+        JESettings.set(JESettingsKey.CONFIG_PREVIEW_PROXY_THRESHOLD, self.sbPreviewProxyThreshold.value())
 
         JESettings.set(JESettingsKey.CONFIG_MISC_CROP_ACTIVE, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_CROP_ACTIVE))
         JESettings.set(JESettingsKey.CONFIG_MISC_RESIZE_ACTIVE, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_ACTIVE))
@@ -735,6 +1952,8 @@ class JEMainWindow(WEDialog):
         JESettings.set(JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE))
         JESettings.set(JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH))
         JESettings.set(JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT))
+        JESettings.set(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE))
+        JESettings.set(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS, self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS))
 
         JESettings.setTxtColorPickerLayout(self.wsmSetups.propertiesEditorColorPickerLayout())
         JESettings.set(JESettingsKey.CONFIG_SETUPMANAGER_LASTFILE, self.wsmSetups.lastFileName())
@@ -746,10 +1965,22 @@ class JEMainWindow(WEDialog):
         JESettings.set(JESettingsKey.CONFIG_PATH_TGTMODE, self.wPathOptions.property(JESettingsKey.CONFIG_PATH_TGTMODE))
         JESettings.set(JESettingsKey.CONFIG_PATH_USRPATH, self.wPathOptions.property(JESettingsKey.CONFIG_PATH_USRPATH))
 
+        JESettings.set(JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE, self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE))
+        JESettings.set(JESettingsKey.CONFIG_TARGET_SIZE_VALUE, self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_VALUE))
+        JESettings.set(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING, self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING))
+        JESettings.set(JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE, self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE))
+        JESettings.set(JESettingsKey.CONFIG_TARGET_METRIC_NAME, self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_METRIC_NAME))
+        JESettings.set(JESettingsKey.CONFIG_TARGET_METRIC_VALUE, self.wTargetOptions.property(JESettingsKey.CONFIG_TARGET_METRIC_VALUE))
+
         JESettings.save()
 
         self.wsmSetups.saveSetup(self.wsmSetups.lastFileName())
 
+        if self.cbWatch.isChecked() and self.__doc.fileName() != '':
+            JEWatch.instance().watch(self.__doc, self.__setupData(), self.leFileName.text())
+        else:
+            JEWatch.instance().unwatch(self.__doc)
+
         self.close()
 
     def __displayAbout(self):
@@ -780,24 +2011,171 @@ class JEMainWindow(WEDialog):
         if self.__timerPreview != 0:
             self.killTimer(self.__timerPreview)
 
+        # ignore any in progress preview encoding
+        self.__previewScheduler.cancel()
+        self.__previewScheduler.waitForDone()
+        self.__sizeCurve.cancel()
+
+        filterName = self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESIZE_FILTER)
+        exportByStrips = (self.__accepted and
+                          self.cbExportByStrips.isChecked() and
+                          JEStripExporter.available(self.__boundsSource, self.__sizeTarget, filterName))
+        # in background export mode, only a snapshot of exported image is taken: file is
+        # encoded and written by export queue
+        # (export by strips is made from source document, and can't be made in background)
+        exportInBackground = (self.__accepted and not exportByStrips and self.cbExportInBackground.isChecked())
+        responsiveActive = self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE)
+        # options used by in memory encoder (export by strips, background export)
+        encoderOptions = self.wJpegOptions.options()
+
+        # final JPEG file is written in target directory with a temporary name, and then renamed:
+        # rename is immediate, and a partially written target file is never left behind
+        exportFile = self.__tmpExportFile
+        if self.__accepted:
+            exportFile = self.__exportTmpFileName(self.leFileName.text())
+
+        resized = False
+        if self.__accepted and self.__resizeKey is not None and not exportByStrips:
+            # resize with selected filter not yet applied: wait for it
+            self.__resize.waitForDone()
+            resized = self.__applyResized()
+            if resized:
+                self.__tmpDoc.refreshProjection()
+        self.__resize.cancel()
+        self.__resize.waitForDone()
+        self.__resize.clear()
+
+        if self.__docSource:
+            # free cached source pixels
+            self.__docSource.clear()
+
         self.__closeDocPreview(False)
 
+        # background export snapshot and responsive set are produced from exported image, read
+        # once from temporary document
+        # (not available for export by strips, that never read full exported image)
+        exportedImage = None
+        if self.__accepted and self.__tmpDoc and not exportByStrips and (exportInBackground or responsiveActive):
+            exportedImage = self.__tmpDocQImage()
+
+        if self.__accepted and (exportByStrips or exportInBackground) and self.wTargetOptions.isActive():
+            # file is encoded with in memory encoder: quality for target file size is the one found
+            # from in memory encodes, not the one refined from files exported by Krita
+            if exportInBackground and resized:
+                # selected resize filter has been applied after search: search again from exported image
+                search = JEEncoder.searchQuality(exportedImage, encoderOptions, self.wTargetOptions.targetSize())
+                if search is not None:
+                    self.__targetSizeQtQuality = search['quality'] or 1
+            if self.__targetSizeQtQuality is not None:
+                encoderOptions['quality'] = self.__targetSizeQtQuality
+
         if self.__tmpDoc:
+            if self.__accepted and not exportByStrips and not exportInBackground:
+                if (self.__previewMode == JESettingsValues.PREVIEW_MODE_MEMORY or resized or not os.path.isfile(self.__tmpExportFile) or
+                   self.__previewFileOptions != self.wJpegOptions.options()):
+                    # in memory preview mode, JPEG file has not been exported yet
+                    # (or file exported for preview doesn't contain final resize, or has been exported
+                    # with other options: preview update is pending, or quality has been modified by
+                    # target file size search on accept)
+                    self.__tmpDoc.exportImage(exportFile, self.wJpegOptions.options(True))
+                elif exportFile != self.__tmpExportFile:
+                    # file exported for preview is the final one
+                    try:
+                        shutil.move(self.__tmpExportFile, exportFile)
+                    except Exception as e:
+                        print(e)
             self.__tmpDoc.close()
             self.__tmpDoc.waitForDone()
             self.__tmpDoc = None
 
+        if exportByStrips:
+            # temporary documents are closed: export from source document with a low memory usage
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            size = JEStripExporter.export(self.__doc, self.__boundsSource, self.__sizeTarget, filterName, encoderOptions, exportFile)
+            QApplication.restoreOverrideCursor()
+            if size is None:
+                QMessageBox.warning(QWidget(), i18n("JPEG export"), i18n(f"Unable to export file to {self.leFileName.text()}"))
+                if os.path.isfile(exportFile):
+                    os.remove(exportFile)
+
+        exported = False
+        if self.__accepted and not exportInBackground and os.path.isfile(exportFile):
+            try:
+                if exportFile == self.__tmpExportFile:
+                    # target directory is not writable, or file exported for preview is the final one:
+                    # can be a copy if target is on another filesystem
+                    shutil.move(exportFile, self.leFileName.text())
+                else:
+                    os.replace(exportFile, self.leFileName.text())
+                exported = True
+            except Exception as e:
+                QMessageBox.warning(QWidget(), i18n("JPEG export"), i18n(f"Unable to export file to {self.leFileName.text()}"))
+                os.remove(exportFile)
+                print(e)
+
         if os.path.isfile(self.__tmpExportFile):
-            if self.__accepted:
-                try:
-                    shutil.move(self.__tmpExportFile, self.leFileName.text())
-                    self.__tmpExportFile = None
-                except Exception as e:
-                    QMessageBox.warning(QWidget(), i18n("JPEG export"), i18n(f"Unable to export file to {self.leFileName.text()}"))
-                    os.remove(self.__tmpExportFile)
-                    print(e)
+            os.remove(self.__tmpExportFile)
+
+        responsiveResults = []
+        if exportedImage is not None:
+            self.__tmpDocImage = None
+            if exportInBackground:
+                responsive = None
+                if responsiveActive:
+                    responsive = {'widths': JEResponsive.parseWidths(self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)),
+                                  'filterName': filterName
+                                  }
+                JEExportQueue.instance().add(exportedImage, encoderOptions, self.leFileName.text(), responsive)
+            else:
+                QApplication.setOverrideCursor(Qt.WaitCursor)
+                responsiveResults = JEResponsive.export(exportedImage,
+                                                        JEResponsive.parseWidths(self.wContentOptions.property(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)),
+                                                        filterName,
+                                                        self.wJpegOptions.options(),
+                                                        self.leFileName.text())
+                QApplication.restoreOverrideCursor()
+                failed = [result['fileName'] for result in responsiveResults if result['size'] is None]
+                if len(failed) > 0:
+                    QMessageBox.warning(QWidget(), i18n("JPEG export"), i18n("Unable to export files:") + '<br>' + '<br>'.join(failed))
+
+        if exported and (exportByStrips or self.__docSource.revision() == self.__tmpDocSourceRevision):
+            # record export, then next exports of unchanged content with the same setup can
+            # be skipped (see JEManifest)
+            # when exported from temporary document, source document may have been modified since
+            # temporary document content has been built: export is recorded only if source has not
+            # been invalidated since, digest of current document pixels is then the digest of
+            # exported pixels
+            options = self.wJpegOptions.options()
+            if exportByStrips:
+                # exported with in memory encoder: quality can differ from options
+                quality = encoderOptions['quality']
             else:
-                os.remove(self.__tmpExportFile)
+                quality = options['quality']
+            JEManifest.record(self.leFileName.text(),
+                              JEManifest.sourceDigest(self.__doc, self.__boundsSource),
+                              JEManifest.setup(self.__setupData(), options, self.__sizeTarget, filterName, exportByStrips),
+                              {'size': os.path.getsize(self.leFileName.text()),
+                               'quality': quality,
+                               'subsampling': options['subsampling'],
+                               'responsive': responsiveResults
+                               })
+
+    def __exportTmpFileName(self, fileName):
+        """Return temporary file name used to export given target `fileName`
+
+        Temporary file is a hidden file in target directory, so it can be renamed to
+        target file name without any copy; if target directory is not writable, return
+        file name in system temporary directory
+        """
+        return JEExporter.tmpFileName(fileName) or self.__tmpExportFile
+
+    def changeEvent(self, event):
+        """Window state has been changed"""
+        if event.type() == QEvent.ActivationChange and not self.isActiveWindow() and self.__docSource:
+            # window is not modal: while window is not active, user can modify source document
+            # and cached source pixels can't be used anymore
+            self.__docSource.invalidate()
+        super(JEMainWindow, self).changeEvent(event)
 
     def closeEvent(self, event):
         """Window is closed"""
@@ -0,0 +1,298 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jemanifest module provides export manifests and export results cache
+#
+# For each exported file, a manifest is written as a sidecar file (hidden JSON
+# file in target directory), with:
+# - a digest of source pixels (exported region of document)
+# - effective export options
+# - exported file size and digest
+#
+# When a document is exported again with identical content and options:
+# - if target file is still the one described by manifest, export is a no-op
+# - otherwise, if a file with the same source digest and options is available
+#   in cache directory, it's copied to target
+# - otherwise, document is exported, and exported file is added to cache
+#
+# Cache directory size is limited: least recently used files are removed when
+# limit is exceeded
+# -----------------------------------------------------------------------------
+
+import hashlib
+import json
+import os
+import os.path
+import shutil
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import QStandardPaths
+
+from .jesettings import (
+        JESettings,
+        JESettingsKey
+    )
+from .jestripexport import JEStripExporter
+
+from jpegexport.pktk.pktk import PkTk
+from ..pktk import *
+
+
+class JEManifest(object):
+    """Export manifests (sidecar files) and export results cache"""
+
+    # maximum size of cache directory, in bytes
+    CACHE_MAX_BYTES = 1073741824
+
+    # read buffer size used to calculate files digest
+    READ_BUFFER_SIZE = 1048576
+
+    @staticmethod
+    def cachePath():
+        """Return cache directory"""
+        return os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), f'krita-plugin-{PkTk.packageName()}-cache')
+
+    @staticmethod
+    def manifestFileName(fileName):
+        """Return manifest (sidecar) file name for given exported `fileName`"""
+        return os.path.join(os.path.dirname(fileName), f'.{os.path.basename(fileName)}.jemanifest')
+
+    @staticmethod
+    def sourceDigest(document, bounds):
+        """Return digest of `document` pixels for given `bounds`
+
+        Color space and resolution of document are taken in account (written in exported
+        file as ICC profile and JFIF density)
+
+        Pixels are read by strips, with a low memory usage
+        """
+        returned = hashlib.blake2b(digest_size=16)
+        returned.update(f'{document.colorModel()}:{document.colorDepth()}:{document.colorProfile()}:'
+                        f'{document.xRes()}x{document.yRes()}:{bounds.width()}x{bounds.height()}'.encode())
+        for top in range(0, bounds.height(), JEStripExporter.STRIP_HEIGHT):
+            bottom = min(bounds.height(), top + JEStripExporter.STRIP_HEIGHT)
+            returned.update(document.pixelData(bounds.x(), bounds.y() + top, bounds.width(), bottom - top).data())
+        return returned.hexdigest()
+
+    @staticmethod
+    def fileDigest(fileName):
+        """Return digest of given file content, or None if file can't be read"""
+        returned = hashlib.blake2b(digest_size=16)
+        try:
+            with open(fileName, 'rb') as fHandle:
+                while True:
+                    data = fHandle.read(JEManifest.READ_BUFFER_SIZE)
+                    if not data:
+                        break
+                    returned.update(data)
+        except Exception:
+            return None
+        return returned.hexdigest()
+
+    @staticmethod
+    def setup(setupData, options, targetSize, filterName, byStrips):
+        """Return effective export options as a dictionary that can be serialized to JSON
+
+        Given `setupData` is a dictionary, as stored by setup manager (see JEExporter.setupsFromFile()
+        or JEMainWindow.__setupData())
+        Given `options` is JPEG options, as returned by JEExporter.jpegOptions()
+        Given `targetSize` is exported image size, `filterName` is resize filter and
+        `byStrips` is True if export is made by strips
+        """
+        def setupValue(key):
+            # same as JEExporter.setupValue()
+            return setupData.get(key.id(), JESettings.get(key))
+
+        return {'options': {key: (value.name() if isinstance(value, QColor) else value) for key, value in options.items()},
+                'width': targetSize.width(),
+                'height': targetSize.height(),
+                'filter': filterName,
+                'byStrips': byStrips,
+                'targetSize': [setupValue(JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE),
+                               setupValue(JESettingsKey.CONFIG_TARGET_SIZE_VALUE),
+                               setupValue(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING)],
+                'targetMetric': [setupValue(JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE),
+                                 setupValue(JESettingsKey.CONFIG_TARGET_METRIC_NAME),
+                                 setupValue(JESettingsKey.CONFIG_TARGET_METRIC_VALUE)],
+                'responsive': [setupValue(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE),
+                               setupValue(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS)]
+                }
+
+    @staticmethod
+    def cacheKey(sourceDigest, setup):
+        """Return cache key for given `sourceDigest` and `setup` (as returned by setup())"""
+        returned = hashlib.blake2b(digest_size=16)
+        returned.update(sourceDigest.encode())
+        returned.update(json.dumps(setup, sort_keys=True, default=str).encode())
+        return returned.hexdigest()
+
+    @staticmethod
+    def read(fileName):
+        """Return manifest for given exported `fileName`, or None if there's no manifest"""
+        manifestFileName = JEManifest.manifestFileName(fileName)
+        if not os.path.isfile(manifestFileName):
+            return None
+
+        try:
+            with open(manifestFileName, 'r') as fHandle:
+                return json.loads(fHandle.read())
+        except Exception as e:
+            print("Unable to read manifest", manifestFileName, e)
+        return None
+
+    @staticmethod
+    def write(fileName, sourceDigest, setup, result):
+        """Write manifest for given exported `fileName`
+
+        Given `result` is a dictionary with export result ('size', 'quality', 'subsampling'
+        and optional 'responsive' list, as returned by JEExporter.exportDocument())
+
+        Return written manifest, or None if manifest can't be written
+        """
+        manifest = {'source': sourceDigest,
+                    'setup': setup,
+                    'size': result['size'],
+                    'digest': JEManifest.fileDigest(fileName),
+                    'quality': result['quality'],
+                    'subsampling': result['subsampling'],
+                    'responsive': [{'fileName': os.path.basename(item['fileName']),
+                                    'width': item['width'],
+                                    'height': item['height'],
+                                    'size': item['size'],
+                                    'digest': JEManifest.fileDigest(item['fileName'])
+                                    } for item in result.get('responsive', []) if item['size'] is not None]
+                    }
+        try:
+            with open(JEManifest.manifestFileName(fileName), 'w') as fHandle:
+                fHandle.write(json.dumps(manifest, indent=1))
+        except Exception as e:
+            print("Unable to write manifest", fileName, e)
+            return None
+        return manifest
+
+    @staticmethod
+    def upToDate(fileName, sourceDigest, setup):
+        """Return manifest if exported `fileName` (and responsive set files) is up to date
+        for given `sourceDigest` and `setup`, otherwise return None
+        """
+        manifest = JEManifest.read(fileName)
+        if (manifest is None or
+           manifest.get('source') != sourceDigest or
+           manifest.get('setup') != setup or
+           not os.path.isfile(fileName) or
+           os.path.getsize(fileName) != manifest.get('size') or
+           JEManifest.fileDigest(fileName) != manifest.get('digest')):
+            return None
+
+        pathName = os.path.dirname(fileName)
+        for item in manifest.get('responsive', []):
+            if JEManifest.fileDigest(os.path.join(pathName, item['fileName'])) != item['digest']:
+                return None
+
+        return manifest
+
+    @staticmethod
+    def fromCache(fileName, sourceDigest, setup):
+        """Copy exported file from cache to `fileName` if available for given `sourceDigest` and
+        `setup`
+
+        Responsive set files are not cached: if responsive set is active, cache is not used
+
+        Return manifest of cached file, or None if not available in cache
+        """
+        if setup['responsive'][0]:
+            return None
+
+        key = JEManifest.cacheKey(sourceDigest, setup)
+        cachedFileName = os.path.join(JEManifest.cachePath(), f'{key}.jpeg')
+        manifest = JEManifest.read(cachedFileName)
+        if manifest is None or not os.path.isfile(cachedFileName) or JEManifest.fileDigest(cachedFileName) != manifest.get('digest'):
+            return None
+
+        tmpFileName = os.path.join(os.path.dirname(fileName), f'.{os.path.basename(fileName)}-{key}')
+        try:
+            shutil.copyfile(cachedFileName, tmpFileName)
+            os.replace(tmpFileName, fileName)
+            # used recently
+            os.utime(cachedFileName)
+        except Exception as e:
+            print(f"Unable to copy cached file to {fileName}", e)
+            if os.path.isfile(tmpFileName):
+                os.remove(tmpFileName)
+            return None
+
+        return JEManifest.write(fileName, sourceDigest, setup, manifest)
+
+    @staticmethod
+    def toCache(fileName, sourceDigest, setup, result):
+        """Add exported `fileName` to cache, and remove least recently used files from cache if
+        cache size is exceeded
+
+        Responsive set files are not cached: if responsive set is active, nothing is done
+        """
+        if setup['responsive'][0]:
+            return
+
+        key = JEManifest.cacheKey(sourceDigest, setup)
+        cachedFileName = os.path.join(JEManifest.cachePath(), f'{key}.jpeg')
+        try:
+            os.makedirs(JEManifest.cachePath(), exist_ok=True)
+            shutil.copyfile(fileName, cachedFileName)
+        except Exception as e:
+            print("Unable to add file to cache", fileName, e)
+            return
+
+        JEManifest.write(cachedFileName, sourceDigest, setup, dict(result, responsive=[]))
+        JEManifest.pruneCache()
+
+    @staticmethod
+    def record(fileName, sourceDigest, setup, result):
+        """Record a new export of `fileName`: write manifest and add file to cache"""
+        if JEManifest.write(fileName, sourceDigest, setup, result) is not None:
+            JEManifest.toCache(fileName, sourceDigest, setup, result)
+
+    @staticmethod
+    def pruneCache(maxBytes=None):
+        """Remove least recently used files from cache until cache size is less than `maxBytes`
+        (CACHE_MAX_BYTES if None)"""
+        if maxBytes is None:
+            maxBytes = JEManifest.CACHE_MAX_BYTES
+
+        if not os.path.isdir(JEManifest.cachePath()):
+            return
+
+        files = []
+        for name in os.listdir(JEManifest.cachePath()):
+            if name.endswith('.jpeg'):
+                fileName = os.path.join(JEManifest.cachePath(), name)
+                files.append((os.path.getmtime(fileName), os.path.getsize(fileName), fileName))
+
+        total = sum(size for mtime, size, fileName in files)
+        for mtime, size, fileName in sorted(files):
+            if total <= maxBytes:
+                break
+            for removedFileName in (fileName, JEManifest.manifestFileName(fileName)):
+                try:
+                    os.remove(removedFileName)
+                except Exception:
+                    pass
+            total -= size
@@ -0,0 +1,191 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jememory module provides class used to keep track of memory used by
+# export dialog (temporary documents, caches, images being encoded) and to
+# enforce a memory budget
+#
+# Python can't know how many memory is really used by Krita; used memory is
+# calculated by consumers, from size of documents, images and caches
+# -----------------------------------------------------------------------------
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        pyqtSignal as Signal
+    )
+
+from ..pktk import *
+
+
+class JEMemory(QObject):
+    """Keep track of memory used by registered consumers, and enforce a budget
+
+    A consumer provides a callable that return its current size, in bytes; it
+    can also provide a callable used to free memory (evictable consumers, like
+    caches)
+
+    When budget is exceeded, evictable consumers are evicted (by ascending
+    priority) until used memory fit in budget; if still not possible,
+    `budgetExceeded` signal is emitted
+    """
+    updated = Signal(int, int)          # current used memory, peak used memory (in bytes)
+    budgetExceeded = Signal(int)        # current used memory (in bytes), once evictable consumers have been evicted
+
+    # Krita color model: number of channels
+    CHANNELS = {
+            'A': 1,
+            'GRAYA': 2,
+            'RGBA': 4,
+            'XYZA': 4,
+            'LABA': 4,
+            'YCbCrA': 4,
+            'CMYKA': 5
+        }
+
+    # Krita color depth: number of bytes per channel
+    DEPTHS = {
+            'U8': 1,
+            'U16': 2,
+            'F16': 2,
+            'F32': 4
+        }
+
+    def __init__(self, budget=0, parent=None):
+        """Initialise memory manager
+
+        Given `budget` is maximum memory, in bytes; if 0, there's no limit
+        """
+        super(JEMemory, self).__init__(parent)
+        self.__consumers = {}
+        self.__budget = 0
+        self.__current = 0
+        self.__peak = 0
+        self.setBudget(budget)
+
+    @staticmethod
+    def bytesPerPixel(colorModel, colorDepth):
+        """Return number of bytes per pixel for given Krita `colorModel` and `colorDepth`"""
+        return JEMemory.CHANNELS.get(colorModel, 4) * JEMemory.DEPTHS.get(colorDepth, 1)
+
+    @staticmethod
+    def documentBytes(document, nbLayers=None):
+        """Return approximative memory used by given Krita `document`
+
+        Calculated from size of document, its color space and number of layers
+        (`nbLayers`, or number of top level layers if None) plus projection
+        """
+        if document is None:
+            return 0
+
+        if nbLayers is None:
+            nbLayers = len(document.rootNode().childNodes())
+
+        return document.width() * document.height() * JEMemory.bytesPerPixel(document.colorModel(), document.colorDepth()) * (nbLayers + 1)
+
+    def register(self, name, sizeCallback, evictCallback=None, priority=0):
+        """Register a consumer
+
+        Given `sizeCallback` is a callable that return size used by consumer, in bytes
+        Given `evictCallback` (if provided) is a callable that free memory used by consumer
+        Given `priority` define eviction order (lowest priority are evicted first)
+        """
+        if not callable(sizeCallback):
+            raise EInvalidType("Given `sizeCallback` must be callable")
+        elif evictCallback is not None and not callable(evictCallback):
+            raise EInvalidType("Given `evictCallback` must be callable or None")
+
+        self.__consumers[name] = (sizeCallback, evictCallback, priority)
+
+    def unregister(self, name):
+        """Unregister consumer for given `name`"""
+        self.__consumers.pop(name, None)
+
+    def usage(self):
+        """Return a dictionary {consumer name: size in bytes}"""
+        return {name: consumer[0]() for name, consumer in self.__consumers.items()}
+
+    def budget(self):
+        """Return memory budget, in bytes (0 if there's no limit)"""
+        return self.__budget
+
+    def setBudget(self, budget):
+        """Set memory budget, in bytes (0 if there's no limit)"""
+        if not isinstance(budget, int) or budget < 0:
+            raise EInvalidValue("Given `budget` must be a positive <int>")
+        self.__budget = budget
+
+    def current(self):
+        """Return used memory, in bytes, as calculated on last update"""
+        return self.__current
+
+    def peak(self):
+        """Return peak used memory, in bytes"""
+        return self.__peak
+
+    def resetPeak(self):
+        """Reset peak used memory"""
+        self.__peak = self.__current
+
+    def __evict(self, required=0):
+        """Evict consumers (by ascending priority) until used memory plus `required`
+        bytes fit in budget
+
+        Return True if used memory plus `required` bytes fit in budget
+        """
+        evictables = sorted([(priority, name, evictCallback) for name, (sizeCallback, evictCallback, priority) in self.__consumers.items()
+                             if evictCallback is not None], key=lambda item: item[:2])
+        for priority, name, evictCallback in evictables:
+            if self.__current + required <= self.__budget:
+                break
+            evictCallback()
+            self.__current = sum(self.usage().values())
+
+        return self.__current + required <= self.__budget
+
+    def update(self):
+        """Calculate used memory and enforce budget
+
+        Return used memory, in bytes
+        """
+        self.__current = sum(self.usage().values())
+        self.__peak = max(self.__peak, self.__current)
+
+        if self.__budget > 0 and not self.__evict():
+            self.budgetExceeded.emit(self.__current)
+            self.__current = sum(self.usage().values())
+
+        self.updated.emit(self.__current, self.__peak)
+        return self.__current
+
+    def fits(self, required):
+        """Return True if `required` bytes can be allocated without exceeding budget
+
+        Evictable consumers are evicted if needed
+        """
+        if self.__budget == 0:
+            return True
+
+        self.__current = sum(self.usage().values())
+        self.__peak = max(self.__peak, self.__current)
+        returned = self.__evict(required)
+        self.updated.emit(self.__current, self.__peak)
+        return returned
@@ -0,0 +1,218 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jepreview module provides classes used to encode preview outside GUI
+# thread
+#
+# Main class from this module
+#
+# - JEPreviewScheduler:
+#       Manage preview encoding requests; only the latest request is taken in
+#       account, older requests are dropped
+#
+# - JEPreviewJob:
+#       A single encode/decode (and optional error analysis and similarity
+#       measure) job, executed in a thread from pool
+#
+# -----------------------------------------------------------------------------
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        pyqtSignal as Signal,
+        QRunnable,
+        QThreadPool
+    )
+from PyQt5.QtGui import QImage
+
+from .jeencoder import JEEncoder
+from .jeanalysis import JEAnalysis
+
+from ..pktk import *
+
+
+class JEPreviewJobSignals(QObject):
+    finished = Signal(int, object, object, object, object)  # generation, encoded data (QByteArray or None), decoded image (QImage or None),
+                                                            # error analysis (dict or None), metric value (float or None)
+
+
+class JEPreviewJob(QRunnable):
+    """Encode and decode an image as JPEG, in a thread from pool
+
+    Not aimed to be instancied directly, just use JEPreviewScheduler
+    """
+
+    def __init__(self, scheduler, generation, image, options, analyse, heatmap, metric):
+        super(JEPreviewJob, self).__init__()
+        self.__scheduler = scheduler
+        self.__generation = generation
+        self.__image = image
+        self.__options = options
+        self.__analyse = analyse
+        self.__heatmap = heatmap
+        self.__metric = metric
+        self.signals = JEPreviewJobSignals()
+
+    def bytes(self):
+        """Return an estimation of memory used by job buffers (flattened and decoded images), in bytes
+
+        Given image is not taken in account, as it's usually shared with caller
+        """
+        return 2 * self.__image.sizeInBytes()
+
+    @pyqtSlot()
+    def run(self):
+        """Encode image, then decode result, measure similarity and analyse errors (if asked)
+
+        Before each step, check if job is still the latest one; if not, stop
+        processing as result won't be used
+        """
+        data = None
+        image = None
+        analysis = None
+        metricValue = None
+
+        if self.__scheduler.isCurrent(self.__generation):
+            data = JEEncoder.encode(self.__image, self.__options)
+
+        if data is not None and self.__scheduler.isCurrent(self.__generation):
+            image = JEEncoder.decode(data)
+
+        if image is not None and (self.__analyse or self.__metric is not None) and self.__scheduler.isCurrent(self.__generation):
+            source = JEEncoder.flatten(self.__image, self.__options.get('transparencyFillcolor', None)).convertToFormat(QImage.Format_RGB32)
+
+            if self.__metric is not None:
+                metricValue = JEAnalysis.measure(self.__metric, source, image)
+
+            if self.__analyse and self.__scheduler.isCurrent(self.__generation):
+                # in memory encoder always use 4:2:0 chroma subsampling: blocks are aligned on 16x16 MCU
+                analysis = JEAnalysis.errorAnalysis(source, image, heatmap=self.__heatmap, blockSize=JEEncoder.MCU_SIZE)
+
+        self.signals.finished.emit(self.__generation, data, image, analysis, metricValue)
+
+
+class JEPreviewScheduler(QObject):
+    """Schedule JPEG preview encoding outside GUI thread
+
+    Only one job is executed at a time; when a new request is made while a job
+    is running, request is kept as pending and executed once running job is
+    finished (if another request is made in the meantime, pending request is
+    replaced)
+
+    Results from jobs that are not the latest requested one are dropped
+    """
+    started = Signal(int)               # generation
+    encoded = Signal(int, int, QImage, object, object)  # generation, encoded size (-1 if not encoded), decoded image, error analysis (dict or None),
+                                                        # metric value (float or None)
+
+    def __init__(self, parent=None):
+        super(JEPreviewScheduler, self).__init__(parent)
+        self.__threadpool = QThreadPool()
+        self.__threadpool.setMaxThreadCount(1)
+
+        self.__mutex = QMutex()
+        self.__generation = 0
+        self.__running = None
+        self.__pending = None
+
+    def __onJobFinished(self, generation, data, image, analysis, metricValue):
+        """A job has been processed"""
+        self.__running = None
+
+        if self.isCurrent(generation):
+            if data is None:
+                self.encoded.emit(generation, -1, QImage(), None, None)
+            else:
+                self.encoded.emit(generation, data.size(), image if image is not None else QImage(), analysis, metricValue)
+
+        if self.__pending:
+            self.__startJob(*self.__pending)
+
+    def __startJob(self, generation, image, options, analyse, heatmap, metric):
+        """Start a job"""
+        self.__pending = None
+        self.__running = JEPreviewJob(self, generation, image, options, analyse, heatmap, metric)
+        self.__running.signals.finished.connect(self.__onJobFinished)
+        self.__running.setAutoDelete(True)
+        self.started.emit(generation)
+        self.__threadpool.start(self.__running)
+
+    def isCurrent(self, generation):
+        """Return True if given `generation` is the latest requested one"""
+        self.__mutex.lock()
+        returned = (generation == self.__generation)
+        self.__mutex.unlock()
+        return returned
+
+    def isBusy(self):
+        """Return True if a job is running or pending"""
+        return self.__running is not None or self.__pending is not None
+
+    def bytes(self):
+        """Return an estimation of memory used by running job, in bytes"""
+        if self.__running is None:
+            return 0
+        return self.__running.bytes()
+
+    def request(self, image, options, analyse=False, heatmap=False, metric=None):
+        """Request encoding of given `image` (a QImage) with given JPEG `options`
+
+        If `analyse` is True, errors between image and JPEG are analysed (see JEAnalysis.errorAnalysis());
+        heatmap is calculated only if `heatmap` is True
+        If `metric` is provided, similarity between image and JPEG is measured (see JEAnalysis.measure())
+        Analysis and measure are ignored if numpy is not available
+
+        Image must not be modified once given to scheduler
+
+        Return generation number of request
+        """
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+
+        self.__mutex.lock()
+        self.__generation += 1
+        generation = self.__generation
+        self.__mutex.unlock()
+
+        analyse = analyse and JEAnalysis.available()
+        if not JEAnalysis.available():
+            metric = None
+
+        if self.__running is None:
+            self.__startJob(generation, image, options, analyse, heatmap, metric)
+        else:
+            # a job is already running, it will be ignored: keep only the latest request
+            self.__pending = (generation, image, options, analyse, heatmap, metric)
+
+        return generation
+
+    def cancel(self):
+        """Cancel all requests; running job (if any) will be ignored"""
+        self.__mutex.lock()
+        self.__generation += 1
+        self.__mutex.unlock()
+        self.__pending = None
+
+    def waitForDone(self):
+        """Wait until running job is finished"""
+        self.__threadpool.waitForDone()
@@ -0,0 +1,380 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jequeue module provides a persistent background export queue
+#
+# Main class from this module
+#
+# - JEExportQueue:
+#       The queue (one instance for plugin, see JEExportQueue.instance())
+#       An export is added to queue as a snapshot of exported image (already
+#       cropped/resized, as a QImage) and JPEG options; encoding and writing of
+#       file are then made in a background thread, one export at a time
+#
+# - JEExportQueueJob:
+#       A single export job, executed in a thread
+#
+# - JEExportQueueSnapshotJob:
+#       Write snapshot of a queued export, executed in a thread
+#
+# Queue is persistent: each queued export is stored in queue directory as a
+# JSON descriptor and a lossless snapshot (PNG) of exported image; snapshot is
+# written as soon as export is added to queue (export doesn't wait for it), and
+# files are removed once export is done.
+# On next Krita start, exports for which a snapshot exists are resumed; exports
+# without snapshot (Krita closed before snapshot has been written) are listed in
+# error.
+#
+# Files are written by JEEncoder.encodeFile(): not all options are supported
+# (see JEEncoder.encode())
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import os.path
+import time
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        pyqtSignal as Signal,
+        QRunnable,
+        QStandardPaths,
+        QThreadPool
+    )
+
+from .jeencoder import JEEncoder
+from .jeresponsive import JEResponsive
+
+from jpegexport.pktk.pktk import PkTk
+from ..pktk import *
+
+
+class JEExportQueueJobSignals(QObject):
+    started = Signal(str)               # item id
+    finished = Signal(str, object)      # item id, file size (None if not exported)
+
+
+class JEExportQueueSnapshotJob(QRunnable):
+    """Write snapshot of a queue item exported image
+
+    Not aimed to be instancied directly, just use JEExportQueue
+    """
+
+    def __init__(self, itemId, image, snapshotFileName):
+        super(JEExportQueueSnapshotJob, self).__init__()
+        self.__itemId = itemId
+        self.__image = image
+        self.__snapshotFileName = snapshotFileName
+        self.signals = JEExportQueueJobSignals()
+
+    @pyqtSlot()
+    def run(self):
+        """Write snapshot"""
+        written = False
+        tmpFileName = f'{self.__snapshotFileName}.tmp'
+        try:
+            # written with a temporary name: a partially written snapshot is never resumed
+            if self.__image.save(tmpFileName, 'PNG', JEExportQueue.SNAPSHOT_PNG_QUALITY):
+                os.replace(tmpFileName, self.__snapshotFileName)
+                written = True
+        except Exception as e:
+            print("Unable to write queue snapshot", self.__snapshotFileName, e)
+
+        if not written and os.path.isfile(tmpFileName):
+            os.remove(tmpFileName)
+
+        self.__image = None
+        self.signals.finished.emit(self.__itemId, written)
+
+
+class JEExportQueueJob(QRunnable):
+    """Encode and write JPEG file for a queue item
+
+    Not aimed to be instancied directly, just use JEExportQueue
+    """
+
+    def __init__(self, item, image, snapshotFileName):
+        super(JEExportQueueJob, self).__init__()
+        self.__item = item
+        self.__image = image
+        self.__snapshotFileName = snapshotFileName
+        self.signals = JEExportQueueJobSignals()
+
+    @pyqtSlot()
+    def run(self):
+        """Export item"""
+        self.signals.started.emit(self.__item['id'])
+        size = None
+        try:
+            image = self.__image
+            self.__image = None
+            if image is None:
+                # resumed or retried item: read snapshot
+                image = QImage(self.__snapshotFileName)
+                if image.isNull():
+                    image = None
+
+            if image is not None:
+                options = dict(self.__item['options'])
+                options['transparencyFillcolor'] = QColor(options['transparencyFillcolor'])
+
+                size = JEEncoder.encodeFile(image, options, self.__item['fileName'])
+
+                if size is not None and self.__item['responsive'] is not None:
+                    JEResponsive.exportInCurrentThread(image,
+                                                       self.__item['responsive']['widths'],
+                                                       self.__item['responsive']['filterName'],
+                                                       options,
+                                                       self.__item['fileName'])
+        except Exception as e:
+            print(f"Unable to export file to {self.__item['fileName']}", e)
+            size = None
+
+        self.signals.finished.emit(self.__item['id'], size)
+
+
+class JEExportQueue(QObject):
+    """Persistent background export queue"""
+    updated = Signal()
+
+    STATUS_QUEUED = 'queued'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_ERROR = 'error'
+
+    # PNG 'quality' for snapshots: low compression, snapshot is a temporary file that
+    # need to be written quickly
+    SNAPSHOT_PNG_QUALITY = 90
+
+    __INSTANCE = None
+
+    @staticmethod
+    def instance():
+        """Return queue instance"""
+        if JEExportQueue.__INSTANCE is None:
+            JEExportQueue.__INSTANCE = JEExportQueue()
+        return JEExportQueue.__INSTANCE
+
+    @staticmethod
+    def queuePath():
+        """Return directory in which queued exports are stored"""
+        return os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericDataLocation), f'krita-plugin-{PkTk.packageName()}-queue')
+
+    def __init__(self, parent=None):
+        super(JEExportQueue, self).__init__(parent)
+        # ordered list of items (dict)
+        self.__items = []
+        # one export at a time: background export must not slow down Krita
+        self.__threadpool = QThreadPool()
+        self.__threadpool.setMaxThreadCount(1)
+        self.__jobs = {}
+        # snapshots are written as soon as exports are queued, by a dedicated thread
+        self.__snapshotThreadpool = QThreadPool()
+        self.__snapshotThreadpool.setMaxThreadCount(1)
+        self.__snapshotJobs = {}
+
+    def __descriptorFileName(self, itemId):
+        """Return descriptor file name for given item `itemId`"""
+        return os.path.join(JEExportQueue.queuePath(), f'{itemId}.json')
+
+    def __snapshotFileName(self, itemId):
+        """Return snapshot file name for given item `itemId`"""
+        return os.path.join(JEExportQueue.queuePath(), f'{itemId}.png')
+
+    def __item(self, itemId):
+        """Return item for given `itemId`, or None if not found"""
+        for item in self.__items:
+            if item['id'] == itemId:
+                return item
+        return None
+
+    def __removeFiles(self, itemId):
+        """Remove descriptor and snapshot files for given item `itemId`"""
+        for fileName in (self.__snapshotFileName(itemId), self.__descriptorFileName(itemId)):
+            try:
+                if os.path.isfile(fileName):
+                    os.remove(fileName)
+            except Exception as e:
+                print("Unable to remove queue file", fileName, e)
+
+    def __writeSnapshot(self, itemId, image):
+        """Start snapshot job for given item `itemId`"""
+        job = JEExportQueueSnapshotJob(itemId, image, self.__snapshotFileName(itemId))
+        job.signals.finished.connect(self.__snapshotWritten)
+        # keep a reference until job is finished (signals object must not be garbage collected)
+        self.__snapshotJobs[itemId] = job
+        self.__snapshotThreadpool.start(job)
+
+    def __snapshotWritten(self, itemId, written):
+        """Snapshot of item `itemId` has been written (or not)"""
+        self.__snapshotJobs.pop(itemId, None)
+        item = self.__item(itemId)
+        if item is None or item['status'] == JEExportQueue.STATUS_DONE:
+            # export has been finished (or cleared) while snapshot was written: files are not needed anymore
+            self.__removeFiles(itemId)
+
+    def __start(self, item, image=None):
+        """Start export job for given `item`"""
+        item['status'] = JEExportQueue.STATUS_QUEUED
+        job = JEExportQueueJob(item, image, self.__snapshotFileName(item['id']))
+        job.signals.started.connect(self.__jobStarted)
+        job.signals.finished.connect(self.__jobFinished)
+        # keep a reference until job is finished (signals object must not be garbage collected)
+        self.__jobs[item['id']] = job
+        self.__threadpool.start(job)
+        self.updated.emit()
+
+    def __jobStarted(self, itemId):
+        """Export of item `itemId` is started"""
+        item = self.__item(itemId)
+        if item:
+            item['status'] = JEExportQueue.STATUS_PROCESSING
+            self.updated.emit()
+
+    def __jobFinished(self, itemId, size):
+        """Export of item `itemId` is finished"""
+        self.__jobs.pop(itemId, None)
+        item = self.__item(itemId)
+        if item is None:
+            return
+
+        item['size'] = size
+        if size is None:
+            # keep files: export can be retried
+            item['status'] = JEExportQueue.STATUS_ERROR
+        else:
+            item['status'] = JEExportQueue.STATUS_DONE
+            if itemId not in self.__snapshotJobs:
+                # otherwise, removed once snapshot is written
+                self.__removeFiles(itemId)
+        self.updated.emit()
+
+    def add(self, image, options, fileName, responsive=None):
+        """Add an export to queue
+
+        Given `image` is exported image (QImage, already cropped and resized)
+        Given `options` is a dictionary, as returned by WExportOptionsJpeg.options();
+        only 'quality', 'progressive', 'optimize' and 'transparencyFillcolor' are taken
+        in account
+        Given `fileName` is target file name
+        If provided, `responsive` is a dictionary {'widths': list of widths, 'filterName': Krita filter}
+        used to export a responsive set (see JEResponsive)
+
+        Return queued item id
+        """
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+        elif not isinstance(fileName, str) or fileName == '':
+            raise EInvalidValue("Given `fileName` must be a non empty <str>")
+
+        item = {'id': QUuid.createUuid().toString(QUuid.Id128),
+                'fileName': fileName,
+                'options': {'quality': options['quality'],
+                            'progressive': options['progressive'],
+                            'optimize': options['optimize'],
+                            'transparencyFillcolor': QColor(options['transparencyFillcolor']).name()
+                            },
+                'responsive': responsive,
+                'width': image.width(),
+                'height': image.height(),
+                'created': time.time(),
+                'status': JEExportQueue.STATUS_QUEUED,
+                'size': None
+                }
+
+        try:
+            os.makedirs(JEExportQueue.queuePath(), exist_ok=True)
+            with open(self.__descriptorFileName(item['id']), 'w') as fHandle:
+                fHandle.write(json.dumps({key: value for key, value in item.items() if key not in ('status', 'size')}, indent=1))
+        except Exception as e:
+            # queue is not persistent for this item, but export is still made
+            print("Unable to write queue descriptor", e)
+
+        self.__items.append(item)
+        # snapshot is written immediately: if Krita is closed while export is waiting or in
+        # progress, export can be resumed
+        self.__writeSnapshot(item['id'], image)
+        self.__start(item, image)
+        return item['id']
+
+    def resume(self):
+        """Load exports that were not finished when Krita has been closed, and resume them
+
+        Descriptors without snapshot (Krita closed before snapshot has been written)
+        can't be resumed: they're listed in error, and removed when finished exports are
+        cleared
+        """
+        if not os.path.isdir(JEExportQueue.queuePath()):
+            return
+
+        items = []
+        for fileName in os.listdir(JEExportQueue.queuePath()):
+            baseName, ext = os.path.splitext(fileName)
+            if ext != '.json' or self.__item(baseName) is not None:
+                continue
+
+            try:
+                with open(self.__descriptorFileName(baseName), 'r') as fHandle:
+                    item = json.loads(fHandle.read())
+                item['status'] = JEExportQueue.STATUS_QUEUED
+                item['size'] = None
+                items.append(item)
+            except Exception as e:
+                print("Unable to read queue descriptor", fileName, e)
+
+        for item in sorted(items, key=lambda item: item['created']):
+            self.__items.append(item)
+            if os.path.isfile(self.__snapshotFileName(item['id'])):
+                self.__start(item)
+            else:
+                print(f"Unable to resume export to {item['fileName']}: no snapshot")
+                item['status'] = JEExportQueue.STATUS_ERROR
+        self.updated.emit()
+
+    def retry(self):
+        """Restart exports in error"""
+        for item in self.__items:
+            if item['status'] == JEExportQueue.STATUS_ERROR and item['id'] not in self.__snapshotJobs:
+                if os.path.isfile(self.__snapshotFileName(item['id'])):
+                    self.__start(item)
+
+    def clearFinished(self):
+        """Remove done exports from list
+
+        Exports in error are removed too (with their snapshot)
+        """
+        for item in [item for item in self.__items if item['status'] in (JEExportQueue.STATUS_DONE, JEExportQueue.STATUS_ERROR)]:
+            if item['id'] not in self.__snapshotJobs:
+                # otherwise, removed once snapshot is written
+                self.__removeFiles(item['id'])
+            self.__items.remove(item)
+        self.updated.emit()
+
+    def items(self):
+        """Return list of items (dictionaries: 'id', 'fileName', 'width', 'height', 'created', 'status', 'size')"""
+        return [dict(item) for item in self.__items]
+
+    def pending(self):
+        """Return number of exports not yet finished"""
+        return len([item for item in self.__items if item['status'] in (JEExportQueue.STATUS_QUEUED, JEExportQueue.STATUS_PROCESSING)])
@@ -0,0 +1,380 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jeresize module provides classes used to resize document pixels outside
+# GUI thread
+#
+# Main class from this module
+#
+# - JEResize:
+#       Resize pixels (raw Krita pixel data) with filters equivalent to the
+#       ones provided by Krita; resizing is made in background, and results are
+#       kept in a cache
+#
+# - JEResizeJob:
+#       A single resize job, executed in a thread from pool
+#
+# Resize is vectorized with numpy; numpy is not always available with Krita, in
+# this case resize is not available (see JEResize.available()) and Krita's
+# Document.scaleImage() has to be used
+# -----------------------------------------------------------------------------
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        pyqtSignal as Signal,
+        QByteArray,
+        QRunnable,
+        QSize,
+        QThreadPool
+    )
+from PyQt5.QtGui import QImage
+
+from .jecache import JECache
+from .jesettings import JESettingsValues
+
+from ..pktk import *
+
+
+class JEResizeJobSignals(QObject):
+    finished = Signal(str)              # key
+
+
+class JEResizeJob(QRunnable):
+    """Resize pixels, in a thread from pool
+
+    Not aimed to be instancied directly, just use JEResize
+    """
+
+    def __init__(self, scheduler, key, pixels, size, colorDepth, targetSize, filterName):
+        super(JEResizeJob, self).__init__()
+        self.__scheduler = scheduler
+        self.__key = key
+        self.__pixels = pixels
+        self.__size = size
+        self.__colorDepth = colorDepth
+        self.__targetSize = targetSize
+        self.__filterName = filterName
+        self.signals = JEResizeJobSignals()
+
+    @pyqtSlot()
+    def run(self):
+        """Resize pixels, if job is still the latest one"""
+        if self.__scheduler.isCurrent(self.__key):
+            pixels = JEResize.resize(self.__pixels, self.__size, self.__colorDepth, self.__targetSize, self.__filterName,
+                                     lambda: self.__scheduler.isCurrent(self.__key))
+            if pixels is not None:
+                self.__scheduler.setResult(self.__key, pixels)
+        self.signals.finished.emit(self.__key)
+
+
+class JEResize(QObject):
+    """Resize raw pixels from Krita documents
+
+    Resize is made in background, only one job is executed at a time; when a new
+    request is made, running job is stopped as soon as possible
+
+    Resized pixels are kept in a LRU cache
+    """
+    resized = Signal(str)               # key
+
+    # default maximum size of cache
+    CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+    # number of rows processed at once
+    STRIP_HEIGHT = 64
+
+    # filter: (support radius, kernel function)
+    # kernels are the ones implemented by Krita (KisFilterStrategy)
+    FILTERS = {
+            JESettingsValues.FILTER_NEAREST_NEIGHBOUR: (0.5, lambda x: (x <= 0.5).astype(np.float32)),
+            JESettingsValues.FILTER_BILINEAR: (1.0, lambda x: np.maximum(0, 1 - x)),
+            JESettingsValues.FILTER_HERMITE: (1.0, lambda x: np.where(x < 1, (2 * x - 3) * x * x + 1, 0)),
+            JESettingsValues.FILTER_BELL: (1.5, lambda x: np.where(x < 0.5, 0.75 - x * x, np.where(x < 1.5, 0.5 * (x - 1.5) ** 2, 0))),
+            JESettingsValues.FILTER_BICUBIC: (2.0, lambda x: np.where(x < 1, (1.5 * x - 2.5) * x * x + 1, np.where(x < 2, ((-0.5 * x + 2.5) * x - 4) * x + 2, 0))),
+            JESettingsValues.FILTER_BSPLINE: (2.0, lambda x: np.where(x < 1, (0.5 * x - 1) * x * x + 2 / 3, np.where(x < 2, (2 - x) ** 3 / 6, 0))),
+            JESettingsValues.FILTER_MITCHELL: (2.0, lambda x: np.where(x < 1, (7 * x ** 3 - 12 * x ** 2 + 16 / 3) / 6,
+                                                                       np.where(x < 2, (-7 / 3 * x ** 3 + 12 * x ** 2 - 20 * x + 32 / 3) / 6, 0))),
+            JESettingsValues.FILTER_LANCZOS3: (3.0, lambda x: np.where(x < 3, np.sinc(x) * np.sinc(x / 3), 0))
+        } if np is not None else {}
+
+    # Krita color depth: numpy type
+    DEPTHS = {
+            'U8': np.uint8,
+            'U16': np.uint16,
+            'F16': np.float16,
+            'F32': np.float32
+        } if np is not None else {}
+
+    def __init__(self, maxBytes=None, parent=None):
+        """Initialise resizer
+
+        If `maxBytes` is None, use CACHE_MAX_BYTES
+        """
+        super(JEResize, self).__init__(parent)
+        if maxBytes is None:
+            maxBytes = JEResize.CACHE_MAX_BYTES
+
+        self.__cache = JECache(maxBytes)
+        self.__threadpool = QThreadPool()
+        self.__threadpool.setMaxThreadCount(1)
+
+        self.__mutex = QMutex()
+        self.__currentKey = None
+        self.__results = {}
+
+    @staticmethod
+    def available():
+        """Return True if resize is available (numpy installed)"""
+        return np is not None
+
+    @staticmethod
+    def key(revision, bounds, targetSize, filterName):
+        """Return key for given source `revision`, source `bounds` (QRect), `targetSize` (QSize) and `filterName`"""
+        return JECache.digest(revision,
+                              [bounds.x(), bounds.y(), bounds.width(), bounds.height()],
+                              [targetSize.width(), targetSize.height()],
+                              filterName)
+
+    @staticmethod
+    def __weights(size, targetSize, filterName):
+        """Return a tuple (indexes, weights) of numpy arrays (targetSize, taps) for a resize
+        from `size` to `targetSize` on one axis
+        """
+        support, kernel = JEResize.FILTERS[filterName]
+
+        scale = targetSize / size
+        # when downscaling, kernel is enlarged to cover all source pixels
+        filterScale = max(1.0, 1 / scale)
+        support *= filterScale
+        taps = max(1, math.ceil(2 * support) + 1)
+
+        centers = (np.arange(targetSize, dtype=np.float32) + 0.5) / scale - 0.5
+        indexes = np.floor(centers - support).astype(np.int32)[:, None] + 1 + np.arange(taps, dtype=np.int32)[None, :]
+        weights = kernel(np.abs(indexes - centers[:, None]) / filterScale).astype(np.float32)
+
+        # pixels outside source are replaced by border pixels
+        indexes = np.clip(indexes, 0, size - 1)
+
+        totals = weights.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        return (indexes, weights / totals)
+
+    @staticmethod
+    def resizeStrips(readRows, size, nbChannels, dtype, targetSize, filterName):
+        """Generator that resize, by horizontal strips, an image of given `size` (QSize)
+        to `targetSize` (QSize) with given `filterName`
+
+        Given `readRows` is a callable readRows(top, bottom) that return source rows
+        from `top` (included) to `bottom` (excluded) as a numpy array (rows, width,
+        `nbChannels`) of `dtype`; alpha is considered to be the last channel (if
+        `nbChannels` > 1)
+
+        Return tuples (y, rows) where rows is a numpy array (STRIP_HEIGHT rows max, width,
+        `nbChannels`) of `dtype`
+        """
+        if np is None:
+            raise EInvalidStatus("Resize is not available: numpy module can't be loaded")
+        elif filterName not in JEResize.FILTERS:
+            raise EInvalidValue("Given `filterName` is not valid")
+
+        indexesX, weightsX = JEResize.__weights(size.width(), targetSize.width(), filterName)
+        indexesY, weightsY = JEResize.__weights(size.height(), targetSize.height(), filterName)
+
+        if np.issubdtype(dtype, np.integer):
+            maxValue = np.iinfo(dtype).max
+        else:
+            maxValue = 1.0
+
+        for y in range(0, targetSize.height(), JEResize.STRIP_HEIGHT):
+            stripIndexesY = indexesY[y:y + JEResize.STRIP_HEIGHT]
+            stripWeightsY = weightsY[y:y + JEResize.STRIP_HEIGHT]
+
+            # only source rows needed for strip are read
+            top = int(stripIndexesY.min())
+            source = readRows(top, int(stripIndexesY.max()) + 1)
+            stripIndexesY = stripIndexesY - top
+
+            # vertical pass, alpha premultiplied to avoid color of transparent pixels to bleed
+            strip = np.zeros((stripIndexesY.shape[0], size.width(), nbChannels), dtype=np.float32)
+            for tap in range(stripIndexesY.shape[1]):
+                rows = source[stripIndexesY[:, tap]].astype(np.float32)
+                if nbChannels > 1:
+                    rows[..., :-1] *= rows[..., -1:] / maxValue
+                strip += stripWeightsY[:, tap, None, None] * rows
+
+            # horizontal pass
+            resized = np.zeros((strip.shape[0], targetSize.width(), nbChannels), dtype=np.float32)
+            for tap in range(indexesX.shape[1]):
+                resized += weightsX[None, :, tap, None] * strip[:, indexesX[:, tap]]
+
+            if nbChannels > 1:
+                alpha = resized[..., -1:]
+                np.divide(resized[..., :-1] * maxValue, alpha, out=resized[..., :-1], where=(alpha > 0))
+
+            if np.issubdtype(dtype, np.integer):
+                resized = np.clip(np.round(resized), 0, maxValue)
+
+            yield (y, resized.astype(dtype))
+
+    @staticmethod
+    def resize(pixels, size, colorDepth, targetSize, filterName, isCurrent=None):
+        """Resize given raw `pixels` (QByteArray or bytes, as returned by Krita's pixelData())
+        from `size` (QSize) to `targetSize` (QSize) with given `filterName`
+
+        Given `colorDepth` is Krita color depth ('U8', 'U16', 'F16', 'F32'); alpha is
+        considered to be the last channel
+
+        If given, `isCurrent` is a callable regularly called during resize; if it
+        returns False, resize is stopped and None is returned
+
+        Return resized pixels as a QByteArray
+        """
+        if np is None:
+            raise EInvalidStatus("Resize is not available: numpy module can't be loaded")
+        elif not isinstance(size, QSize) or not isinstance(targetSize, QSize):
+            raise EInvalidType("Given `size` and `targetSize` must be <QSize>")
+        elif colorDepth not in JEResize.DEPTHS:
+            raise EInvalidValue("Given `colorDepth` is not supported")
+        elif filterName not in JEResize.FILTERS:
+            raise EInvalidValue("Given `filterName` is not valid")
+
+        if isinstance(pixels, QByteArray):
+            pixels = pixels.data()
+
+        dtype = JEResize.DEPTHS[colorDepth]
+        source = np.frombuffer(pixels, dtype=dtype)
+        nbChannels = source.size // (size.width() * size.height())
+        source = source.reshape(size.height(), size.width(), nbChannels)
+
+        returned = np.empty((targetSize.height(), targetSize.width(), nbChannels), dtype=dtype)
+
+        for y, rows in JEResize.resizeStrips(lambda top, bottom: source[top:bottom], size, nbChannels, dtype, targetSize, filterName):
+            returned[y:y + rows.shape[0]] = rows
+            if isCurrent is not None and not isCurrent():
+                return None
+
+        return QByteArray(returned.tobytes())
+
+    @staticmethod
+    def resizeImage(image, targetSize, filterName):
+        """Return given `image` (QImage) resized to `targetSize` (QSize), with given Krita `filterName`
+
+        If filter is not available (numpy not installed, or filter not implemented),
+        image is resized with Qt smooth transformation
+        """
+        if not JEResize.available() or filterName not in JEResize.FILTERS:
+            return image.scaled(targetSize, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+        image = image.convertToFormat(QImage.Format_ARGB32)
+        ptr = image.constBits()
+        ptr.setsize(image.sizeInBytes())
+        pixels = JEResize.resize(ptr.asstring(), image.size(), 'U8', targetSize, filterName)
+
+        # copy, as QImage doesn't take ownership of buffer
+        return QImage(pixels.data(), targetSize.width(), targetSize.height(), 4 * targetSize.width(), QImage.Format_ARGB32).copy()
+
+    def isCurrent(self, key):
+        """Return True if given `key` is the latest requested one"""
+        self.__mutex.lock()
+        returned = (key == self.__currentKey)
+        self.__mutex.unlock()
+        return returned
+
+    def isBusy(self):
+        """Return True if a job is running"""
+        return self.__threadpool.activeThreadCount() > 0
+
+    def setResult(self, key, pixels):
+        """Set resized `pixels` for given `key`
+
+        Called from resize jobs; result is moved to cache by get() or once job is finished
+        """
+        self.__mutex.lock()
+        self.__results[key] = pixels
+        self.__mutex.unlock()
+
+    def __onJobFinished(self, key):
+        """A job has been processed, move result to cache"""
+        if self.get(key) is not None:
+            self.resized.emit(key)
+
+    def get(self, key):
+        """Return resized pixels (QByteArray) for given `key`, or None if not available"""
+        self.__mutex.lock()
+        pixels = self.__results.pop(key, None)
+        self.__mutex.unlock()
+
+        if pixels is not None:
+            # note: if pixels size is greater than cache size, pixels are not kept in cache
+            self.__cache.set(key, pixels, pixels.size())
+            return pixels
+
+        return self.__cache.get(key)
+
+    def set(self, key, pixels):
+        """Set resized `pixels` (QByteArray) for given `key` in cache
+
+        Can be used to cache resized pixels provided by Krita
+        """
+        self.__cache.set(key, pixels, pixels.size())
+
+    def request(self, key, pixels, size, colorDepth, targetSize, filterName):
+        """Request resize of given `pixels` in background (see resize())
+
+        Given `key` identify request; once resized, `resized` signal is emitted with key
+        """
+        self.__mutex.lock()
+        self.__currentKey = key
+        self.__mutex.unlock()
+
+        job = JEResizeJob(self, key, pixels, size, colorDepth, targetSize, filterName)
+        job.signals.finished.connect(self.__onJobFinished)
+        job.setAutoDelete(True)
+        self.__threadpool.start(job)
+
+    def cancel(self):
+        """Cancel current request; running job (if any) is stopped as soon as possible"""
+        self.__mutex.lock()
+        self.__currentKey = None
+        self.__mutex.unlock()
+
+    def waitForDone(self):
+        """Wait until running job is finished"""
+        self.__threadpool.waitForDone()
+
+    def clear(self):
+        """Clear cache"""
+        self.__cache.clear()
+
+    def bytes(self):
+        """Return memory used by cache and by results not yet moved to cache, in bytes"""
+        self.__mutex.lock()
+        returned = sum(pixels.size() for pixels in self.__results.values())
+        self.__mutex.unlock()
+        return returned + self.__cache.bytes()
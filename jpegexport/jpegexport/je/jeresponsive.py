@@ -0,0 +1,156 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jeresponsive module provides class used to export a responsive set: the
+# same image exported for a list of widths (for example, for a HTML srcset)
+#
+# All sizes are produced from the exported image, already read from document:
+# - sizes are produced by a cascading downscale, each size being resized from
+#   the next larger one (and not from full resolution image)
+# - sizes are then encoded in parallel
+#
+# Files are written with JEEncoder.encodeFile() (see JEEncoder.encode() for
+# supported options)
+# -----------------------------------------------------------------------------
+
+import os.path
+import re
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import QSize
+
+from .jeencoder import JEEncoder
+from .jeresize import JEResize
+
+from jpegexport.pktk.modules.workers import WorkerPool
+from ..pktk import *
+
+
+class JEResponsive(object):
+    """Export an image as a set of JPEG files, for a list of widths"""
+
+    @staticmethod
+    def parseWidths(value):
+        """Return list of widths (descending order, without duplicates) from given
+        `value` string (widths separated by spaces, commas or semicolons)
+
+        Invalid values are ignored
+        """
+        if not isinstance(value, str):
+            raise EInvalidType("Given `value` must be a <str>")
+
+        return sorted({int(width) for width in re.split(r'[\s,;]+', value) if width.isdigit() and int(width) > 0}, reverse=True)
+
+    @staticmethod
+    def sizes(size, widths):
+        """Return list of sizes (QSize, descending order) for given image `size` and `widths`
+
+        Width/height ratio is kept; widths greater or equal than image width are
+        ignored (image is never upscaled, and full size is the exported image)
+        """
+        return [QSize(width, max(1, round(size.height() * width / size.width())))
+                for width in sorted(set(widths), reverse=True) if width < size.width()]
+
+    @staticmethod
+    def fileName(fileName, width):
+        """Return file name for given `width`, built from exported `fileName` with a size suffix"""
+        baseName, ext = os.path.splitext(fileName)
+        return f'{baseName}-{width}w{ext}'
+
+    @staticmethod
+    def cascade(image, sizes, filterName):
+        """Return list of images resized from `image` to given `sizes` (descending order),
+        with given Krita `filterName`
+
+        Each image is resized from the previous one
+        """
+        returned = []
+        for size in sizes:
+            image = JEResize.resizeImage(image, size, filterName)
+            returned.append(image)
+        return returned
+
+    @staticmethod
+    def __write(index, item):
+        """Encode and write given `item` (fileName, image, options); executed outside GUI thread
+
+        Return size of file, or None if file can't be written
+        """
+        fileName, image, options = item
+        return JEEncoder.encodeFile(image, options, fileName)
+
+    @staticmethod
+    def __items(image, widths, filterName, options, fileName):
+        """Return list of items (fileName, image, options) to write"""
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+
+        sizes = JEResponsive.sizes(image.size(), widths)
+        return [(JEResponsive.fileName(fileName, size.width()), resizedImage, options)
+                for size, resizedImage in zip(sizes, JEResponsive.cascade(image, sizes, filterName))]
+
+    @staticmethod
+    def __results(items, sizes):
+        """Return export results for given written `items` and file `sizes`"""
+        return [{'fileName': item[0],
+                 'width': item[1].width(),
+                 'height': item[1].height(),
+                 'size': size
+                 } for item, size in zip(items, sizes)]
+
+    @staticmethod
+    def exportInCurrentThread(image, widths, filterName, options, fileName):
+        """Export given `image` as JPEG files for given `widths`, files being encoded one
+        after the other in current thread
+
+        Same as export(), but can be used outside GUI thread
+        """
+        items = JEResponsive.__items(image, widths, filterName, options, fileName)
+        return JEResponsive.__results(items, [JEResponsive.__write(index, item) for index, item in enumerate(items)])
+
+    @staticmethod
+    def export(image, widths, filterName, options, fileName, maxWorkers=None):
+        """Export given `image` as JPEG files for given `widths`
+
+        Given `filterName` is Krita filter used to resize image
+        Given `options` is a dictionary, as returned by WExportOptionsJpeg.options();
+        only 'quality', 'progressive', 'optimize' and 'transparencyFillcolor' are taken
+        in account
+        Given `fileName` is exported file name of full size image; file names are built
+        with fileName()
+        Given `maxWorkers` is maximum number of files encoded in parallel (all available
+        threads if None)
+
+        Return a list of dictionary (descending width order):
+            'fileName':     exported file name
+            'width':        exported image width
+            'height':       exported image height
+            'size':         exported file size, in bytes (None if file can't be exported)
+        """
+        items = JEResponsive.__items(image, widths, filterName, options, fileName)
+        if len(items) == 0:
+            return []
+
+        pool = WorkerPool(maxWorkers)
+        return JEResponsive.__results(items, pool.map(items, JEResponsive.__write))
@@ -47,6 +47,14 @@ class JESettingsValues(object):
     RENDER_MODE_DIFFVALUE =                                 'diff-value'
     RENDER_MODE_DIFFBITS =                                  'diff-bits'
     RENDER_MODE_SOURCE =                                    'source'
+    RENDER_MODE_ERRORMAP =                                  'error-map'
+    RENDER_MODE_BLOCKMAP =                                  'block-map'
+
+    PREVIEW_MODE_FILE =                                     'file'
+    PREVIEW_MODE_MEMORY =                                   'memory'
+
+    METRIC_SSIM =                                           'ssim'
+    METRIC_PSNR =                                           'psnr'
 
     # 0=4:2:0 (smallest file size)   1=4:2:2    2=4:4:0     3=4:4:4 (Best quality)
     JPEG_SUBSAMPLING_420 =                                  0
@@ -103,6 +111,13 @@ class JESettingsKey(SettingsKey):
     CONFIG_SETUPMANAGER_COLORPICKER_CSLIDER_HSV_ASPCT =     'config.setupManager.colorPicker.colorSlider.hsv.asPct'
 
     CONFIG_RENDER_MODE =                                    'config.render.mode'
+    CONFIG_PREVIEW_MODE =                                   'config.preview.mode'
+    CONFIG_PREVIEW_VIEWPORT =                               'config.preview.viewport'
+    CONFIG_PREVIEW_ERRORSTATS =                             'config.preview.errorStats'
+    CONFIG_PREVIEW_PROXY_THRESHOLD =                        'config.preview.proxy.threshold'
+    CONFIG_EXPORT_STRIPS =                                  'config.export.strips'
+    CONFIG_EXPORT_QUEUE =                                   'config.export.queue'
+    CONFIG_MEMORY_BUDGET =                                  'config.memory.budget'
 
     CONFIG_JPEG_QUALITY =                                   'config.options.jpeg.quality'
     CONFIG_JPEG_SMOOTHING =                                 'config.options.jpeg.smoothing'
@@ -119,6 +134,15 @@ class JESettingsKey(SettingsKey):
     CONFIG_MISC_RESIZE_PX_WIDTH =                           'config.options.resize.px.width'
     CONFIG_MISC_RESIZE_PX_HEIGHT =                          'config.options.resize.px.height'
     CONFIG_MISC_RESIZE_FILTER =                             'config.options.resize.filter'
+    CONFIG_MISC_RESPONSIVE_ACTIVE =                         'config.options.responsive.active'
+    CONFIG_MISC_RESPONSIVE_WIDTHS =                         'config.options.responsive.widths'
+
+    CONFIG_TARGET_SIZE_ACTIVE =                             'config.options.target.size.active'
+    CONFIG_TARGET_SIZE_VALUE =                              'config.options.target.size.value'
+    CONFIG_TARGET_SIZE_SUBSAMPLING =                        'config.options.target.size.subsampling'
+    CONFIG_TARGET_METRIC_ACTIVE =                           'config.options.target.metric.active'
+    CONFIG_TARGET_METRIC_NAME =                             'config.options.target.metric.name'
+    CONFIG_TARGET_METRIC_VALUE =                            'config.options.target.metric.value'
 
     CONFIG_PATH_TGTMODE =                                   'config.options.path.tgtMode'
     CONFIG_PATH_USRPATH =                                   'config.options.path.userPath'
@@ -188,13 +212,32 @@ class JESettings(Settings):
             SettingsRule(JESettingsKey.CONFIG_JPEG_SAVEPROFILE,                             False,                              SettingsFmt(bool)),
             SettingsRule(JESettingsKey.CONFIG_JPEG_TRANSPFILLCOLOR,                         '#ffffff',                          SettingsFmt(str)),
 
+            SettingsRule(JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE,                           False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_TARGET_SIZE_VALUE,                            500,                                SettingsFmt(int, (1, 1048576))),
+            SettingsRule(JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING,                      False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE,                         False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_TARGET_METRIC_NAME,                           JESettingsValues.METRIC_SSIM,       SettingsFmt(str, [JESettingsValues.METRIC_SSIM,
+                                                                                                                                                  JESettingsValues.METRIC_PSNR])),
+            SettingsRule(JESettingsKey.CONFIG_TARGET_METRIC_VALUE,                          0.98,                               SettingsFmt(float, (0.0, 100.0))),
+
             SettingsRule(JESettingsKey.CONFIG_PATH_TGTMODE,                                 'src',                              SettingsFmt(str, ['src', 'usr'])),
             SettingsRule(JESettingsKey.CONFIG_PATH_USRPATH,                                 '',                                 SettingsFmt(str)),
 
             SettingsRule(JESettingsKey.CONFIG_RENDER_MODE,                                  JESettingsValues.RENDER_MODE_FINAL, SettingsFmt(str, [JESettingsValues.RENDER_MODE_FINAL,
                                                                                                                                                   JESettingsValues.RENDER_MODE_DIFFVALUE,
                                                                                                                                                   JESettingsValues.RENDER_MODE_DIFFBITS,
-                                                                                                                                                  JESettingsValues.RENDER_MODE_SOURCE])),
+                                                                                                                                                  JESettingsValues.RENDER_MODE_SOURCE,
+                                                                                                                                                  JESettingsValues.RENDER_MODE_ERRORMAP,
+                                                                                                                                                  JESettingsValues.RENDER_MODE_BLOCKMAP])),
+            SettingsRule(JESettingsKey.CONFIG_PREVIEW_MODE,                                 JESettingsValues.PREVIEW_MODE_FILE,
+                                                                                                                                SettingsFmt(str, [JESettingsValues.PREVIEW_MODE_FILE,
+                                                                                                                                                  JESettingsValues.PREVIEW_MODE_MEMORY])),
+            SettingsRule(JESettingsKey.CONFIG_PREVIEW_VIEWPORT,                             False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_PREVIEW_ERRORSTATS,                           False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_PREVIEW_PROXY_THRESHOLD,                      50,                                 SettingsFmt(int, (0, 10000))),
+            SettingsRule(JESettingsKey.CONFIG_EXPORT_STRIPS,                                False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_EXPORT_QUEUE,                                 False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_MEMORY_BUDGET,                                0,                                  SettingsFmt(int, (0, 65536))),
 
             SettingsRule(JESettingsKey.CONFIG_MISC_CROP_ACTIVE,                             False,                              SettingsFmt(bool)),
             SettingsRule(JESettingsKey.CONFIG_MISC_RESIZE_ACTIVE,                           False,                              SettingsFmt(bool)),
@@ -213,6 +256,8 @@ class JESettings(Settings):
                                                                                                                                                   JESettingsValues.FILTER_LANCZOS3,
                                                                                                                                                   JESettingsValues.FILTER_MITCHELL,
                                                                                                                                                   JESettingsValues.FILTER_NEAREST_NEIGHBOUR])),
+            SettingsRule(JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE,                       False,                              SettingsFmt(bool)),
+            SettingsRule(JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS,                       '320 640 1280 2560',                SettingsFmt(str)),
         ]
         super(JESettings, self).__init__(pluginId, rules)
 
@@ -0,0 +1,332 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jesizecurve module provides class used to calculate, in background, the
+# JPEG file size for each quality level
+#
+# Calculated curves are kept in a cache, and are available immediately when
+# the same content is encoded again with the same options; digest of content,
+# used as cache key, is calculated in background too
+#
+# Sizes are calculated with in memory (Qt) encoder: they're exact only for
+# options supported by this encoder (4:2:0 chroma subsampling, no smoothing, no
+# ICC profile)
+# -----------------------------------------------------------------------------
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        pyqtSignal as Signal,
+        QRunnable,
+        QThreadPool
+    )
+from PyQt5.QtGui import QImage
+
+from .jeencoder import JEEncoder
+from .jecache import JECache
+
+from ..pktk import *
+
+
+class JESizeCurveJobSignals(QObject):
+    digested = Signal(int, str)             # generation, curve key
+    processed = Signal(int, int, object)    # generation, quality, encoded size (None if not encoded)
+    finished = Signal(int)                  # job id
+
+
+class JESizeCurveDigestJob(QRunnable):
+    """Calculate curve key of an image, in a thread from pool
+
+    Not aimed to be instancied directly, just use JESizeCurve
+    """
+
+    def __init__(self, curve, jobId, generation, image, options):
+        super(JESizeCurveDigestJob, self).__init__()
+        self.__curve = curve
+        self.__jobId = jobId
+        self.__generation = generation
+        self.__image = image
+        self.__options = dict(options)
+        self.signals = JESizeCurveJobSignals()
+
+    @pyqtSlot()
+    def run(self):
+        """Calculate digest of image pixels, if calculation is not cancelled"""
+        if self.__curve.isCurrent(self.__generation):
+            self.signals.digested.emit(self.__generation, JESizeCurve.key(JECache.digest(self.__image), self.__options))
+
+        self.__image = None
+        self.signals.finished.emit(self.__jobId)
+
+
+class JESizeCurveJob(QRunnable):
+    """Encode an image as JPEG for qualities provided by curve, in a thread from pool
+
+    Not aimed to be instancied directly, just use JESizeCurve
+    """
+
+    def __init__(self, curve, jobId, generation, image, options):
+        super(JESizeCurveJob, self).__init__()
+        self.__curve = curve
+        self.__jobId = jobId
+        self.__generation = generation
+        self.__image = image
+        self.__options = dict(options)
+        self.signals = JESizeCurveJobSignals()
+
+    @pyqtSlot()
+    def run(self):
+        """Encode image for next quality to calculate, until there's no more quality to
+        calculate or calculation is cancelled"""
+        while True:
+            quality = self.__curve.nextQuality(self.__generation)
+            if quality is None:
+                break
+
+            self.__options['quality'] = quality
+            data = JEEncoder.encode(self.__image, self.__options)
+            self.signals.processed.emit(self.__generation, quality, None if data is None else data.size())
+
+        self.__image = None
+        self.signals.finished.emit(self.__jobId)
+
+
+class JESizeCurve(QObject):
+    """Calculate quality→size curve for an image
+
+    Sizes are calculated with in memory encoder, in background; qualities are
+    processed from coarse to fine steps, so curve can be interpolated before all
+    qualities are calculated
+
+    Cancelling a calculation doesn't wait for running encodes: results from
+    cancelled calculations are dropped
+    """
+    updated = Signal(str)               # curve key; a size has been calculated for current curve
+    finished = Signal(str)              # curve key; all sizes have been calculated for current curve
+
+    QUALITY_MIN = 0
+    QUALITY_MAX = 100
+
+    # an entry in cache is a dict {quality: size}, size in memory is negligible
+    __CACHE_ITEM_SIZE = 8 * (QUALITY_MAX - QUALITY_MIN + 1)
+
+    def __init__(self, cache=None, parent=None):
+        super(JESizeCurve, self).__init__(parent)
+        if cache is None:
+            cache = JECache(64 * JESizeCurve.__CACHE_ITEM_SIZE)
+        elif not isinstance(cache, JECache):
+            raise EInvalidType("Given `cache` must be a <JECache>")
+
+        self.__cache = cache
+        self.__key = None
+        # current calculation request: image (identified by its cache key) and options
+        self.__request = None
+        self.__image = None
+        self.__options = None
+        self.__sizes = {}
+        self.__processed = 0
+
+        self.__threadpool = QThreadPool()
+        self.__mutex = QMutex()
+        self.__generation = 0
+        # qualities not yet provided to jobs, for current generation
+        self.__qualities = []
+        # keep a reference to jobs until they're finished (signals object must not be garbage collected)
+        self.__jobs = {}
+        self.__jobId = 0
+
+    @staticmethod
+    def qualities():
+        """Return list of qualities to calculate, from coarse to fine steps"""
+        returned = []
+        for step in (10, 5, 1):
+            returned += [quality for quality in range(JESizeCurve.QUALITY_MIN, JESizeCurve.QUALITY_MAX + 1, step) if quality not in returned]
+        return returned
+
+    @staticmethod
+    def key(imageDigest, options):
+        """Return a curve key for given image digest and JPEG `options`
+
+        Only options used by in memory encoder are taken in account (quality excluded)
+        """
+        return JECache.digest(imageDigest,
+                              options.get('progressive', True),
+                              options.get('optimize', True),
+                              QColor(options.get('transparencyFillcolor', Qt.white)))
+
+    def __startJob(self, job):
+        """Start given `job` in pool"""
+        job.signals.finished.connect(self.__onJobFinished)
+        job.setAutoDelete(True)
+        self.__jobs[self.__jobId] = job
+        self.__threadpool.start(job)
+
+    def __onDigested(self, generation, key):
+        """Curve key has been calculated for image: use curve from cache if available,
+        otherwise start encoding"""
+        if not self.isCurrent(generation):
+            # result from a cancelled calculation
+            return
+
+        image = self.__image
+        options = self.__options
+        self.__image = None
+        self.__options = None
+        self.__key = key
+
+        sizes = self.__cache.get(key)
+        if sizes is not None:
+            self.__sizes = dict(sizes)
+            self.updated.emit(key)
+            self.finished.emit(key)
+            return
+
+        self.__mutex.lock()
+        self.__qualities = JESizeCurve.qualities()
+        self.__mutex.unlock()
+
+        for index in range(self.__threadpool.maxThreadCount()):
+            self.__jobId += 1
+            job = JESizeCurveJob(self, self.__jobId, generation, image, options)
+            job.signals.processed.connect(self.__onProcessed)
+            self.__startJob(job)
+
+    def __onJobFinished(self, jobId):
+        """A job has no more quality to encode"""
+        self.__jobs.pop(jobId, None)
+
+    def __onProcessed(self, generation, quality, size):
+        """A quality has been encoded"""
+        if not self.isCurrent(generation):
+            # result from a cancelled calculation
+            return
+
+        self.__processed += 1
+        if size is not None:
+            self.__sizes[quality] = size
+            self.updated.emit(self.__key)
+
+        if self.__processed == len(JESizeCurve.qualities()) and self.isComplete():
+            # all qualities have been encoded
+            self.__cache.set(self.__key, dict(self.__sizes), JESizeCurve.__CACHE_ITEM_SIZE)
+            self.finished.emit(self.__key)
+
+    def nextQuality(self, generation):
+        """Return next quality to encode for given `generation`, or None if there's no more
+        quality to encode or if `generation` is not the current calculation
+
+        Called from jobs threads
+        """
+        self.__mutex.lock()
+        if generation == self.__generation and len(self.__qualities) > 0:
+            returned = self.__qualities.pop(0)
+        else:
+            returned = None
+        self.__mutex.unlock()
+        return returned
+
+    def isCurrent(self, generation):
+        """Return True if given `generation` is the current calculation"""
+        self.__mutex.lock()
+        returned = (generation == self.__generation)
+        self.__mutex.unlock()
+        return returned
+
+    def currentKey(self):
+        """Return key of current curve (None while image digest is calculated)"""
+        return self.__key
+
+    def compute(self, image, options):
+        """Start calculation of curve for given `image` with given JPEG `options`
+
+        Curve key (see key() method) is calculated in background; if curve already exists
+        in cache, no encoding is made
+        If a calculation is already in progress or done for the same image (not modified since)
+        and options, nothing is done
+        """
+        if not isinstance(image, QImage):
+            raise EInvalidType("Given `image` must be a <QImage>")
+        elif not isinstance(options, dict):
+            raise EInvalidType("Given `options` must be a <dict>")
+
+        # QImage cache key is modified when image is modified
+        request = (image.cacheKey(), JESizeCurve.key('', options))
+        if request == self.__request:
+            return
+
+        self.cancel()
+        self.__request = request
+        self.__image = image
+        self.__options = dict(options)
+
+        self.__mutex.lock()
+        generation = self.__generation
+        self.__mutex.unlock()
+
+        self.__jobId += 1
+        job = JESizeCurveDigestJob(self, self.__jobId, generation, image, options)
+        job.signals.digested.connect(self.__onDigested)
+        self.__startJob(job)
+
+    def cancel(self):
+        """Stop current calculation
+
+        Running encodes are not waited for: their results will be ignored, and jobs
+        stop before next encode
+        """
+        self.__mutex.lock()
+        self.__generation += 1
+        self.__qualities = []
+        self.__mutex.unlock()
+        self.__key = None
+        self.__request = None
+        self.__image = None
+        self.__options = None
+        self.__sizes = {}
+        self.__processed = 0
+
+    def isComplete(self):
+        """Return True if all qualities have been calculated for current curve"""
+        return len(self.__sizes) == len(JESizeCurve.qualities())
+
+    def sizes(self):
+        """Return calculated sizes for current curve, as a dictionary {quality: size}"""
+        return dict(self.__sizes)
+
+    def size(self, quality):
+        """Return a tuple (size, exact) for given `quality`
+
+        If size for quality is not yet calculated, it's interpolated from nearest
+        calculated qualities and `exact` is False
+        If size can't be interpolated, return (None, False)
+        """
+        if quality in self.__sizes:
+            return (self.__sizes[quality], True)
+
+        lower = [q for q in self.__sizes if q < quality]
+        upper = [q for q in self.__sizes if q > quality]
+        if len(lower) == 0 or len(upper) == 0:
+            return (None, False)
+
+        qLow = max(lower)
+        qHigh = min(upper)
+        ratio = (quality - qLow) / (qHigh - qLow)
+        return (round(self.__sizes[qLow] + ratio * (self.__sizes[qHigh] - self.__sizes[qLow])), False)
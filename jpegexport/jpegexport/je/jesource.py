@@ -0,0 +1,123 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jesource module provides class used to read pixels from source document
+#
+# Pixels read from document are kept in a cache, and are returned immediately
+# when the same area is read again while document hasn't been modified
+# -----------------------------------------------------------------------------
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import QRect
+
+from .jecache import JECache
+
+from ..pktk import *
+
+
+class JESource(object):
+    """Read pixels from a source Krita document, through a cache
+
+    Krita doesn't provide any revision number for documents, nor any signal when
+    document content is modified; a sampled digest of content (like a thumbnail)
+    can't detect small modifications on large documents.
+
+    Owner of source is then responsible to call invalidate() each time document
+    content may have been modified (for example, when user can work on document);
+    revision token is calculated from document properties and from a counter
+    incremented on each invalidation
+    """
+
+    # default maximum size of cache
+    CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+    def __init__(self, document, maxBytes=None):
+        """Initialise source for given Krita `document`
+
+        If `maxBytes` is None, use CACHE_MAX_BYTES
+        """
+        if maxBytes is None:
+            maxBytes = JESource.CACHE_MAX_BYTES
+
+        self.__document = document
+        self.__cache = JECache(maxBytes)
+        self.__revision = None
+        self.__invalidations = 0
+
+    def document(self):
+        """Return source document"""
+        return self.__document
+
+    def cache(self):
+        """Return cache used for pixels"""
+        return self.__cache
+
+    def revision(self):
+        """Return a revision token for document
+
+        Token is modified as soon as document size or color space is modified, or
+        when source is invalidated (see invalidate())
+        """
+        return JECache.digest(self.__invalidations,
+                              self.__document.width(),
+                              self.__document.height(),
+                              self.__document.colorModel(),
+                              self.__document.colorDepth(),
+                              self.__document.colorProfile())
+
+    def invalidate(self):
+        """Document content may have been modified: cached pixels are not valid anymore,
+        and revision token is modified"""
+        self.__invalidations += 1
+        self.__cache.clear()
+
+    def pixelData(self, bounds, revision=None):
+        """Return document pixels (as a QByteArray) for given `bounds` (a QRect)
+
+        If `revision` is None, current document revision token is calculated; when
+        source is read for many bounds, calculating revision once and provide it can
+        save time
+
+        Pixels are read from cache if available for given bounds and revision
+        """
+        if not isinstance(bounds, QRect):
+            raise EInvalidType("Given `bounds` must be a <QRect>")
+
+        if revision is None:
+            revision = self.revision()
+
+        if revision != self.__revision:
+            # document has been modified, cached pixels are not valid anymore
+            self.__cache.clear()
+            self.__revision = revision
+
+        key = (bounds.x(), bounds.y(), bounds.width(), bounds.height(), revision)
+        returned = self.__cache.get(key)
+        if returned is None:
+            returned = self.__document.pixelData(bounds.x(), bounds.y(), bounds.width(), bounds.height())
+            self.__cache.set(key, returned, returned.size())
+
+        return returned
+
+    def clear(self):
+        """Clear cache"""
+        self.__cache.clear()
@@ -0,0 +1,151 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jestripexport module provides a low memory export for very large images
+#
+# Source document projection is read, resized and flattened by horizontal
+# strips, directly into a RGB 8bits image that is then encoded to JPEG file by
+# Qt JPEG writer (libjpeg, that encodes scanline by scanline)
+#
+# Peak memory is then the final RGB image (3 bytes per pixel) plus a few
+# strips, instead of full copies of source document pixels, resized document
+# and JPEG content
+#
+# As Qt JPEG writer is used, options that are only provided by Krita's JPEG
+# exporter (chroma subsampling, smoothing, ICC profile) are not available
+# -----------------------------------------------------------------------------
+
+import os.path
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import (
+        QRect,
+        QSize
+    )
+from PyQt5.QtGui import (
+        QColor,
+        QImage,
+        QImageWriter,
+        QPainter
+    )
+
+from .jeresize import JEResize
+from .jeanalysis import JEAnalysis
+
+from ..pktk import *
+
+
+class JEStripExporter(object):
+    """Export a Krita document as JPEG, processing document by strips"""
+
+    # number of source rows read at once, when there's no resize
+    STRIP_HEIGHT = 256
+
+    @staticmethod
+    def available(bounds, targetSize, filterName):
+        """Return True if export by strips is available for given source `bounds`,
+        `targetSize` and resize `filterName`
+
+        Resize (if any) need numpy
+        """
+        return bounds.size() == targetSize or (JEResize.available() and filterName in JEResize.FILTERS)
+
+    @staticmethod
+    def sourceStrip(document, bounds, top, bottom):
+        """Return document projection for given `bounds`, from row `top` (included) to
+        row `bottom` (excluded), as an ARGB32 QImage
+        """
+        return document.projection(bounds.x(), bounds.y() + top, bounds.width(), bottom - top).convertToFormat(QImage.Format_ARGB32)
+
+    @staticmethod
+    def export(document, bounds, targetSize, filterName, options, fileName, progress=None):
+        """Export given Krita `document` to JPEG `fileName`
+
+        Given `bounds` (QRect) define exported area from document, resized to
+        `targetSize` (QSize) with `filterName` if needed
+
+        Given `options` is a dictionary, as returned by WExportOptionsJpeg.options();
+        only 'quality', 'progressive', 'optimize' and 'transparencyFillcolor' are taken
+        in account
+
+        If provided, `progress` is a callable progress(value) called after each strip,
+        with value from 0.0 to 1.0
+
+        Return size of exported file, or None if file can't be exported
+        """
+        if not isinstance(bounds, QRect):
+            raise EInvalidType("Given `bounds` must be a <QRect>")
+        elif not isinstance(targetSize, QSize):
+            raise EInvalidType("Given `targetSize` must be a <QSize>")
+        elif not JEStripExporter.available(bounds, targetSize, filterName):
+            raise EInvalidStatus("Export by strips is not available for given resize")
+
+        fillColor = QColor(options.get('transparencyFillcolor', None) or QColor(Qt.white))
+
+        # the only full size buffer
+        image = QImage(targetSize, QImage.Format_RGB888)
+        if image.isNull():
+            # not enough memory
+            return None
+
+        if bounds.size() == targetSize:
+            # no resize: strips are flattened with painter
+            painter = QPainter(image)
+            for top in range(0, bounds.height(), JEStripExporter.STRIP_HEIGHT):
+                bottom = min(bounds.height(), top + JEStripExporter.STRIP_HEIGHT)
+                painter.fillRect(0, top, bounds.width(), bottom - top, fillColor)
+                painter.drawImage(0, top, JEStripExporter.sourceStrip(document, bounds, top, bottom))
+                if progress:
+                    progress(bottom / bounds.height())
+            painter.end()
+        else:
+            ptr = image.bits()
+            ptr.setsize(image.sizeInBytes())
+            pixels = np.frombuffer(ptr, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())[:, :3 * image.width()].reshape(image.height(), image.width(), 3)
+            fill = np.array([fillColor.red(), fillColor.green(), fillColor.blue()], dtype=np.float32)
+
+            def readRows(top, bottom):
+                # array is a view on strip image pixels: copy it, as strip image is freed once method is left
+                strip = JEStripExporter.sourceStrip(document, bounds, top, bottom)
+                return np.array(JEAnalysis.toArray(strip))
+
+            for y, rows in JEResize.resizeStrips(readRows, bounds.size(), 4, np.uint8, targetSize, filterName):
+                # BGRA -> RGB, composed over fill color
+                alpha = rows[..., 3:].astype(np.float32) / 255
+                rgb = rows[..., 2::-1].astype(np.float32) * alpha + fill * (1 - alpha)
+                pixels[y:y + rows.shape[0]] = np.clip(np.round(rgb), 0, 255).astype(np.uint8)
+                if progress:
+                    progress((y + rows.shape[0]) / targetSize.height())
+
+        writer = QImageWriter(fileName, b'jpeg')
+        writer.setQuality(options.get('quality', 85))
+        writer.setOptimizedWrite(options.get('optimize', True))
+        writer.setProgressiveScanWrite(options.get('progressive', True))
+        if not writer.write(image):
+            return None
+
+        return os.path.getsize(fileName)
@@ -0,0 +1,160 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The jewatch module provides automatic re-export of documents when they are
+# saved
+#
+# A watched document is exported again with its last used setup each time it's
+# saved (Krita's notifier imageSaved signal)
+#
+# Export is skipped when exported content is unchanged: a digest of exported
+# region pixels (document projection), setup and target file name is kept for
+# each watched document, then saving a document for which only metadata or
+# hidden layers have been modified doesn't produce any encoding
+#
+# Watched documents are stored in a JSON file in Krita's configuration
+# directory
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import os.path
+
+from krita import Krita
+
+from PyQt5.Qt import *
+from PyQt5.QtCore import QStandardPaths
+
+from .jecache import JECache
+from .jeexporter import JEExporter
+
+from jpegexport.pktk.pktk import PkTk
+from ..pktk import *
+
+
+class JEWatch(QObject):
+    """Re-export watched documents when they're saved"""
+
+    __INSTANCE = None
+
+    @staticmethod
+    def instance():
+        """Return watch instance"""
+        if JEWatch.__INSTANCE is None:
+            JEWatch.__INSTANCE = JEWatch()
+        return JEWatch.__INSTANCE
+
+    @staticmethod
+    def watchFileName():
+        """Return file name in which watched documents are stored"""
+        return os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericConfigLocation), f'krita-plugin-{PkTk.packageName()}-watch.json')
+
+    @staticmethod
+    def digest(document, setupData, fileName):
+        """Return digest of exported content for given `document`, `setupData` and target `fileName`"""
+        bounds = JEExporter.bounds(document, setupData)
+        return JECache.digest(document.projection(bounds.x(), bounds.y(), bounds.width(), bounds.height()),
+                              setupData,
+                              fileName)
+
+    def __init__(self, parent=None):
+        super(JEWatch, self).__init__(parent)
+        # key: document file name
+        # value: dictionary {'setup': setup data, 'fileName': exported file name, 'digest': exported content digest}
+        self.__watched = {}
+        self.__load()
+
+    def __load(self):
+        """Load watched documents"""
+        if not os.path.isfile(JEWatch.watchFileName()):
+            return
+
+        try:
+            with open(JEWatch.watchFileName(), 'r') as fHandle:
+                self.__watched = json.loads(fHandle.read())
+        except Exception as e:
+            print("Unable to read watched documents", e)
+            self.__watched = {}
+
+    def __save(self):
+        """Save watched documents"""
+        try:
+            with open(JEWatch.watchFileName(), 'w') as fHandle:
+                fHandle.write(json.dumps(self.__watched, indent=1))
+        except Exception as e:
+            print("Unable to save watched documents", e)
+
+    def isWatched(self, document):
+        """Return True if given `document` is watched"""
+        return document.fileName() != '' and document.fileName() in self.__watched
+
+    def watch(self, document, setupData, fileName):
+        """Watch given `document`: document will be re-exported to `fileName` with given `setupData`
+        each time it's saved
+
+        Given `setupData` is a dictionary, as stored by setup manager (see JEExporter.setupsFromFile())
+        Current exported content is considered as already exported
+        """
+        if not isinstance(setupData, dict):
+            raise EInvalidType("Given `setupData` must be a <dict>")
+        elif document.fileName() == '':
+            raise EInvalidStatus("Given `document` must be saved to be watched")
+
+        # setup data must be serializable as JSON
+        setupData = {key: (value.name() if isinstance(value, QColor) else value) for key, value in setupData.items()}
+
+        self.__watched[document.fileName()] = {'setup': setupData,
+                                               'fileName': fileName,
+                                               'digest': JEWatch.digest(document, setupData, fileName)
+                                               }
+        self.__save()
+
+    def unwatch(self, document):
+        """Stop to watch given `document`"""
+        if document.fileName() in self.__watched:
+            self.__watched.pop(document.fileName())
+            self.__save()
+
+    def documentSaved(self, fileName):
+        """A document has been saved to `fileName`: re-export it if watched and exported
+        content has been modified"""
+        if fileName not in self.__watched:
+            return
+
+        for document in Krita.instance().documents():
+            if document.fileName() == fileName:
+                break
+        else:
+            return
+
+        watched = self.__watched[fileName]
+        digest = JEWatch.digest(document, watched['setup'], watched['fileName'])
+        if digest == watched['digest']:
+            # nothing to export
+            return
+
+        if JEExporter.exportDocument(document, watched['setup'], watched['fileName']) is None:
+            print(f"Unable to export file to {watched['fileName']}")
+            return
+
+        watched['digest'] = digest
+        self.__save()
@@ -92,6 +92,8 @@ class WJEContentOptions(QWidget):
         self.sbResizedMaxWidth.valueChanged.connect(lambda x: self.sizeUpdate.emit(False))
         self.sbResizedMaxHeight.valueChanged.connect(lambda x: self.sizeUpdate.emit(False))
         self.dsbResizePct.valueChanged.connect(lambda x: self.sizeUpdate.emit(False))
+        self.cbResponsiveSet.toggled.connect(lambda value: self.wResponsiveOptions.setEnabled(value))
+        self.wResponsiveOptions.setEnabled(False)
 
     def showEvent(self, event):
         """Dialog is visible"""
@@ -118,6 +120,10 @@ class WJEContentOptions(QWidget):
             return self.sbResizedMaxHeight.value()
         elif key == JESettingsKey.CONFIG_MISC_RESIZE_UNIT:
             return self.cbxResizedUnit.currentData()
+        elif key == JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE:
+            return self.cbResponsiveSet.isChecked()
+        elif key == JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS:
+            return self.leResponsiveWidths.text()
 
     def setProperty(self, key, value):
         """Set property defined by `key`
@@ -129,6 +135,8 @@ class WJEContentOptions(QWidget):
             JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE
             JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH
             JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT
+            JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE
+            JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS
         """
         if key == JESettingsKey.CONFIG_MISC_CROP_ACTIVE:
             # crop
@@ -150,6 +158,11 @@ class WJEContentOptions(QWidget):
             self.sbResizedMaxHeight.setValue(value)
         elif key == JESettingsKey.CONFIG_MISC_RESIZE_UNIT:
             self.cbxResizedUnit.setCurrentIndex(self.__cbxIndexForUnit(value))
+        elif key == JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE:
+            self.cbResponsiveSet.setChecked(value)
+            self.wResponsiveOptions.setEnabled(value)
+        elif key == JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS:
+            self.leResponsiveWidths.setText(value)
 
     def setProperties(self, properties):
         """Set properties from a dictionary"""
@@ -162,7 +175,9 @@ class WJEContentOptions(QWidget):
                             JESettingsKey.CONFIG_MISC_RESIZE_PCT_VALUE,
                             JESettingsKey.CONFIG_MISC_RESIZE_PX_WIDTH,
                             JESettingsKey.CONFIG_MISC_RESIZE_PX_HEIGHT,
-                            JESettingsKey.CONFIG_MISC_RESIZE_UNIT):
+                            JESettingsKey.CONFIG_MISC_RESIZE_UNIT,
+                            JESettingsKey.CONFIG_MISC_RESPONSIVE_ACTIVE,
+                            JESettingsKey.CONFIG_MISC_RESPONSIVE_WIDTHS):
             if propertyKey in properties:
                 self.setProperty(propertyKey, properties[propertyKey])
 
@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+import math
+
+from PyQt5.Qt import *
+from PyQt5.QtWidgets import (
+        QWidget
+    )
+
+from ..pktk import *
+
+
+# -----------------------------------------------------------------------------
+class WJEErrorHistogram(QWidget):
+    """A basic QWidget used to display error histograms (one curve per channel)
+
+    Number of pixels is displayed with a logarithmic scale, as most of pixels have
+    a low error value
+    """
+
+    __MARGIN = 4
+    __CHANNELS = (('r', Qt.red), ('g', Qt.green), ('b', Qt.blue))
+
+    def __init__(self, parent=None):
+        super(WJEErrorHistogram, self).__init__(parent)
+        self.__histograms = None
+        self.__maxError = 255
+
+        self.setMinimumHeight(60)
+        self.setMouseTracking(True)
+
+    def __plotRect(self):
+        """Return rect in which histograms are drawn"""
+        return QRectF(self.rect()).adjusted(WJEErrorHistogram.__MARGIN, WJEErrorHistogram.__MARGIN, -WJEErrorHistogram.__MARGIN, -WJEErrorHistogram.__MARGIN)
+
+    def paintEvent(self, event):
+        """Draw histograms"""
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), self.palette().color(QPalette.Base))
+
+        if self.__histograms is None:
+            return
+
+        rect = self.__plotRect()
+        maxValue = max(max(self.__histograms[channel]) for channel, color in WJEErrorHistogram.__CHANNELS)
+        if maxValue == 0:
+            return
+        maxValue = math.log10(1 + maxValue)
+        # always display at least errors from 0 to 8
+        maxError = max(8, self.__maxError)
+
+        for channel, color in WJEErrorHistogram.__CHANNELS:
+            path = QPainterPath()
+            for error in range(maxError + 1):
+                position = QPointF(rect.left() + rect.width() * error / maxError,
+                                   rect.bottom() - rect.height() * math.log10(1 + self.__histograms[channel][error]) / maxValue)
+                if error == 0:
+                    path.moveTo(position)
+                else:
+                    path.lineTo(position)
+
+            painter.setPen(QPen(QColor(color), 1))
+            painter.drawPath(path)
+
+    def mouseMoveEvent(self, event):
+        """Display number of pixels for error under cursor"""
+        if self.__histograms is None:
+            return
+
+        rect = self.__plotRect()
+        error = max(0, min(self.__maxError, round(max(8, self.__maxError) * (event.pos().x() - rect.left()) / rect.width())))
+        self.setToolTip(i18n(f"Error {error}: ") +
+                        ', '.join([f"{channel.upper()} {self.__histograms[channel][error]}" for channel, color in WJEErrorHistogram.__CHANNELS]))
+
+    def setHistograms(self, histograms, maxError=255):
+        """Set histograms to display
+
+        Given `histograms` is a dictionary {'r': [], 'g': [], 'b': []}, or None to clear display
+        Given `maxError` define the highest error value to display
+        """
+        self.__histograms = histograms
+        self.__maxError = max(0, min(255, maxError))
+        self.update()
@@ -0,0 +1,115 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------
+# The wjequeuedocker module provides the docker used to follow background
+# exports status (see jequeue module)
+# -----------------------------------------------------------------------------
+
+import os.path
+
+from krita import DockWidget
+
+from PyQt5.Qt import *
+from PyQt5.QtWidgets import (
+        QHBoxLayout,
+        QPushButton,
+        QTreeWidget,
+        QTreeWidgetItem,
+        QVBoxLayout,
+        QWidget
+    )
+
+from .jequeue import JEExportQueue
+
+from jpegexport.pktk.modules.strutils import bytesSizeToStr
+from jpegexport.pktk import *
+
+
+class WJEQueueDocker(DockWidget):
+    """Docker listing background exports"""
+
+    def __init__(self):
+        super(WJEQueueDocker, self).__init__()
+        self.setWindowTitle(i18n('JPEG Export Queue'))
+
+        self.__twItems = QTreeWidget()
+        self.__twItems.setColumnCount(2)
+        self.__twItems.setHeaderLabels([i18n('File'), i18n('Status')])
+        self.__twItems.setRootIsDecorated(False)
+        self.__twItems.setAlternatingRowColors(True)
+        self.__twItems.setSelectionMode(QAbstractItemView.NoSelection)
+
+        self.__pbRetry = QPushButton(i18n('Retry'))
+        self.__pbRetry.setToolTip(i18n('Restart exports in error'))
+        self.__pbRetry.clicked.connect(lambda: JEExportQueue.instance().retry())
+        self.__pbClear = QPushButton(i18n('Clear finished'))
+        self.__pbClear.setToolTip(i18n('Remove finished exports and exports in error from list'))
+        self.__pbClear.clicked.connect(lambda: JEExportQueue.instance().clearFinished())
+
+        buttonsLayout = QHBoxLayout()
+        buttonsLayout.setContentsMargins(0, 0, 0, 0)
+        buttonsLayout.addStretch()
+        buttonsLayout.addWidget(self.__pbRetry)
+        buttonsLayout.addWidget(self.__pbClear)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.__twItems)
+        layout.addLayout(buttonsLayout)
+
+        widget = QWidget(self)
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        JEExportQueue.instance().updated.connect(self.__updateItems)
+        self.__updateItems()
+
+    def __updateItems(self):
+        """Update list of exports"""
+        self.__twItems.clear()
+
+        hasError = False
+        hasFinished = False
+        for item in JEExportQueue.instance().items():
+            if item['status'] == JEExportQueue.STATUS_QUEUED:
+                status = i18n('Waiting')
+            elif item['status'] == JEExportQueue.STATUS_PROCESSING:
+                status = i18n('Exporting...')
+            elif item['status'] == JEExportQueue.STATUS_DONE:
+                status = f"{i18n('Exported')} - {bytesSizeToStr(item['size'])}"
+                hasFinished = True
+            else:
+                status = i18n('Unable to export')
+                hasError = True
+
+            treeItem = QTreeWidgetItem([os.path.basename(item['fileName']), status])
+            treeItem.setToolTip(0, f"{item['fileName']}<br>{item['width']}x{item['height']}")
+            if item['status'] == JEExportQueue.STATUS_ERROR:
+                treeItem.setForeground(1, QBrush(QColor('#ff0000')))
+            self.__twItems.addTopLevelItem(treeItem)
+
+        self.__pbRetry.setEnabled(hasError)
+        self.__pbClear.setEnabled(hasError or hasFinished)
+
+    def canvasChanged(self, canvas):
+        """Notifies when views are added or removed; docker doesn't depend on active view"""
+        pass
@@ -0,0 +1,139 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+from PyQt5.Qt import *
+from PyQt5.QtWidgets import (
+        QWidget
+    )
+from PyQt5.QtCore import (
+        pyqtSignal as Signal
+    )
+
+from jpegexport.pktk.modules.strutils import bytesSizeToStr
+
+from ..pktk import *
+
+
+# -----------------------------------------------------------------------------
+class WJESizeCurve(QWidget):
+    """A basic QWidget used to plot file size according to JPEG quality"""
+    qualityClicked = Signal(int)
+
+    __MARGIN = 4
+
+    def __init__(self, parent=None):
+        super(WJESizeCurve, self).__init__(parent)
+        self.__sizes = {}
+        self.__quality = None
+        self.__targetSize = None
+        self.__approximate = False
+
+        self.setMinimumHeight(80)
+        self.setMouseTracking(True)
+
+    def __plotRect(self):
+        """Return rect in which curve is drawn"""
+        return QRectF(self.rect()).adjusted(WJESizeCurve.__MARGIN, WJESizeCurve.__MARGIN, -WJESizeCurve.__MARGIN, -WJESizeCurve.__MARGIN)
+
+    def __maxSize(self):
+        """Return maximum size on vertical axis"""
+        returned = max(self.__sizes.values(), default=0)
+        if self.__targetSize is not None:
+            returned = max(returned, self.__targetSize)
+        return max(1, returned)
+
+    def __point(self, rect, quality, size):
+        """Return position in widget for given quality/size"""
+        return QPointF(rect.left() + rect.width() * quality / 100,
+                       rect.bottom() - rect.height() * size / self.__maxSize())
+
+    def __positionQuality(self, position):
+        """Return quality for given position in widget"""
+        rect = self.__plotRect()
+        return max(0, min(100, round(100 * (position.x() - rect.left()) / rect.width())))
+
+    def paintEvent(self, event):
+        """Draw curve"""
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        rect = self.__plotRect()
+        palette = self.palette()
+
+        painter.fillRect(self.rect(), palette.color(QPalette.Base))
+
+        if self.__targetSize is not None:
+            painter.setPen(QPen(QColor(Qt.red), 1, Qt.DashLine))
+            position = self.__point(rect, 0, self.__targetSize)
+            painter.drawLine(QPointF(rect.left(), position.y()), QPointF(rect.right(), position.y()))
+
+        if len(self.__sizes) > 1:
+            path = QPainterPath()
+            for index, quality in enumerate(sorted(self.__sizes.keys())):
+                if index == 0:
+                    path.moveTo(self.__point(rect, quality, self.__sizes[quality]))
+                else:
+                    path.lineTo(self.__point(rect, quality, self.__sizes[quality]))
+
+            painter.setPen(QPen(palette.color(QPalette.Highlight), 1.5))
+            painter.drawPath(path)
+
+        if self.__quality is not None:
+            painter.setPen(QPen(palette.color(QPalette.Text), 1, Qt.DotLine))
+            position = self.__point(rect, self.__quality, 0)
+            painter.drawLine(QPointF(position.x(), rect.top()), QPointF(position.x(), rect.bottom()))
+
+    def mouseMoveEvent(self, event):
+        """Display size for quality under cursor"""
+        quality = self.__positionQuality(event.pos())
+        if quality in self.__sizes and self.__approximate:
+            self.setToolTip(i18n(f'Quality {quality}: ~{bytesSizeToStr(self.__sizes[quality])} (approximate, fast preview encoder)'))
+        elif quality in self.__sizes:
+            self.setToolTip(i18n(f'Quality {quality}: {bytesSizeToStr(self.__sizes[quality])}'))
+        else:
+            self.setToolTip(i18n(f'Quality {quality}'))
+
+    def mouseReleaseEvent(self, event):
+        """Emit clicked quality"""
+        if event.button() == Qt.LeftButton:
+            self.qualityClicked.emit(self.__positionQuality(event.pos()))
+
+    def setSizes(self, sizes):
+        """Set sizes to plot, as a dictionary {quality: size}"""
+        if not isinstance(sizes, dict):
+            raise EInvalidType("Given `sizes` must be a <dict>")
+        self.__sizes = sizes
+        self.update()
+
+    def setQuality(self, quality):
+        """Set current quality (None to hide it)"""
+        self.__quality = quality
+        self.update()
+
+    def setApproximate(self, approximate):
+        """Set if plotted sizes are approximate (calculated with options that differ from
+        options used for final export)"""
+        self.__approximate = approximate
+
+    def setTargetSize(self, targetSize):
+        """Set target size (None to hide it)"""
+        self.__targetSize = targetSize
+        self.update()
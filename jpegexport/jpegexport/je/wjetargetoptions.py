@@ -0,0 +1,233 @@
+# -----------------------------------------------------------------------------
+# JPEG Export
+# Copyright (C) 2024 - Grum999
+# -----------------------------------------------------------------------------
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.
+# If not, see https://www.gnu.org/licenses/
+# -----------------------------------------------------------------------------
+# A Krita plugin designed to export as JPEG with a preview of final result
+# -----------------------------------------------------------------------------
+
+from jpegexport.pktk.modules.utils import loadXmlUi
+import os
+import os.path
+import sys
+
+from PyQt5.Qt import *
+from PyQt5.QtWidgets import (
+        QWidget
+    )
+from PyQt5.QtCore import (
+        pyqtSignal as Signal
+    )
+
+from .jesettings import (
+        JESettingsKey,
+        JESettingsValues
+    )
+from .jeanalysis import JEAnalysis
+
+from ..pktk import *
+
+
+# -----------------------------------------------------------------------------
+class WJETargetOptions(QWidget):
+    """A basic QWidget used to manage target file size and target image quality options"""
+    targetUpdated = Signal()
+    searchRequested = Signal()
+    searchMetricRequested = Signal()
+
+    # metric: (label, minimum, maximum, decimals, step, default)
+    METRICS = {
+            JESettingsValues.METRIC_SSIM: ('SSIM', 0.0, 1.0, 4, 0.001, 0.98),
+            JESettingsValues.METRIC_PSNR: ('PSNR (dB)', 0.0, 100.0, 2, 0.5, 40.0)
+        }
+
+    def __init__(self, parent=None):
+        super(WJETargetOptions, self).__init__(parent)
+
+        uiFileName = os.path.join(os.path.dirname(__file__), 'resources', 'wjetargetoptions.ui')
+
+        # temporary add <plugin> path to sys.path to let 'pktk.widgets.xxx' being accessible during xmlLoad()
+        # because of WColorButton path that must be absolut in UI file
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+        loadXmlUi(uiFileName, self)
+
+        # remove temporary added path
+        sys.path.pop()
+
+        self.__initialiseUi()
+
+    def __initialiseUi(self):
+        """Initialise widget interface"""
+        for metric in WJETargetOptions.METRICS:
+            self.cbxTargetMetric.addItem(WJETargetOptions.METRICS[metric][0], metric)
+
+        self.cbTargetSizeActive.toggled.connect(self.__targetActiveUpdated)
+        self.sbTargetSize.valueChanged.connect(self.__targetUpdated)
+        self.cbTargetSizeSubsampling.toggled.connect(self.__targetUpdated)
+        self.pbTargetSizeSearch.clicked.connect(self.searchRequested.emit)
+        self.cbTargetMetricActive.toggled.connect(self.__targetMetricActiveUpdated)
+        self.cbxTargetMetric.currentIndexChanged.connect(self.__targetMetricUpdated)
+        self.dsbTargetMetric.valueChanged.connect(self.__targetUpdated)
+        self.pbTargetMetricSearch.clicked.connect(self.searchMetricRequested.emit)
+
+        if not JEAnalysis.available():
+            self.cbTargetMetricActive.setChecked(False)
+            self.cbTargetMetricActive.setEnabled(False)
+            self.cbTargetMetricActive.setToolTip(i18n('Python <i>numpy</i> module is required to measure image quality'))
+
+        self.__targetMetricUpdated()
+        self.__targetActiveUpdated(None)
+        self.__targetMetricActiveUpdated(None)
+
+    def __targetActiveUpdated(self, value):
+        """Target mode activated/deactivated
+
+        Update UI, emit signal
+        """
+        active = self.cbTargetSizeActive.isChecked()
+        if active:
+            # target size and target image quality can't be used together
+            self.cbTargetMetricActive.setChecked(False)
+        self.lblTargetSize.setEnabled(active)
+        self.sbTargetSize.setEnabled(active)
+        self.pbTargetSizeSearch.setEnabled(active)
+        self.cbTargetSizeSubsampling.setEnabled(active)
+        self.lblTargetSizeResult.setVisible(active)
+        self.targetUpdated.emit()
+
+    def __targetMetricActiveUpdated(self, value):
+        """Target image quality mode activated/deactivated
+
+        Update UI, emit signal
+        """
+        active = self.cbTargetMetricActive.isChecked()
+        if active:
+            # target size and target image quality can't be used together
+            self.cbTargetSizeActive.setChecked(False)
+        self.cbxTargetMetric.setEnabled(active)
+        self.dsbTargetMetric.setEnabled(active)
+        self.pbTargetMetricSearch.setEnabled(active)
+        self.lblTargetMetricResult.setVisible(active)
+        self.targetUpdated.emit()
+
+    def __targetMetricUpdated(self, value=None):
+        """Target metric updated
+
+        Update threshold range, emit signal
+        """
+        label, minimum, maximum, decimals, step, default = WJETargetOptions.METRICS[self.cbxTargetMetric.currentData()]
+        self.dsbTargetMetric.setDecimals(decimals)
+        self.dsbTargetMetric.setSingleStep(step)
+        self.dsbTargetMetric.setRange(minimum, maximum)
+        if value is not None:
+            # metric changed from user interface: threshold from previous metric is not relevant
+            self.dsbTargetMetric.setValue(default)
+        self.targetUpdated.emit()
+
+    def __targetUpdated(self, value=None):
+        """Target options updated
+
+        Emit signal
+        """
+        self.targetUpdated.emit()
+
+    def isActive(self):
+        """Return True if target file size mode is active"""
+        return self.cbTargetSizeActive.isChecked()
+
+    def isMetricActive(self):
+        """Return True if target image quality mode is active"""
+        return self.cbTargetMetricActive.isChecked()
+
+    def metric(self):
+        """Return target metric (JESettingsValues.METRIC_SSIM or JESettingsValues.METRIC_PSNR)"""
+        return self.cbxTargetMetric.currentData()
+
+    def metricThreshold(self):
+        """Return target metric threshold"""
+        return self.dsbTargetMetric.value()
+
+    def targetSize(self):
+        """Return target size, in bytes"""
+        return self.sbTargetSize.value() * 1024
+
+    def setResult(self, text):
+        """Set text for last search result"""
+        self.lblTargetSizeResult.setText(text)
+
+    def setMetricResult(self, text):
+        """Set text for last target image quality search result"""
+        self.lblTargetMetricResult.setText(text)
+
+    def property(self, key):
+        """Return property value for `key`"""
+        if key == JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE:
+            return self.cbTargetSizeActive.isChecked()
+        elif key == JESettingsKey.CONFIG_TARGET_SIZE_VALUE:
+            return self.sbTargetSize.value()
+        elif key == JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING:
+            return self.cbTargetSizeSubsampling.isChecked()
+        elif key == JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE:
+            return self.cbTargetMetricActive.isChecked()
+        elif key == JESettingsKey.CONFIG_TARGET_METRIC_NAME:
+            return self.cbxTargetMetric.currentData()
+        elif key == JESettingsKey.CONFIG_TARGET_METRIC_VALUE:
+            return self.dsbTargetMetric.value()
+
+    def setProperty(self, key, value):
+        """Set property defined by `key`
+
+        Available keys:
+            JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE
+            JESettingsKey.CONFIG_TARGET_SIZE_VALUE
+            JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING
+            JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE
+            JESettingsKey.CONFIG_TARGET_METRIC_NAME
+            JESettingsKey.CONFIG_TARGET_METRIC_VALUE
+        """
+        if key == JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE:
+            self.cbTargetSizeActive.setChecked(value)
+        elif key == JESettingsKey.CONFIG_TARGET_SIZE_VALUE:
+            self.sbTargetSize.setValue(value)
+        elif key == JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING:
+            self.cbTargetSizeSubsampling.setChecked(value)
+        elif key == JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE:
+            self.cbTargetMetricActive.setChecked(value and JEAnalysis.available())
+        elif key == JESettingsKey.CONFIG_TARGET_METRIC_NAME:
+            index = self.cbxTargetMetric.findData(value)
+            if index > -1:
+                self.cbxTargetMetric.blockSignals(True)
+                self.cbxTargetMetric.setCurrentIndex(index)
+                self.cbxTargetMetric.blockSignals(False)
+                self.__targetMetricUpdated()
+        elif key == JESettingsKey.CONFIG_TARGET_METRIC_VALUE:
+            self.dsbTargetMetric.setValue(value)
+
+    def setProperties(self, properties):
+        """Set properties from a dictionary"""
+        if not isinstance(properties, dict):
+            raise EInvalidType("Given `properties` must be a <dict>")
+
+        # metric name must be set before metric value (define value range)
+        for propertyKey in (JESettingsKey.CONFIG_TARGET_SIZE_ACTIVE,
+                            JESettingsKey.CONFIG_TARGET_SIZE_VALUE,
+                            JESettingsKey.CONFIG_TARGET_SIZE_SUBSAMPLING,
+                            JESettingsKey.CONFIG_TARGET_METRIC_ACTIVE,
+                            JESettingsKey.CONFIG_TARGET_METRIC_NAME,
+                            JESettingsKey.CONFIG_TARGET_METRIC_VALUE):
+            if propertyKey in properties:
+                self.setProperty(propertyKey, properties[propertyKey])
@@ -27,6 +27,8 @@ import time
 import PyQt5.uic
 
 from krita import (
+        DockWidgetFactory,
+        DockWidgetFactoryBase,
         Extension,
         Krita
     )
@@ -50,6 +52,10 @@ if __name__ != '__main__':
     from jpegexport.pktk.modules.utils import checkKritaVersion
     from jpegexport.pktk.modules.uitheme import UITheme
     from jpegexport.je.jemainwindow import JEMainWindow
+    from jpegexport.je.jebatchwindow import JEBatchWindow
+    from jpegexport.je.jequeue import JEExportQueue
+    from jpegexport.je.jewatch import JEWatch
+    from jpegexport.je.wjequeuedocker import WJEQueueDocker
 else:
     # Execution from 'Scripter' plugin?
     __PLUGIN_EXEC_FROM__ = 'SCRIPTER_PLUGIN'
@@ -73,6 +79,10 @@ else:
     from jpegexport.pktk.modules.utils import checkKritaVersion
     from jpegexport.pktk.modules.uitheme import UITheme
     from jpegexport.je.jemainwindow import JEMainWindow
+    from jpegexport.je.jebatchwindow import JEBatchWindow
+    from jpegexport.je.jequeue import JEExportQueue
+    from jpegexport.je.jewatch import JEWatch
+    from jpegexport.je.wjequeuedocker import WJEQueueDocker
 
     print("======================================")
 
@@ -99,6 +109,7 @@ class JpegExport(Extension):
         self.__isKritaVersionOk = checkKritaVersion(*REQUIRED_KRITA_VERSION)
         self.__dlgParentWidget = QWidget()
         self.__action = None
+        self.__actionBatch = None
         self.__notifier = Krita.instance().notifier()
 
 
@@ -106,6 +117,7 @@ class JpegExport(Extension):
         """Main window has been created"""
         def aboutToShowFileMenu():
             self.__action.setEnabled(len(Krita.instance().activeWindow().views()) > 0)
+            self.__actionBatch.setEnabled(len(Krita.instance().documents()) > 0)
 
         menuFile = None
         actionRef = None
@@ -138,14 +150,18 @@ class JpegExport(Extension):
                 # move action to right place
                 menuFile.removeAction(self.__action)
                 menuFile.insertAction(actionRef, self.__action)
+                menuFile.removeAction(self.__actionBatch)
+                menuFile.insertAction(actionRef, self.__actionBatch)
             else:
                 qError('Unable to find <file_export_advanced> neither <file_export_file>!')
 
             # update icon
             self.__action.setIcon(QIcon(actionRef.icon()))
+            self.__actionBatch.setIcon(QIcon(actionRef.icon()))
 
             # by default, set menu disabled
             self.__action.setEnabled(False)
+            self.__actionBatch.setEnabled(False)
 
             menuFile.aboutToShow.connect(aboutToShowFileMenu)
 
@@ -159,14 +175,25 @@ class JpegExport(Extension):
 
             self.__notifier.setActive(True)
             self.__notifier.windowCreated.connect(self.__windowCreated)
+            # re-export watched documents when saved
+            self.__notifier.imageSaved.connect(JEWatch.instance().documentSaved)
+
+            # background exports status
+            Krita.instance().addDockWidgetFactory(DockWidgetFactory(f'{EXTENSION_ID}_queue', DockWidgetFactoryBase.DockRight, WJEQueueDocker))
+
+            # resume background exports not finished when Krita has been closed
+            JEExportQueue.instance().resume()
 
 
     def createActions(self, window):
         if checkKritaVersion(5, 0, 0):
             self.__action = window.createAction(EXTENSION_ID, f'{PLUGIN_MENU_ENTRY}...', "file")
+            self.__actionBatch = window.createAction(f'{EXTENSION_ID}_batch', f'{PLUGIN_MENU_ENTRY} (Batch)...', "file")
         else:
             self.__action = window.createAction(EXTENSION_ID, f'{PLUGIN_MENU_ENTRY}...', "tools/scripts")
+            self.__actionBatch = window.createAction(f'{EXTENSION_ID}_batch', f'{PLUGIN_MENU_ENTRY} (Batch)...', "tools/scripts")
         self.__action.triggered.connect(self.start)
+        self.__actionBatch.triggered.connect(self.startBatch)
 
     def start(self):
         """Execute JPEG Export"""
@@ -181,6 +208,17 @@ class JpegExport(Extension):
 
         JEMainWindow(PLUGIN_MENU_ENTRY, PLUGIN_VERSION, self.__dlgParentWidget)
 
+    def startBatch(self):
+        """Execute JPEG Export for a list of documents"""
+        if not self.__isKritaVersionOk:
+            QMessageBox.information(QWidget(),
+                                    PLUGIN_MENU_ENTRY,
+                                    "At least, Krita version {0} is required to use plugin...".format('.'.join([str(v) for v in REQUIRED_KRITA_VERSION]))
+                                    )
+            return
+
+        JEBatchWindow(PLUGIN_MENU_ENTRY, PLUGIN_VERSION, self.__dlgParentWidget)
+
 if __PLUGIN_EXEC_FROM__ == 'SCRIPTER_PLUGIN':
     sys.stdout = sys.__stdout__
 